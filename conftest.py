@@ -1,13 +1,13 @@
 import pytest
 import logging
 import os
-import shutil
 import time
-import re
 import platform
 import copy
 import inspect
+import json
 
+from collections import OrderedDict
 from itertools import zip_longest
 
 from dtest import running_in_docker, cleanup_docker_environment_before_test_execution
@@ -18,12 +18,18 @@ from netifaces import AF_INET
 from psutil import virtual_memory
 
 import netifaces as ni
-import ccmlib.repository
-from ccmlib.common import validate_install_dir, is_win, get_version_from_build
+from ccmlib.common import validate_install_dir
 
 from dtest_config import DTestConfig
 from dtest_setup import DTestSetup
 from dtest_setup_overrides import DTestSetupOverrides
+from tools.admission import RESOURCE_INTENSIVE_NODES, admit, estimate_footprint, node_memory_mb
+from tools.cluster_pool import ClusterPool
+from tools.log_archive import LogArchiver, copy_logs as copy_cluster_logs
+from tools.log_scanner import matches_any_pattern
+from tools.loopback import LoopbackLease
+from tools.sharding import DurationHistory, DurationRecorder, plan_shards
+from tools.versions import resolve_version, version_from_build
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +71,13 @@ def pytest_addoption(parser):
                           "pull the required artifacts for this version.")
     parser.addoption("--delete-logs", action="store_true", default=False,
                      help="Delete all generated logs created by a test after the completion of a test.")
+    parser.addoption("--log-archive-mode", action="store", default="copy", choices=["copy", "compressed"],
+                     help="How to save the logs of a test's nodes. 'copy' copies every log file. 'compressed' "
+                          "writes a compressed archive per test in the background, with the complete logs of "
+                          "failed tests but only the end of each log and the errors found in it for passing tests")
+    parser.addoption("--log-archive-tail-kb", action="store", default=1024, type=int,
+                     help="How many KB of the end of each log to keep for passing tests with "
+                          "--log-archive-mode=compressed")
     parser.addoption("--execute-upgrade-tests", action="store_true", default=False,
                      help="Execute Cassandra Upgrade Tests (e.g. tests annotated with the upgrade_test mark)")
     parser.addoption("--disable-active-log-watching", action="store_true", default=False,
@@ -78,12 +91,65 @@ def pytest_addoption(parser):
                      help="Enable JaCoCo Code Coverage Support")
     parser.addoption("--upgrade-version-selection", action="store", default="indev",
                      help="Specify whether to run indev, releases, or both")
-
-
-def sufficient_system_resources_for_resource_intensive_tests():
+    parser.addoption("--phase-timings-file", action="store", default=None,
+                     help="Write the time each test spent in each phase of its setup, execution and teardown "
+                          "to this file as JSON. The timings are also attached to the JUnit XML test cases")
+    parser.addoption("--test-durations-file", action="store", default=None,
+                     help="JSON file with the durations of earlier runs of the tests. The tests are ordered so the "
+                          "longest (resource_intensive first) start first, and shards are balanced by duration. The "
+                          "file is only read, so every shard plans from the same durations")
+    parser.addoption("--test-durations-output", action="store", default=None,
+                     help="Write the durations of the tests of this run to this JSON file. Merge the files of all "
+                          "shards into the --test-durations-file once they are done, with "
+                          "python -m tools.sharding TEST_DURATIONS_FILE OUTPUT [OUTPUT ...]")
+    parser.addoption("--shard-count", action="store", default=1, type=int,
+                     help="Split the selected tests into this many shards of similar total duration")
+    parser.addoption("--shard-index", action="store", default=0, type=int,
+                     help="Which of the --shard-count shards to run, starting at 0")
+    parser.addoption("--admission-control", action="store_true", default=False,
+                     help="Estimate the memory and CPUs each test's cluster needs from its markers and CCM_MAX_HEAP_SIZE, "
+                          "and only start a test when the host can hold it next to the tests other dtest processes "
+                          "(e.g. pytest-xdist workers) are running, queueing it otherwise. Linux only")
+    parser.addoption("--reuse-clusters", action="store_true", default=False,
+                     help="Keep the running cluster of a passing test marked with reusable_cluster and hand it "
+                          "to the next test asking for an identically configured cluster instead of removing it")
+    parser.addoption("--reuse-driver-sessions", action="store_true", default=False,
+                     help="Within a test, keep the driver sessions helpers are done with (see "
+                          "DTestSetup.reusable_cql_connection) and hand them to the next helper asking for a connection "
+                          "with the same parameters to the same (not restarted) node, instead of connecting a new "
+                          "driver cluster. Sessions are shut down at the end of the test as usual")
+    parser.addoption("--lease-loopback-addresses", action="store_true", default=False,
+                     help="Lease a block of loopback addresses and JMX ports that no other dtest process on this "
+                          "host uses, so several pytest processes (e.g. pytest-xdist workers) can run clusters "
+                          "concurrently. Linux only")
+    parser.addoption("--node-template-dir", action="store", default=None,
+                     help="Directory to cache node templates in. Clusters of tests marked with reusable_cluster "
+                          "start from a copy of the nodes' data as it was right after the first boot of an "
+                          "identically configured cluster, instead of creating the system keyspaces from scratch")
+    parser.addoption("--appcds-cache-dir", action="store", default=None,
+                     help="Directory to cache class data sharing archives in. With JDK 11 or later, nodes start "
+                          "with an archive of the JDK classes Cassandra loads, dumped once per Cassandra build and "
+                          "JDK from what the nodes of the first cluster of that build loaded")
+    parser.addoption("--profile-nodes", action="store_true", default=False,
+                     help="Run a flight recording on every node and save it with the logs of each test, along "
+                          "with a summary of the hottest methods, allocation sites and contended locks (the "
+                          "summary needs the jfr tool of JDK 11 or later)")
+    parser.addoption("--resource-sample-interval", action="store", default=None, type=float,
+                     help="Sample the CPU time, memory, disk I/O, open files and threads of every node at this "
+                          "interval in seconds, and save the samples and a summary of them with the logs of each test")
+    parser.addoption("--jolokia-at-startup", action="store_true", default=False,
+                     help="Load the Jolokia agent into every node as a -javaagent when it starts, instead of "
+                          "attaching it with a separate JVM whenever a test uses JMX through Jolokia. Tester.fast_nodetool "
+                          "only saves nodetool JVM launches with this option, without it every call runs nodetool")
+
+
+def sufficient_system_resources_for_resource_intensive_tests(admission_control=False):
     mem = virtual_memory()
     total_mem_gb = mem.total/1024/1024/1024
     logger.info("total available system memory is %dGB" % total_mem_gb)
+    if admission_control:
+        # the same estimate the admission controller reserves for a resource_intensive test
+        return mem.total / 1024 / 1024 >= RESOURCE_INTENSIVE_NODES * node_memory_mb()
     # todo kjkj: do not hard code our bound.. for now just do 9 instances at 3gb a piece
     return total_mem_gb >= 9*3
 
@@ -191,17 +257,14 @@ def fixture_log_test_name_and_date(request, fixture_logging_setup):
 def _filter_errors(dtest_setup, errors):
     """Filter errors, removing those that match ignore_log_patterns in the current DTestSetup"""
     for e in errors:
-        for pattern in dtest_setup.ignore_log_patterns:
-            if re.search(pattern, repr(e)):
-                break
-        else:
+        if not matches_any_pattern(dtest_setup.ignore_log_patterns, repr(e)):
             yield e
 
 
 def check_logs_for_errors(dtest_setup):
     errors = []
     for node in dtest_setup.cluster.nodelist():
-        errors = list(_filter_errors(dtest_setup, ['\n'.join(msg) for msg in node.grep_log_for_errors()]))
+        errors = list(_filter_errors(dtest_setup, ['\n'.join(msg) for msg in dtest_setup.log_scanner.errors(node)]))
         if len(errors) is not 0:
             for error in errors:
                 if isinstance(error, (bytes, bytearray)):
@@ -217,45 +280,39 @@ def check_logs_for_errors(dtest_setup):
     return errors
 
 
+def check_log_watch_errors(dtest_setup):
+    """
+    @return The exceptions raised by the error callback of the active log watch, except for the pytest.fail() of
+            DTestSetup._log_error_handler, as check_logs_for_errors reports the errors behind those
+    """
+    if dtest_setup.log_watch_thread is None:
+        return []
+    return [e for e in dtest_setup.log_watch_thread.callback_errors if not isinstance(e, pytest.fail.Exception)]
+
+
+LOG_SAVED_DIR = "logs"
+
+
 def copy_logs(request, cluster, directory=None, name=None):
     """Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'"""
-    log_saved_dir = "logs"
-    try:
-        os.mkdir(log_saved_dir)
-    except OSError:
-        pass
-
     if directory is None:
-        directory = log_saved_dir
+        directory = LOG_SAVED_DIR
     if name is None:
-        name = os.path.join(log_saved_dir, "last")
+        name = os.path.join(LOG_SAVED_DIR, "last")
     else:
         name = os.path.join(directory, name)
-    if not os.path.exists(directory):
-        os.mkdir(directory)
-    logs = [(node.name, node.logfilename(), node.debuglogfilename(), node.gclogfilename(), node.compactionlogfilename())
-            for node in list(cluster.nodes.values())]
-    if len(logs) is not 0:
-        basedir = str(int(time.time() * 1000)) + '_' + request.node.name
-        logdir = os.path.join(directory, basedir)
-        os.mkdir(logdir)
-        for n, log, debuglog, gclog, compactionlog in logs:
-            if os.path.exists(log):
-                assert os.path.getsize(log) >= 0
-                shutil.copyfile(log, os.path.join(logdir, n + ".log"))
-            if os.path.exists(debuglog):
-                assert os.path.getsize(debuglog) >= 0
-                shutil.copyfile(debuglog, os.path.join(logdir, n + "_debug.log"))
-            if os.path.exists(gclog):
-                assert os.path.getsize(gclog) >= 0
-                shutil.copyfile(gclog, os.path.join(logdir, n + "_gc.log"))
-            if os.path.exists(compactionlog):
-                assert os.path.getsize(compactionlog) >= 0
-                shutil.copyfile(compactionlog, os.path.join(logdir, n + "_compaction.log"))
-        if os.path.exists(name):
-            os.unlink(name)
-        if not is_win():
-            os.symlink(basedir, name)
+    basedir = str(int(time.time() * 1000)) + '_' + request.node.name
+    copy_cluster_logs(cluster, directory, basedir, name)
+
+
+def archive_logs(request, dtest_setup, log_archiver, full):
+    """
+    Hand the current cluster's log files to log_archiver, keeping the complete logs only if full is set
+    """
+    basedir = str(int(time.time() * 1000)) + '_' + request.node.name
+    errors = OrderedDict((node.name, dtest_setup.log_scanner.errors(node)) for node in dtest_setup.cluster.nodelist())
+    log_archiver.archive(dtest_setup.cluster, LOG_SAVED_DIR, basedir, os.path.join(LOG_SAVED_DIR, "last"),
+                         full=full, errors=errors)
 
 
 def reset_environment_vars(initial_environment):
@@ -272,13 +329,135 @@ def fixture_dtest_create_cluster_func():
     """
     return DTestSetup.create_ccm_cluster
 
+
+@pytest.hookimpl(tryfirst=True, hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """
+    Stores the report of each test phase on the item (as rep_setup, rep_call and rep_teardown)
+    so fixtures can find out during teardown whether the test itself failed
+    """
+    outcome = yield
+    rep = outcome.get_result()
+    setattr(item, "rep_" + rep.when, rep)
+
+
+def _test_failed(request):
+    rep_call = getattr(request.node, 'rep_call', None)
+    return rep_call is not None and rep_call.failed
+
+
+@pytest.fixture(scope='session')
+def fixture_cluster_pool(dtest_config):
+    """
+    Session wide pool of running clusters handed between tests marked with reusable_cluster
+    """
+    keeps_cluster_dir = dtest_config.keep_test_dir or dtest_config.enable_jacoco_code_coverage
+    cluster_pool = ClusterPool(enabled=dtest_config.reuse_clusters and not keeps_cluster_dir)
+    yield cluster_pool
+    cluster_pool.clear()
+
+
+@pytest.fixture(scope='session')
+def fixture_loopback_lease(dtest_config):
+    """
+    The block of loopback addresses and JMX ports this pytest process runs its clusters on,
+    or None when every cluster uses the default 127.0.0.x addresses
+    """
+    if not dtest_config.lease_loopback_addresses:
+        yield None
+        return
+
+    lease = LoopbackLease.acquire()
+    try:
+        yield lease
+    finally:
+        lease.release()
+
+
+@pytest.fixture(scope='session')
+def fixture_log_archiver(dtest_config):
+    """
+    Session wide archiver writing compressed log archives in the background, or None when logs are copied
+    """
+    if dtest_config.log_archive_mode != 'compressed':
+        yield None
+        return
+
+    log_archiver = LogArchiver(tail_bytes=dtest_config.log_archive_tail_kb * 1024)
+    try:
+        yield log_archiver
+    finally:
+        log_archiver.wait()
+
+
+@pytest.fixture(scope='session')
+def fixture_phase_timings_report(dtest_config):
+    """
+    Session wide dict of test node id to the phase timings of the test, written to
+    --phase-timings-file as JSON at the end of the session. None when no file was asked for.
+    """
+    if dtest_config.phase_timings_file is None:
+        yield None
+        return
+
+    report = OrderedDict()
+    try:
+        yield report
+    finally:
+        write_phase_timings_report(dtest_config.phase_timings_file, report)
+
+
+def record_phase_timings(request, dtest_setup, phase_timings_report):
+    """
+    Attaches the phase timings of the test to its JUnit XML testcase and to the session report
+    """
+    for phase, seconds in dtest_setup.phase_timings.items():
+        request.node.user_properties.append(('{}_seconds'.format(phase), '{:.3f}'.format(seconds)))
+    if phase_timings_report is not None:
+        phase_timings_report[request.node.nodeid] = OrderedDict(
+            (phase, round(seconds, 3)) for phase, seconds in dtest_setup.phase_timings.items())
+
+
+def write_phase_timings_report(path, report):
+    # each pytest-xdist worker writes a report of its own
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if worker is not None:
+        path = '{}.{}'.format(path, worker)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'tests': report}, f, indent=2)
+    os.rename(path + '.tmp', path)
+
+
+@pytest.fixture(scope='function')
+def fixture_admission(request, dtest_config):
+    """
+    With --admission-control, waits until the host has room for the test's cluster next to the
+    clusters of the tests other processes are running, and holds that room until the test is done
+    """
+    if not dtest_config.admission_control:
+        yield None
+        return
+
+    reservation = admit(estimate_footprint(request.node))
+    try:
+        yield reservation
+    finally:
+        reservation.release()
+
+
 @pytest.fixture(scope='function', autouse=False)
 def fixture_dtest_setup(request,
                         dtest_config,
                         fixture_dtest_setup_overrides,
                         fixture_logging_setup,
                         fixture_dtest_cluster_name,
-                        fixture_dtest_create_cluster_func):
+                        fixture_dtest_create_cluster_func,
+                        fixture_cluster_pool,
+                        fixture_loopback_lease,
+                        fixture_log_archiver,
+                        fixture_phase_timings_report,
+                        fixture_admission):
+    setup_start = time.time()
     if running_in_docker():
         cleanup_docker_environment_before_test_execution()
 
@@ -287,11 +466,23 @@ def fixture_dtest_setup(request,
     initial_environment = copy.deepcopy(os.environ)
     dtest_setup = DTestSetup(dtest_config=dtest_config,
                              setup_overrides=fixture_dtest_setup_overrides,
-                             cluster_name=fixture_dtest_cluster_name)
+                             cluster_name=fixture_dtest_cluster_name,
+                             cluster_pool=fixture_cluster_pool,
+                             loopback_lease=fixture_loopback_lease)
     dtest_setup.initialize_cluster(fixture_dtest_create_cluster_func)
 
+    reusable_cluster = request.node.get_closest_marker('reusable_cluster')
+    if reusable_cluster is not None:
+        dtest_setup.start_reusable_cluster(reusable_cluster.kwargs.get('nodes', 1))
+    else:
+        # pooled clusters hold the loopback addresses this test's cluster is going to use
+        fixture_cluster_pool.clear()
+
     if not dtest_config.disable_active_log_watching:
         dtest_setup.begin_active_log_watch()
+    dtest_setup.start_resource_sampler()
+
+    dtest_setup.phase_timings['setup_total'] = time.time() - setup_start
 
     # at this point we're done with our setup operations in this fixture
     # yield to allow the actual test to run
@@ -299,31 +490,60 @@ def fixture_dtest_setup(request,
 
     # phew! we're back after executing the test, now we need to do
     # all of our teardown and cleanup operations
+    rep_call = getattr(request.node, 'rep_call', None)
+    if rep_call is not None:
+        dtest_setup.phase_timings['call'] = rep_call.duration
 
     reset_environment_vars(initial_environment)
     dtest_setup.jvm_args = []
 
-    for con in dtest_setup.connections:
-        con.cluster.shutdown()
+    with dtest_setup.time_phase('close_connections'):
+        for con in dtest_setup.connections:
+            con.cluster.shutdown()
+        for fast_nodetool in dtest_setup.fast_nodetools.values():
+            fast_nodetool.close()
     dtest_setup.connections = []
+    dtest_setup.fast_nodetools = {}
+    dtest_setup.session_cache.clear()
 
     failed = False
+    if _test_failed(request):
+        dtest_setup.mark_cluster_dirty()
     try:
         if not dtest_setup.allow_log_errors:
-            errors = check_logs_for_errors(dtest_setup)
+            with dtest_setup.time_phase('check_logs_for_errors'):
+                errors = check_logs_for_errors(dtest_setup)
             if len(errors) > 0:
                 failed = True
+                dtest_setup.mark_cluster_dirty()
                 pytest.fail(msg='Unexpected error found in node logs (see stdout for full details). Errors: [{errors}]'
                                      .format(errors=str.join(", ", errors)), pytrace=False)
+        callback_errors = check_log_watch_errors(dtest_setup)
+        if callback_errors:
+            failed = True
+            dtest_setup.mark_cluster_dirty()
+            pytest.fail(msg='Checking node logs for errors failed: [{errors}]'
+                            .format(errors=", ".join(repr(e) for e in callback_errors)), pytrace=False)
     finally:
         try:
+            dtest_setup.stop_resource_sampler()
+            if dtest_setup.jfr_recording:
+                dtest_setup.dump_jfr_recording(dtest_setup.cluster.nodelist())
             # save the logs for inspection
-            if failed or not dtest_config.delete_logs:
-                copy_logs(request, dtest_setup.cluster)
+            sampled = dtest_config.resource_sample_interval is not None
+            if failed or not dtest_config.delete_logs or dtest_config.profile_nodes or sampled:
+                with dtest_setup.time_phase('copy_logs'):
+                    if fixture_log_archiver is not None:
+                        archive_logs(request, dtest_setup, fixture_log_archiver, full=failed or _test_failed(request))
+                    else:
+                        copy_logs(request, dtest_setup.cluster)
         except Exception as e:
             logger.error("Error saving log:", str(e))
         finally:
-            dtest_setup.cleanup_cluster()
+            try:
+                dtest_setup.cleanup_cluster()
+            finally:
+                record_phase_timings(request, dtest_setup, fixture_phase_timings_report)
 
 
 #Based on https://bugs.python.org/file25808/14894.patch
@@ -371,13 +591,11 @@ def fixture_since(request, fixture_dtest_setup):
         # are excluded by the annotation
         if hasattr(request.cls, "UPGRADE_PATH"):
             upgrade_path = request.cls.UPGRADE_PATH
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(upgrade_path.starting_meta.version)
-            starting_version = get_version_from_build(ccm_repo_cache_dir)
+            _, starting_version = resolve_version(upgrade_path.starting_meta.version)
             skip_msg = _skip_msg(starting_version, since, max_version)
             if skip_msg:
                 pytest.skip(skip_msg)
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(upgrade_path.upgrade_meta.version)
-            ending_version = get_version_from_build(ccm_repo_cache_dir)
+            _, ending_version = resolve_version(upgrade_path.upgrade_meta.version)
             skip_msg = _skip_msg(ending_version, since, max_version)
             if skip_msg:
                 pytest.skip(skip_msg)
@@ -424,6 +642,25 @@ def dtest_config(request):
     yield dtest_config
 
 
+def pytest_configure(config):
+    durations_output = config.getoption("--test-durations-output")
+    # with pytest-xdist only the master process sees the reports of all tests
+    if durations_output is not None and not hasattr(config, 'workerinput'):
+        config.pluginmanager.register(DurationRecorder(os.path.expanduser(durations_output)), 'dtest_duration_recorder')
+
+
+def _has_upgrade_test_class(module):
+    """
+    @return True if any class in module is marked with upgrade_test, in which case none of
+            the tests of the module run without --execute-upgrade-tests
+    """
+    for _, test_item_class in inspect.getmembers(module, inspect.isclass):
+        for module_pytest_mark in getattr(test_item_class, "pytestmark", []):
+            if module_pytest_mark.name == "upgrade_test":
+                return True
+    return False
+
+
 def pytest_collection_modifyitems(items, config):
     """
     This function is called upon during the pytest test collection phase and allows for modification
@@ -438,7 +675,7 @@ def pytest_collection_modifyitems(items, config):
                             "or --cassandra-version. Refer to the documentation or invoke the help with --help.")
 
     # Either cassandra_version or cassandra_dir is defined, so figure out the version
-    CASSANDRA_VERSION = cassandra_version or get_version_from_build(cassandra_dir)
+    CASSANDRA_VERSION = cassandra_version or version_from_build(cassandra_dir)
 
     # Check that use_off_heap_memtables is supported in this c* version
     if config.getoption("--use-off-heap-memtables") and ("3.0" <= CASSANDRA_VERSION < "3.4"):
@@ -450,15 +687,24 @@ def pytest_collection_modifyitems(items, config):
     selected_items = []
     deselected_items = []
 
-    sufficient_system_resources_resource_intensive = sufficient_system_resources_for_resource_intensive_tests()
+    sufficient_system_resources_resource_intensive = sufficient_system_resources_for_resource_intensive_tests(
+        config.getoption("--admission-control"))
     logger.debug("has sufficient resources? %s" % sufficient_system_resources_resource_intensive)
 
+    # options and per module facts are looked up once, not for every collected test
+    use_vnodes = config.getoption("--use-vnodes")
+    force_resource_intensive = config.getoption("--force-resource-intensive-tests")
+    skip_resource_intensive = config.getoption("--skip-resource-intensive-tests")
+    execute_upgrade_tests = config.getoption("--execute-upgrade-tests")
+    use_off_heap_memtables = config.getoption("use_off_heap_memtables")
+    modules_with_upgrade_test_classes = {}
+
     for item in items:
         deselect_test = False
+        # a single walk up the node tree instead of one get_closest_marker() walk per marker
+        marker_names = set(marker.name for marker in item.iter_markers())
 
-        if item.get_closest_marker("resource_intensive") and not collect_only:
-            force_resource_intensive = config.getoption("--force-resource-intensive-tests")
-            skip_resource_intensive = config.getoption("--skip-resource-intensive-tests")
+        if "resource_intensive" in marker_names and not collect_only:
             if not force_resource_intensive:
                 if skip_resource_intensive:
                     deselect_test = True
@@ -468,38 +714,31 @@ def pytest_collection_modifyitems(items, config):
                     deselect_test = True
                     logger.info("SKIP: Deselecting resource_intensive test %s due to insufficient system resources" % item.name)
 
-        if item.get_closest_marker("no_vnodes"):
-            if config.getoption("--use-vnodes"):
+        if "no_vnodes" in marker_names:
+            if use_vnodes:
                 deselect_test = True
                 logger.info("SKIP: Deselecting test %s as the test requires vnodes to be disabled. To run this test, "
                       "re-run without the --use-vnodes command line argument" % item.name)
 
-        if item.get_closest_marker("vnodes"):
-            if not config.getoption("--use-vnodes"):
+        if "vnodes" in marker_names:
+            if not use_vnodes:
                 deselect_test = True
                 logger.info("SKIP: Deselecting test %s as the test requires vnodes to be enabled. To run this test, "
                             "re-run with the --use-vnodes command line argument" % item.name)
 
-        for test_item_class in inspect.getmembers(item.module, inspect.isclass):
-            if not hasattr(test_item_class[1], "pytestmark"):
-                continue
-
-            for module_pytest_mark in test_item_class[1].pytestmark:
-                if module_pytest_mark.name == "upgrade_test":
-                    if not config.getoption("--execute-upgrade-tests"):
-                        deselect_test = True
-
-        if item.get_closest_marker("upgrade_test"):
-            if not config.getoption("--execute-upgrade-tests"):
+        if not execute_upgrade_tests:
+            if item.module not in modules_with_upgrade_test_classes:
+                modules_with_upgrade_test_classes[item.module] = _has_upgrade_test_class(item.module)
+            if modules_with_upgrade_test_classes[item.module] or "upgrade_test" in marker_names:
                 deselect_test = True
 
-        if item.get_closest_marker("no_offheap_memtables"):
-            if config.getoption("use_off_heap_memtables"):
+        if "no_offheap_memtables" in marker_names:
+            if use_off_heap_memtables:
                 deselect_test = True
 
         # temporarily deselect tests in cqlsh_copy_tests that depend on cqlshlib,
         # until cqlshlib is Python 3 compatibile
-        if item.get_marker("depends_cqlshlib"):
+        if "depends_cqlshlib" in marker_names:
             deselect_test = True
 
         if deselect_test:
@@ -509,3 +748,31 @@ def pytest_collection_modifyitems(items, config):
 
     config.hook.pytest_deselected(items=deselected_items)
     items[:] = selected_items
+
+    shard_and_order_items(items, config)
+
+
+def shard_and_order_items(items, config):
+    """
+    Keeps only the tests of the shard selected with --shard-count/--shard-index, and when a
+    --test-durations-file is given orders them so the longest (resource_intensive first) run first
+    """
+    shard_count = config.getoption("--shard-count")
+    shard_index = config.getoption("--shard-index")
+    durations_file = config.getoption("--test-durations-file")
+    if shard_count == 1 and durations_file is None:
+        return
+    if not 0 <= shard_index < shard_count:
+        raise Exception("--shard-index must be between 0 and --shard-count - 1, got {} with {} shards"
+                        .format(shard_index, shard_count))
+
+    history = DurationHistory(os.path.expanduser(durations_file)) if durations_file is not None else None
+    shards = plan_shards([(item,
+                           history.duration(item.nodeid) if history is not None else None,
+                           item.get_closest_marker("resource_intensive") is not None) for item in items],
+                         shard_count)
+
+    selected_items = shards[shard_index]
+    selected_ids = set(id(item) for item in selected_items)
+    config.hook.pytest_deselected(items=[item for item in items if id(item) not in selected_ids])
+    items[:] = selected_items
@@ -8,6 +8,8 @@ import sys
 import threading
 import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from distutils.version import LooseVersion
 
 import pytest
@@ -22,7 +24,10 @@ from cassandra.auth import PlainTextAuthProvider
 from cassandra.cluster import ExecutionProfile
 from cassandra.policies import RetryPolicy, RoundRobinPolicy
 from ccmlib.node import ToolError, TimeoutError
+from tools import nodetool_parsers
+from tools.fast_nodetool import FastNodetool
 from tools.misc import retry_till_success
+from tools.quiescence import wait_for_quiescence
 
 
 LOG_SAVED_DIR = "logs"
@@ -257,6 +262,84 @@ class Tester:
         runner.start()
         return runner
 
+    def fast_nodetool(self, node, cmd, **kwargs):
+        """
+        Same as node.nodetool(cmd, **kwargs), but runs flush, compact, drain, replaybatchlog, tpstats and
+        compactionstats through the node's Jolokia agent when it has one listening (see --jolokia-at-startup),
+        saving the launch of a nodetool JVM.
+        :return: A tuple of stdout, stderr and the return code
+        """
+        return self._fast_nodetool(node).nodetool(cmd, **kwargs)
+
+    def _fast_nodetool(self, node):
+        fast_nodetool = self.fixture_dtest_setup.fast_nodetools.get(node.name)
+        if fast_nodetool is None or fast_nodetool.node is not node:
+            fast_nodetool = self.fixture_dtest_setup.fast_nodetools[node.name] = FastNodetool(node)
+        return fast_nodetool
+
+    def jolokia_agents_running(self, nodes=None):
+        """
+        :param nodes: The nodes to check, all the nodes of the cluster by default
+        :return: Whether every running node has a Jolokia agent listening, i.e. fast_nodetool doesn't launch
+                 nodetool JVMs for the commands it handles
+        """
+        if nodes is None:
+            nodes = self.cluster.nodelist()
+        return all(self._fast_nodetool(node).has_agent() for node in nodes if node.is_running())
+
+    def on_all_nodes(self, op, nodes=None, include_stopped=False, max_workers=None):
+        """
+        Runs op(node) concurrently on the running nodes of the cluster, so that flushing, compacting
+        and the like on every node takes about as long as on the slowest one.
+        :param op: Function taking a node
+        :param nodes: The nodes to run op on, all the nodes of the cluster by default
+        :param include_stopped: Whether to run op on nodes that aren't running too
+        :param max_workers: The most nodes to run op on at once, all of them by default
+        :return: An OrderedDict of what op returned for each node, by node name
+        :raise: What op raised if it failed on a single node, or MultiError with the exception of each node it
+                failed on, once op is done on every node
+        """
+        if nodes is None:
+            nodes = self.cluster.nodelist()
+        if not include_stopped:
+            nodes = [node for node in nodes if node.is_running()]
+        return run_on_nodes(nodes, op, max_workers=max_workers)
+
+    def wait_for_quiescence(self, nodes=None, timeout=60, check_batchlog=True, **kwargs):
+        """
+        Waits for the running nodes to be idle, instead of sleeping for a fixed time and hoping they are:
+        no pending or active tasks, compactions or hints for live nodes, empty batchlogs and one schema
+        version per release. See tools.quiescence.
+        Without Jolokia agents on the nodes (see jolokia_agents_running) every poll launches a tpstats and a
+        compactionstats nodetool JVM per node and a describecluster one, which takes several seconds on its own.
+        :param nodes: The nodes to wait for, all the nodes of the cluster by default
+        :param timeout: Seconds to wait at most
+        :param check_batchlog: Whether to wait for the batchlogs to be empty, which takes a session per node
+        :param kwargs: Passed on to patient_exclusive_cql_connection for reading the batchlogs, e.g. user and password
+        :return: True as soon as the nodes are idle, False if they still weren't after timeout
+        """
+        if nodes is None:
+            nodes = self.cluster.nodelist()
+
+        if not check_batchlog:
+            return wait_for_quiescence(nodes, timeout, nodetool=self.fast_nodetool)
+
+        sessions = {}
+
+        def count_batches(node):
+            if node.name not in sessions:
+                sessions[node.name] = self.patient_exclusive_cql_connection(node, **kwargs)
+            table = 'system.batches' if node.get_cassandra_version() >= '3.0' else 'system.batchlog'
+            return list(sessions[node.name].execute("SELECT count(*) FROM {}".format(table)))[0].count
+
+        try:
+            return wait_for_quiescence(nodes, timeout, nodetool=self.fast_nodetool, count_batches=count_batches)
+        finally:
+            for session in sessions.values():
+                session.cluster.shutdown()
+                if session in self.connections:
+                    self.connections.remove(session)
+
     def assert_log_had_msg(self, node, msg, timeout=600, **kwargs):
         """
         Wrapper for ccmlib.node.Node#watch_log_for to cause an assertion failure when a log message isn't found
@@ -266,7 +349,7 @@ class Tester:
         :param timeout: Seconds to wait for msg to appear
         """
         try:
-            node.watch_log_for(msg, timeout=timeout, **kwargs)
+            self.fixture_dtest_setup.watch_log_for(node, msg, timeout=timeout, **kwargs)
         except TimeoutError:
             pytest.fail("Log message was not seen within timeout:\n{0}".format(msg))
 
@@ -388,29 +471,17 @@ def data_size(node, ks, cf):
     """
     Return the size in bytes for given table in a node.
     This gets the size from nodetool cfstats output.
-    This might brake if the format of nodetool cfstats change
-    as it is looking for specific text "Space used (total)" in output.
     @param node: Node in which table size to be checked for
     @param ks: Keyspace name for the table
     @param cf: table name
     @return: data size in bytes
     """
-    cfstats = node.nodetool("cfstats {}.{}".format(ks,cf))[0]
-    regex = re.compile(r'[\t]')
-    stats_lines = [regex.sub("", s) for s in cfstats.split('\n')
-                  if regex.sub("", s).startswith('Space used (total)')]
-    if not len(stats_lines) == 1:
-        msg = ('Expected output from `nodetool cfstats` to contain exactly 1 '
-               'line starting with "Space used (total)". Found:\n') + cfstats
-        raise RuntimeError(msg)
-    space_used_line = stats_lines[0].split()
-
-    if len(space_used_line) == 4:
-        return float(space_used_line[3])
-    else:
-        msg = ('Expected format for `Space used (total)` in nodetool cfstats is `Space used (total): <number>`.'
-               'Found:\n') + stats_lines[0]
+    stats = nodetool_parsers.tablestats(node, ks, cf, ttl=0)
+    if stats.space_used_total is None:
+        found = '\n'.join('{}: {}'.format(key, value) for key, value in stats.attributes.items())
+        msg = 'Expected output from `nodetool cfstats` to contain a "Space used (total)" size. Found:\n' + found
         raise RuntimeError(msg)
+    return stats.space_used_total
 
 
 def get_port_from_node(node):
@@ -476,6 +547,41 @@ class MultiError(Exception):
         return output
 
 
+def run_on_nodes(nodes, op, max_workers=None):
+    """
+    Runs op(node) for each of nodes concurrently, on a thread per node unless max_workers is given.
+    @param nodes The nodes to run op on
+    @param op Function taking a node
+    @param max_workers The most nodes to run op on at once
+    @return An OrderedDict of what op returned for each node by node name, in the order of nodes
+    @raise The exception op raised if it failed on a single node, or MultiError with the exception of each node
+           it failed on, once op is done on every node
+    """
+    nodes = list(nodes)
+    if not nodes:
+        return OrderedDict()
+    with ThreadPoolExecutor(max_workers=max_workers or len(nodes)) as executor:
+        futures = [(node, executor.submit(op, node)) for node in nodes]
+
+    results = OrderedDict()
+    errors = []
+    tracebacks = []
+    for node, future in futures:
+        e = future.exception()
+        if e is None:
+            results[node.name] = future.result()
+        else:
+            errors.append(e)
+            trace = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+            tracebacks.append('on {}:\n{}'.format(node.name, trace))
+    if len(errors) == 1:
+        # keeps the type, so callers can still catch what op raises
+        raise errors[0]
+    if errors:
+        raise MultiError(errors, tracebacks)
+    return results
+
+
 def run_scenarios(scenarios, handler, deferred_exceptions=tuple()):
     """
     Runs multiple scenarios from within a single test method.
@@ -1,8 +1,9 @@
 import subprocess
 import os
-import ccmlib.repository
 
-from ccmlib.common import is_win, get_version_from_build
+from ccmlib.common import is_win
+
+from tools.versions import resolve_version, version_from_build
 
 class DTestConfig:
     def __init__(self):
@@ -16,10 +17,22 @@ class DTestConfig:
         self.cassandra_version = None
         self.cassandra_version_from_build = None
         self.delete_logs = False
+        self.log_archive_mode = "copy"
+        self.log_archive_tail_kb = 1024
         self.execute_upgrade_tests = False
         self.disable_active_log_watching = False
         self.keep_test_dir = False
         self.enable_jacoco_code_coverage = False
+        self.phase_timings_file = None
+        self.admission_control = False
+        self.reuse_clusters = False
+        self.reuse_driver_sessions = False
+        self.lease_loopback_addresses = False
+        self.node_template_dir = None
+        self.appcds_cache_dir = None
+        self.profile_nodes = False
+        self.resource_sample_interval = None
+        self.jolokia_at_startup = False
         self.jemalloc_path = find_libjemalloc()
 
     def setup(self, request):
@@ -36,10 +49,25 @@ class DTestConfig:
         self.cassandra_version_from_build = self.get_version_from_build()
 
         self.delete_logs = request.config.getoption("--delete-logs")
+        self.log_archive_mode = request.config.getoption("--log-archive-mode")
+        self.log_archive_tail_kb = request.config.getoption("--log-archive-tail-kb")
         self.execute_upgrade_tests = request.config.getoption("--execute-upgrade-tests")
         self.disable_active_log_watching = request.config.getoption("--disable-active-log-watching")
         self.keep_test_dir = request.config.getoption("--keep-test-dir")
         self.enable_jacoco_code_coverage = request.config.getoption("--enable-jacoco-code-coverage")
+        if request.config.getoption("--phase-timings-file") is not None:
+            self.phase_timings_file = os.path.abspath(os.path.expanduser(request.config.getoption("--phase-timings-file")))
+        self.admission_control = request.config.getoption("--admission-control")
+        self.reuse_clusters = request.config.getoption("--reuse-clusters")
+        self.reuse_driver_sessions = request.config.getoption("--reuse-driver-sessions")
+        self.lease_loopback_addresses = request.config.getoption("--lease-loopback-addresses")
+        if request.config.getoption("--node-template-dir") is not None:
+            self.node_template_dir = os.path.expanduser(request.config.getoption("--node-template-dir"))
+        if request.config.getoption("--appcds-cache-dir") is not None:
+            self.appcds_cache_dir = os.path.expanduser(request.config.getoption("--appcds-cache-dir"))
+        self.profile_nodes = request.config.getoption("--profile-nodes")
+        self.resource_sample_interval = request.config.getoption("--resource-sample-interval")
+        self.jolokia_at_startup = request.config.getoption("--jolokia-at-startup")
 
     def get_version_from_build(self):
         # There are times when we want to know the C* version we're testing against
@@ -48,10 +76,10 @@ class DTestConfig:
         # get the version from build.xml in the C* repository specified by
         # CASSANDRA_VERSION or CASSANDRA_DIR.
         if self.cassandra_version is not None:
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(self.cassandra_version)
-            return get_version_from_build(ccm_repo_cache_dir)
+            _, version = resolve_version(self.cassandra_version)
+            return version
         elif self.cassandra_dir is not None:
-            return get_version_from_build(self.cassandra_dir)
+            return version_from_build(self.cassandra_dir)
 
 
 
@@ -1,16 +1,17 @@
 import pytest
+import functools
 import glob
 import os
 import shutil
 import time
 import logging
-import re
 import tempfile
 import subprocess
 import sys
 import errno
 import pprint
 from collections import OrderedDict
+from contextlib import contextmanager
 
 from cassandra.cluster import Cluster as PyCluster
 from cassandra.cluster import NoHostAvailable
@@ -23,8 +24,22 @@ from dtest import (get_ip_from_node, make_execution_profile, get_auth_provider,
                    get_eager_protocol_version)
 from distutils.version import LooseVersion
 
+from tools import nodetool_parsers
+from tools.appcds import AppCDSArchiveCache
+from tools.cluster_pool import SYSTEM_KEYSPACES, cluster_pool_key
+from tools.cluster_start import start_nodes
 from tools.context import log_filter
 from tools.funcutils import merge_dicts
+from tools.jdk import java_executable, java_version_output
+from tools.jmxutils import jolokia_startup_jvm_args
+from tools.jfr import RECORDING_FILE, RECORDING_NAME, SUMMARY_FILE, jfr_jvm_args, recording_jvm_args, summarize_recording
+from tools.log_archive import copy_logs
+from tools.log_follower import LogFollower
+from tools.log_scanner import LogErrorScanner, matches_any_pattern
+from tools.node_templates import NodeTemplateCache, node_template_key
+from tools.resource_sampler import ResourceSampler
+from tools.readiness import backoff_delays, sleep_until_next_attempt, wait_for_native_transport
+from tools.session_cache import SessionCache, session_cache_key
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +49,7 @@ def retry_till_success(fun, *args, **kwargs):
     bypassed_exception = kwargs.pop('bypassed_exception', Exception)
 
     deadline = time.time() + timeout
+    delays = backoff_delays()
     while True:
         try:
             return fun(*args, **kwargs)
@@ -41,21 +57,45 @@ def retry_till_success(fun, *args, **kwargs):
             if time.time() > deadline:
                 raise
             else:
-                # brief pause before next attempt
-                time.sleep(0.25)
+                # brief pause before next attempt, growing while the failures persist
+                sleep_until_next_attempt(delays, deadline)
+
+
+def timed(phase):
+    """
+    Decorator for DTestSetup methods that adds the wall time they take to DTestSetup.phase_timings
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            with self.time_phase(phase):
+                return f(self, *args, **kwargs)
+        return wrapper
+    return decorator
 
 
 class DTestSetup:
-    def __init__(self, dtest_config=None, setup_overrides=None, cluster_name="test"):
+    def __init__(self, dtest_config=None, setup_overrides=None, cluster_name="test", cluster_pool=None,
+                 loopback_lease=None):
         self.dtest_config = dtest_config
         self.setup_overrides = setup_overrides
         self.cluster_name = cluster_name
+        self.cluster_pool = cluster_pool
+        self.loopback_lease = loopback_lease
+        self.cluster_pool_key = None
+        self.cluster_dirty = False
+        self.log_scanner = LogErrorScanner()
+        self.log_watch_start_marks = {}
         self.ignore_log_patterns = []
         self.cluster = None
         self.cluster_options = []
         self.replacement_node = None
         self.allow_log_errors = False
         self.connections = []
+        # node name -> FastNodetool
+        self.fast_nodetools = {}
+        self.phase_timings = OrderedDict()
+        self.session_cache = SessionCache(enabled=dtest_config is not None and dtest_config.reuse_driver_sessions)
 
         self.log_saved_dir = "logs"
         try:
@@ -66,8 +106,11 @@ class DTestSetup:
         self.last_log = os.path.join(self.log_saved_dir, "last")
         self.test_path = self.get_test_path()
         self.enable_for_jolokia = False
+        # whether the nodes run a flight recording to dump when the test is over
+        self.jfr_recording = False
         self.subprocs = []
         self.log_watch_thread = None
+        self.resource_sampler = None
         self.last_test_dir = "last_test_dir"
         self.jvm_args = []
         self.create_cluster_func = None
@@ -93,16 +136,64 @@ class DTestSetup:
                 result.extend(glob.glob(ks_dir))
         return result
 
+    @contextmanager
+    def time_phase(self, phase):
+        """
+        Adds the wall time spent in the with block to phase_timings[phase]
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phase_timings[phase] = self.phase_timings.get(phase, 0) + time.time() - start
+
+    @timed('begin_active_log_watch')
     def begin_active_log_watch(self):
         """
-        Calls into ccm to start actively watching logs.
+        Starts a LogFollower actively watching the logs of all nodes.
 
-        In the event that errors are seen in logs, ccm will call back to _log_error_handler.
+        In the event that errors are seen in logs, the follower will call back to _log_error_handler.
+        While it runs, node.watch_log_for of every node it follows (which ccm's own waits such as
+        watch_log_for_alive go through too) is woken up by the follower instead of polling the log itself.
 
         When the cluster is no longer in use, stop_active_log_watch should be called to end log watching.
         (otherwise a 'daemon' thread will (needlessly) run until the process exits).
         """
-        self.log_watch_thread = self.cluster.actively_watch_logs_for_error(self._log_error_handler, interval=0.25)
+        self.log_watch_thread = LogFollower(self.cluster, on_error=self._log_error_handler,
+                                            start_marks=self.log_watch_start_marks, on_new_node=self._route_log_watch)
+        self.log_watch_thread.start()
+
+    def _can_follow(self, filename, process=None, verbose=False):
+        """
+        @return Whether a wait for filename can go through the active log watch. Waits that also
+                watch the start process of the node are left to ccm.
+        """
+        log_follower = self.log_watch_thread
+        if log_follower is None or not log_follower.is_alive() or process is not None or verbose:
+            return False
+        return filename == log_follower.filename
+
+    def _route_log_watch(self, node):
+        """
+        Shadows ccm's node.watch_log_for with one waiting through the active log watch when it can.
+        """
+        ccm_watch_log_for = node.watch_log_for
+
+        def watch_log_for(exprs, from_mark=None, timeout=600, process=None, verbose=False, filename='system.log'):
+            if self._can_follow(filename, process, verbose):
+                return self.log_watch_thread.watch_for(node, exprs, from_mark=from_mark, timeout=timeout)
+            return ccm_watch_log_for(exprs, from_mark=from_mark, timeout=timeout, process=process, verbose=verbose,
+                                     filename=filename)
+        node.watch_log_for = watch_log_for
+
+    def watch_log_for(self, node, exprs, from_mark=None, timeout=600, filename='system.log', **kwargs):
+        """
+        Same as node.watch_log_for, but when the active log watch is running the wait is woken up
+        as soon as the node logs a line instead of polling the log file.
+        """
+        if self._can_follow(filename, **kwargs):
+            return self.log_watch_thread.watch_for(node, exprs, from_mark=from_mark, timeout=timeout)
+        return node.watch_log_for(exprs, from_mark=from_mark, timeout=timeout, filename=filename, **kwargs)
 
     def _log_error_handler(self, errordata):
         """
@@ -136,6 +227,7 @@ class DTestSetup:
         logger.debug('Errors were just seen in logs, ending test (if not ending already)!')
         pytest.fail("Error details: \n{message}".format(message=message))
 
+    @timed('copy_logs')
     def copy_logs(self, directory=None, name=None):
         """Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'"""
         if directory is None:
@@ -144,32 +236,8 @@ class DTestSetup:
             name = self.last_log
         else:
             name = os.path.join(directory, name)
-        if not os.path.exists(directory):
-            os.mkdir(directory)
-        logs = [(node.name, node.logfilename(), node.debuglogfilename(), node.gclogfilename(),
-                 node.compactionlogfilename())
-                for node in self.cluster.nodelist()]
-        if len(logs) is not 0:
-            basedir = str(int(time.time() * 1000)) + '_' + str(id(self))
-            logdir = os.path.join(directory, basedir)
-            os.mkdir(logdir)
-            for n, log, debuglog, gclog, compactionlog in logs:
-                if os.path.exists(log):
-                    assert os.path.getsize(log) >= 0
-                    shutil.copyfile(log, os.path.join(logdir, n + ".log"))
-                if os.path.exists(debuglog):
-                    assert os.path.getsize(debuglog) >= 0
-                    shutil.copyfile(debuglog, os.path.join(logdir, n + "_debug.log"))
-                if os.path.exists(gclog):
-                    assert os.path.getsize(gclog) >= 0
-                    shutil.copyfile(gclog, os.path.join(logdir, n + "_gc.log"))
-                if os.path.exists(compactionlog):
-                    assert os.path.getsize(compactionlog) >= 0
-                    shutil.copyfile(compactionlog, os.path.join(logdir, n + "_compaction.log"))
-            if os.path.exists(name):
-                os.unlink(name)
-            if not is_win():
-                os.symlink(basedir, name)
+        basedir = str(int(time.time() * 1000)) + '_' + str(id(self))
+        copy_logs(self.cluster, directory, basedir, name)
 
     def cql_connection(self, node, keyspace=None, user=None,
                        password=None, compression=True, protocol_version=None, port=None, ssl_opts=None, **kwargs):
@@ -181,15 +249,11 @@ class DTestSetup:
                                  password=None, compression=True, protocol_version=None, port=None, ssl_opts=None,
                                  **kwargs):
 
-        node_ip = get_ip_from_node(node)
-        wlrr = WhiteListRoundRobinPolicy([node_ip])
-
         return self._create_session(node, keyspace, user, password, compression,
-                                    protocol_version, port=port, ssl_opts=ssl_opts, load_balancing_policy=wlrr,
-                                    **kwargs)
+                                    protocol_version, port=port, ssl_opts=ssl_opts, exclusive=True, **kwargs)
 
     def _create_session(self, node, keyspace, user, password, compression, protocol_version,
-                        port=None, ssl_opts=None, execution_profiles=None, **kwargs):
+                        port=None, ssl_opts=None, execution_profiles=None, exclusive=False, reusable=False, **kwargs):
         node_ip = get_ip_from_node(node)
         if not port:
             port = get_port_from_node(node)
@@ -197,6 +261,17 @@ class DTestSetup:
         if protocol_version is None:
             protocol_version = get_eager_protocol_version(node.cluster.version())
 
+        cache_key = None
+        if reusable and execution_profiles is None:
+            cache_key = session_cache_key(node, keyspace, user, password, compression, protocol_version, port,
+                                          ssl_opts, exclusive, kwargs)
+            session = self.session_cache.get(cache_key)
+            if session is not None:
+                return session
+
+        if exclusive:
+            kwargs['load_balancing_policy'] = WhiteListRoundRobinPolicy([node_ip])
+
         if user is not None:
             auth_provider = get_auth_provider(user=user, password=password)
         else:
@@ -220,6 +295,8 @@ class DTestSetup:
             session.set_keyspace(keyspace)
 
         self.connections.append(session)
+        if cache_key is not None:
+            self.session_cache.put(cache_key, node, session)
         return session
 
     def patient_cql_connection(self, node, keyspace=None,
@@ -227,11 +304,13 @@ class DTestSetup:
                                protocol_version=None, port=None, ssl_opts=None, **kwargs):
         """
         Returns a connection after it stops throwing NoHostAvailables due to not being ready.
+        Driver sessions are only built once the node accepts connections on its native transport port.
 
         If the timeout is exceeded, the exception is raised.
         """
         if is_win():
             timeout *= 2
+        timeout = self._wait_for_native_transport(node, timeout, port)
 
         expected_log_lines = ('Control connection failed to connect, shutting down Cluster:',
                               '[control connection] Error connecting to ')
@@ -258,11 +337,13 @@ class DTestSetup:
                                          protocol_version=None, port=None, ssl_opts=None, **kwargs):
         """
         Returns a connection after it stops throwing NoHostAvailables due to not being ready.
+        Driver sessions are only built once the node accepts connections on its native transport port.
 
         If the timeout is exceeded, the exception is raised.
         """
         if is_win():
             timeout *= 2
+        timeout = self._wait_for_native_transport(node, timeout, port)
 
         return retry_till_success(
             self.exclusive_cql_connection,
@@ -279,10 +360,38 @@ class DTestSetup:
             **kwargs
         )
 
+    @contextmanager
+    def reusable_cql_connection(self, node, exclusive=False, **kwargs):
+        """
+        Connects like patient_cql_connection (patient_exclusive_cql_connection if exclusive) for helpers that are
+        done with the session at the end of the with block, e.g. ones polling the nodes. The session is then kept
+        for the next such block asking for the same connection when --reuse-driver-sessions is enabled, and shut
+        down otherwise. It must not be used after the block.
+        """
+        connect = self.patient_exclusive_cql_connection if exclusive else self.patient_cql_connection
+        session = connect(node, reusable=True, **kwargs)
+        try:
+            yield session
+        finally:
+            if not self.session_cache.release(session):
+                session.cluster.shutdown()
+                if session in self.connections:
+                    self.connections.remove(session)
+
+    @staticmethod
+    def _wait_for_native_transport(node, timeout, port):
+        """
+        @return How much of timeout is left for connecting after waiting for the native transport port of node
+        """
+        deadline = time.time() + timeout
+        wait_for_native_transport(node, timeout=timeout, port=port)
+        return max(0, deadline - time.time())
+
+    @timed('check_logs_for_errors')
     def check_logs_for_errors(self):
         for node in self.cluster.nodelist():
             errors = list(self.__filter_errors(
-                ['\n'.join(msg) for msg in node.grep_log_for_errors()]))
+                ['\n'.join(msg) for msg in self.log_scanner.errors(node)]))
             if len(errors) is not 0:
                 for error in errors:
                     print("Unexpected error in {node_name} log, error: \n{error}".format(node_name=node.name, error=error))
@@ -293,42 +402,67 @@ class DTestSetup:
         if not hasattr(self, 'ignore_log_patterns'):
             self.ignore_log_patterns = []
         for e in errors:
-            for pattern in self.ignore_log_patterns:
-                if re.search(pattern, e):
-                    break
-            else:
+            if not matches_any_pattern(self.ignore_log_patterns, e):
                 yield e
 
     def get_jfr_jvm_args(self):
         """
         @return The JVM arguments required for attaching flight recorder to a Java process.
         """
-        return ["-XX:+UnlockCommercialFeatures", "-XX:+FlightRecorder"]
+        return jfr_jvm_args(java_version_output(java_executable()))
 
     def start_jfr_recording(self, nodes):
         """
         Start Java flight recorder provided the cluster was started with the correct jvm arguments.
         """
         for node in nodes:
-            p = subprocess.Popen(['jcmd', str(node.pid), 'JFR.start'],
+            p = subprocess.Popen(['jcmd', str(node.pid), 'JFR.start', 'name={}'.format(RECORDING_NAME),
+                                  'settings=profile'],
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE)
             stdout, stderr = p.communicate()
             logger.debug(stdout)
             logger.debug(stderr)
 
+    @timed('dump_jfr_recording')
     def dump_jfr_recording(self, nodes):
         """
-        Save Java flight recorder results to file for analyzing with mission control.
+        Save Java flight recorder results to the log directory of each node for analyzing with mission control,
+        along with a text summary of them when the JDK has the jfr tool.
         """
         for node in nodes:
-            p = subprocess.Popen(['jcmd', str(node.pid), 'JFR.dump',
-                                  'recording=1', 'filename=recording_{}.jfr'.format(node.address())],
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            stdout, stderr = p.communicate()
-            logger.debug(stdout)
-            logger.debug(stderr)
+            recording = os.path.join(node.get_path(), 'logs', RECORDING_FILE)
+            if node.is_running():
+                p = subprocess.Popen(['jcmd', str(node.pid), 'JFR.dump',
+                                      'name={}'.format(RECORDING_NAME), 'filename={}'.format(recording)],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+                stdout, stderr = p.communicate()
+                logger.debug(stdout)
+                logger.debug(stderr)
+            # nodes stopped gently dumped their recording on exit
+            if os.path.exists(recording):
+                summarize_recording(recording, os.path.join(node.get_path(), 'logs', SUMMARY_FILE))
+
+    def start_resource_sampler(self):
+        """
+        Samples the resources the nodes of the cluster use every --resource-sample-interval seconds, if it is set.
+        """
+        if self.dtest_config.resource_sample_interval is None:
+            return
+        self.resource_sampler = ResourceSampler(lambda: self.cluster.nodelist(), self.dtest_config.resource_sample_interval)
+        self.resource_sampler.start()
+
+    @timed('write_resource_samples')
+    def stop_resource_sampler(self):
+        """
+        Stops sampling and writes the samples of each node to its log directory, so they are saved with the logs.
+        """
+        if self.resource_sampler is None:
+            return
+        self.resource_sampler.stop()
+        self.resource_sampler.write(self.cluster.nodelist())
+        self.resource_sampler = None
 
     def supports_v5_protocol(self, cluster_version):
         return cluster_version >= LooseVersion('4.0')
@@ -346,8 +480,18 @@ class DTestSetup:
         If not called, log watching thread will remain running until the parent process exits.
         """
         self.log_watch_thread.join(timeout=60)
+        # pooled clusters outlive this test and its log watch
+        for node in self.cluster.nodelist():
+            vars(node).pop('watch_log_for', None)
 
+    @timed('cleanup_cluster')
     def cleanup_cluster(self):
+        # pooled clusters keep their paths, so the next test must not see this one's cached nodetool output
+        nodetool_parsers.clear_cache()
+        if self._return_cluster_to_pool():
+            return
+
+        self.maybe_save_appcds_archive()
         with log_filter('cassandra'):  # quiet noise from driver when nodes start going down
             if self.dtest_config.keep_test_dir:
                 self.cluster.stop(gently=self.dtest_config.enable_jacoco_code_coverage)
@@ -378,11 +522,137 @@ class DTestSetup:
                     os.rmdir(self.test_path)
                     self.cleanup_last_test_dir()
 
+    @timed('start_cluster')
+    def start_reusable_cluster(self, nodes):
+        """
+        Populates and starts the cluster of a test marked with reusable_cluster. When --reuse-clusters
+        is enabled, an identically configured cluster left behind by an earlier test is adopted instead.
+        @param nodes Node count as accepted by ccm's Cluster.populate
+        """
+        if self.cluster_pool is None or not self.cluster_pool.enabled:
+            self._populate_and_start_cluster(nodes)
+            return
+
+        key = cluster_pool_key(self.cluster, nodes)
+        pooled = self.cluster_pool.checkout(key)
+        if pooled is None:
+            self._populate_and_start_cluster(nodes)
+        else:
+            # the cluster created for this test was never populated, so throwing it away is cheap
+            self.cluster.remove()
+            shutil.rmtree(self.test_path, ignore_errors=True)
+            self.cluster = pooled.cluster
+            self.test_path = pooled.test_path
+            # only errors logged from now on belong to this test
+            for node in self.cluster.nodelist():
+                node.mark_log_for_errors()
+                self.log_scanner.mark(node)
+                self.log_watch_start_marks[node.name] = node.mark_log()
+        self.cluster_pool_key = key
+
+    def start_nodes(self, nodes=None, wait_other_notice=True, wait_for_binary_proto=True, **kwargs):
+        """
+        Starts the nodes of the cluster that aren't running, faster than calling node.start() on one node
+        after another: seeds first, then every other node at once, waiting for all of them together.
+        Nodes that bootstrap are started last, one at a time. cluster.start() already launches every node
+        before waiting for any, and remains the way to start a whole new cluster.
+        @param nodes The nodes to start, all of them by default
+        @param kwargs Passed on to node.start, e.g. jvm_args
+        @return The nodes started
+        """
+        return start_nodes(self.cluster, nodes, wait_other_notice=wait_other_notice,
+                           wait_for_binary_proto=wait_for_binary_proto, **kwargs)
+
+    def _populate_and_start_cluster(self, nodes):
+        """
+        Populates and starts the cluster, starting the nodes from a cached node template
+        when --node-template-dir is set.
+        """
+        self.cluster.populate(nodes)
+        if self.dtest_config.node_template_dir is None:
+            self.cluster.start(wait_for_binary_proto=True)
+            return
+
+        template_cache = NodeTemplateCache(self.dtest_config.node_template_dir)
+        key = node_template_key(self.cluster, nodes, self.dtest_config.data_dir_count)
+        if template_cache.has_template(key):
+            template_cache.materialize(key, self.cluster)
+            self.cluster.start(wait_for_binary_proto=True)
+            return
+
+        # first boot for this cluster shape: capture the nodes right after it, then bring them back
+        self.cluster.start(wait_for_binary_proto=True)
+        self.cluster.flush()
+        self.cluster.stop(gently=True)
+        template_cache.save(key, self.cluster)
+        self.cluster.start(wait_for_binary_proto=True)
+
+    def mark_cluster_dirty(self):
+        """
+        Tells the harness the test changed the cluster in a way a reset can't undo (e.g. edited
+        node config files directly), so it must not be handed to another test.
+        """
+        self.cluster_dirty = True
+
+    def _cluster_reusable(self):
+        if self.cluster_pool_key is None or self.cluster_dirty:
+            return False
+
+        node_counts = self.cluster_pool_key[0]
+        nodes = self.cluster.nodelist()
+        if len(nodes) != sum(node_counts) or not all(node.is_running() for node in nodes):
+            return False
+        # catches upgrades and configuration drift
+        if cluster_pool_key(self.cluster, list(node_counts)) != self.cluster_pool_key:
+            return False
+        # errors a test chose to ignore would fail the next test using this cluster
+        return not any(self.log_scanner.errors(node) for node in nodes)
+
+    def _reset_cluster_for_reuse(self):
+        session = self.cql_connection(self.cluster.nodelist()[0])
+        try:
+            for keyspace in list(session.cluster.metadata.keyspaces):
+                if keyspace not in SYSTEM_KEYSPACES:
+                    session.execute('DROP KEYSPACE "{}"'.format(keyspace))
+        finally:
+            session.cluster.shutdown()
+            self.connections.remove(session)
+
+        # dropping a keyspace takes an automatic snapshot, so clear snapshots last
+        clearsnapshot = 'clearsnapshot --all' if self.cluster.version() >= '4' else 'clearsnapshot'
+        for node in self.cluster.nodelist():
+            node.nodetool(clearsnapshot)
+
+    def _return_cluster_to_pool(self):
+        """
+        @return True if the cluster was reset and parked in the cluster pool, False if it still needs to be removed
+        """
+        if not self._cluster_reusable():
+            return False
+
+        try:
+            if self.log_watch_thread:
+                self.stop_active_log_watch()
+            with log_filter('cassandra'):
+                self._reset_cluster_for_reuse()
+        except Exception as e:
+            logger.warning("Unable to reset cluster for reuse, removing it instead: {}".format(e))
+            return False
+
+        self.cluster_pool.checkin(self.cluster_pool_key, self.cluster, self.test_path)
+        return True
+
     def cleanup_and_replace_cluster(self):
         for con in self.connections:
             con.cluster.shutdown()
         self.connections = []
+        self.session_cache.clear()
+        for fast_nodetool in self.fast_nodetools.values():
+            fast_nodetool.close()
+        self.fast_nodetools = {}
 
+        # the replacement cluster needs the loopback addresses, so this one can't go back to the pool
+        self.cluster_pool_key = None
         self.cleanup_cluster()
         self.test_path = self.get_test_path()
         self.initialize_cluster(self.create_cluster_func)
@@ -460,6 +730,61 @@ class DTestSetup:
         else:
             logger.debug("Jacoco agent not found or is not file. Execution will not be recorded.")
 
+    def _append_cluster_jvm_args(self, jvm_args):
+        """
+        Adds jvm_args to the JVM options of every node of the cluster, through the cluster-wide cassandra.in.sh
+        ccm appends to the one of each node. They may refer to CASSANDRA_CONF, the conf directory of the node.
+        They are not added to self.jvm_args, as tests passing those to node.start would apply them twice.
+        """
+        # appended, as the jacoco setup may have written the file already
+        with open(os.path.join(self.cluster.get_path(), 'cassandra.in.sh'), 'a') as f:
+            f.write('\nJVM_OPTS="$JVM_OPTS {}"\n'.format(' '.join(jvm_args)))
+
+    def maybe_setup_appcds(self):
+        """Start the nodes with the class data sharing archive of the Cassandra build, or record what they load for it"""
+
+        if self.dtest_config.appcds_cache_dir is None:
+            return
+
+        appcds_cache = AppCDSArchiveCache(self.dtest_config.appcds_cache_dir)
+        jvm_args = appcds_cache.jvm_args(self.cluster.get_install_dir())
+        if jvm_args:
+            self._append_cluster_jvm_args(jvm_args)
+
+    def maybe_setup_jfr(self):
+        """Start a flight recording along with every node"""
+
+        if not self.dtest_config.profile_nodes:
+            return
+        if is_win():
+            logger.warning("Profiling nodes is not supported on Windows")
+            return
+
+        recording = os.path.join('$CASSANDRA_CONF', os.path.pardir, 'logs', RECORDING_FILE)
+        self._append_cluster_jvm_args(recording_jvm_args(java_version_output(java_executable()), recording))
+        self.jfr_recording = True
+
+    def maybe_setup_jolokia(self):
+        """Load the Jolokia agent into every node when it starts, so JolokiaAgent doesn't have to attach it"""
+
+        if not self.dtest_config.jolokia_at_startup:
+            return
+        if is_win():
+            logger.warning("Loading the Jolokia agent at node startup is not supported on Windows")
+            return
+
+        self.enable_for_jolokia = True
+        self._append_cluster_jvm_args(jolokia_startup_jvm_args())
+
+    def maybe_save_appcds_archive(self):
+        if self.dtest_config.appcds_cache_dir is None:
+            return
+
+        try:
+            AppCDSArchiveCache(self.dtest_config.appcds_cache_dir).save(self.cluster)
+        except Exception as e:
+            # the archive only makes later tests faster, so never fail the test over it
+            logger.warning("Unable to save class data sharing archive: {}".format(e))
 
     @staticmethod
     def create_ccm_cluster(dtest_setup):
@@ -473,6 +798,8 @@ class DTestSetup:
 
         cluster.set_datadir_count(dtest_setup.dtest_config.data_dir_count)
         cluster.set_environment_variable('CASSANDRA_LIBJEMALLOC', dtest_setup.dtest_config.jemalloc_path)
+        if dtest_setup.loopback_lease is not None:
+            dtest_setup.loopback_lease.apply(cluster)
 
         return cluster
 
@@ -490,6 +817,7 @@ class DTestSetup:
             log_level = logging.root.level
         self.cluster.set_log_level(log_level)
 
+    @timed('initialize_cluster')
     def initialize_cluster(self, create_cluster_func):
         """
         This method is responsible for initializing and configuring a ccm
@@ -508,6 +836,9 @@ class DTestSetup:
         self.cluster = self.create_cluster_func(self)
         self.init_default_config()
         self.maybe_setup_jacoco()
+        self.maybe_setup_appcds()
+        self.maybe_setup_jfr()
+        self.maybe_setup_jolokia()
         self.set_cluster_log_levels()
 
         # cls.init_config()
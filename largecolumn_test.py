@@ -1,8 +1,8 @@
 import pytest
-import re
 import logging
 
 from dtest import Tester
+from tools.nodetool_parsers import parse_gcstats
 
 since = pytest.mark.since
 logger = logging.getLogger(__name__)
@@ -21,22 +21,9 @@ class TestLargeColumn(Tester):
         node.stress(['read', 'n=5', "no-warmup", "cl=ALL", "-pop", "seq=1...5", "-schema", "replication(factor=2)", "-col", "n=fixed(1)", "size=fixed(" + size + ")", "-rate", "threads=1"])
 
     def directbytes(self, node):
-        def is_number(s):
-            try:
-                float(s)
-                return True
-            except ValueError:
-                return False
-
         output, err, _ = node.nodetool("gcstats")
         logger.debug(output)
-        output = output.split("\n")
-        assert re.search('Interval', output[0].strip())
-        fields = output[1].split()
-        assert len(fields) >= 6, "Expected output from nodetool gcstats has at least six fields. However >= fields is: {}".format(fields)
-        for field in fields:
-            assert is_number(field.strip()) or field == 'NaN', "Expected numeric from fields from nodetool gcstats. However, field.strip() is: {}".format(field.strip())
-        return fields[6]
+        return int(parse_gcstats(output).direct_memory_bytes)
 
     def test_cleanup(self):
         """
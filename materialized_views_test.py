@@ -26,6 +26,7 @@ from tools.assertions import (assert_all, assert_crc_check_chance_equal,
                               assert_unavailable)
 from tools.data import rows_to_list
 from tools.misc import new_node
+from tools.nodetool_parsers import parse_tpstats
 from tools.jmxutils import (JolokiaAgent, make_mbean, remove_perf_disable_shared_mem)
 
 since = pytest.mark.since
@@ -87,28 +88,29 @@ class TestMaterializedViews(Tester):
 
     def _settle_nodes(self):
         logger.debug("Settling all nodes")
-        stage_match = re.compile(r"(?P<name>\S+)\s+(?P<active>\d+)\s+(?P<pending>\d+)\s+(?P<completed>\d+)\s+(?P<blocked>\d+)\s+(?P<alltimeblocked>\d+)")
+        if self.jolokia_agents_running():
+            self.on_all_nodes(lambda node: self.fast_nodetool(node, "replaybatchlog"))
+            # the batchlogs were just replayed
+            self.wait_for_quiescence(timeout=30, check_batchlog=False)
+            return
 
+        # polling for quiescence through nodetool JVMs would take longer than this
         def _settled_stages(node):
             (stdout, stderr, rc) = node.nodetool("tpstats")
-            lines = re.split("\n+", stdout)
-            for line in lines:
-                match = stage_match.match(line)
-                if match is not None:
-                    active = int(match.group('active'))
-                    pending = int(match.group('pending'))
-                    if active != 0 or pending != 0:
-                        logger.debug("%s - pool %s still has %d active and %d pending" % (node.name, match.group("name"), active, pending))
-                        return False
+            for name, pool in parse_tpstats(stdout).pools.items():
+                if pool.active or pool.pending:
+                    logger.debug("%s - pool %s still has %s active and %s pending" % (node.name, name, pool.active, pool.pending))
+                    return False
             return True
 
-        for node in self.cluster.nodelist():
-            if node.is_running():
-                node.nodetool("replaybatchlog")
-                attempts = 50  # 100 milliseconds per attempt, so 5 seconds total
-                while attempts > 0 and not _settled_stages(node):
-                    time.sleep(0.1)
-                    attempts -= 1
+        def _settle(node):
+            node.nodetool("replaybatchlog")
+            attempts = 50  # 100 milliseconds per attempt, so 5 seconds total
+            while attempts > 0 and not _settled_stages(node):
+                time.sleep(0.1)
+                attempts -= 1
+
+        self.on_all_nodes(_settle)
 
     def _build_progress_table(self):
         if self.cluster.version() >= '4':
@@ -120,10 +122,10 @@ class TestMaterializedViews(Tester):
         logger.debug("waiting for view")
 
         def _view_build_finished(node):
-            s = self.patient_exclusive_cql_connection(node)
             query = "SELECT * FROM %s WHERE keyspace_name='%s' AND view_name='%s'" %\
                     (self._build_progress_table(), ks, view)
-            result = list(s.execute(query))
+            with self.reusable_cql_connection(node, exclusive=True) as s:
+                result = list(s.execute(query))
             return len(result) == 0
 
         for node in self.cluster.nodelist():
@@ -161,13 +163,16 @@ class TestMaterializedViews(Tester):
         self._settle_nodes()
 
     def _replay_batchlogs(self):
+        def _replay_batchlog(node):
+            logger.debug("Replaying batchlog on node {}".format(node.name))
+            node.nodetool("replaybatchlog")
+
+        self.on_all_nodes(_replay_batchlog)
         for node in self.cluster.nodelist():
             if node.is_running():
-                logger.debug("Replaying batchlog on node {}".format(node.name))
-                node.nodetool("replaybatchlog")
                 # CASSANDRA-13069 - Ensure replayed mutations are removed from the batchlog
-                node_session = self.patient_exclusive_cql_connection(node)
-                result = list(node_session.execute("SELECT count(*) FROM system.batches;"))
+                with self.reusable_cql_connection(node, exclusive=True) as node_session:
+                    result = list(node_session.execute("SELECT count(*) FROM system.batches;"))
                 assert result[0].count == 0
 
     def _assert_view_meta(self, session, views, exists=True, nodes=2):
@@ -0,0 +1,52 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock
+
+from plugins.collect_json import collected_test_name, pytest_collection_finish
+
+
+def _item(nodeid, *markers):
+    item = Mock(nodeid=nodeid)
+    marks = []
+    for name in markers:
+        mark = Mock()
+        mark.name = name
+        marks.append(mark)
+    item.iter_markers.return_value = marks
+    return item
+
+
+class TestCollectJson(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'collected.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _session(self, path, items):
+        session = Mock(items=items)
+        session.config.getoption.return_value = path
+        return session
+
+    def test_collected_test_name(self):
+        assert 'cql_test.py::TestCQL::test_batch' == collected_test_name('cql_test.py::TestCQL::()::test_batch')
+        assert 'cql_test.py::test_function' == collected_test_name('cql_test.py::test_function')
+
+    def test_writes_tests_and_markers(self):
+        items = [_item('cql_test.py::TestCQL::()::test_batch', 'since', 'resource_intensive', 'since'),
+                 _item('cql_test.py::test_function')]
+        pytest_collection_finish(self._session(self.path, items))
+        with open(self.path) as f:
+            assert [{'name': 'cql_test.py::TestCQL::test_batch', 'markers': ['resource_intensive', 'since']},
+                    {'name': 'cql_test.py::test_function', 'markers': []}] == json.load(f)
+        assert ['collected.json'] == os.listdir(self.tmp_dir)
+
+    def test_nothing_written_without_option(self):
+        pytest_collection_finish(self._session(None, [_item('cql_test.py::test_function')]))
+        assert [] == os.listdir(self.tmp_dir)
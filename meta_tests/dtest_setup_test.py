@@ -0,0 +1,257 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from dtest_setup import DTestSetup
+
+
+class TestClusterReuse(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        # DTestSetup keeps its logs relative to the working directory
+        os.chdir(self.tmp_dir)
+        with patch.object(DTestSetup, 'get_test_path', return_value=os.path.join(self.tmp_dir, 'test')):
+            self.dtest_setup = DTestSetup(dtest_config=Mock(reuse_driver_sessions=False), cluster_pool=Mock())
+        self.nodes = [self._node('node1'), self._node('node2')]
+        self.dtest_setup.cluster = Mock()
+        self.dtest_setup.cluster.nodelist.return_value = self.nodes
+        self.dtest_setup.cluster.version.return_value = '4.0'
+        self.dtest_setup.log_scanner = Mock()
+        self.dtest_setup.log_scanner.errors.return_value = []
+        self.key = ((2,), '/cassandra', '4.0', '[]')
+        self.dtest_setup.cluster_pool_key = self.key
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def _node(name):
+        node = Mock()
+        node.name = name
+        node.is_running.return_value = True
+        return node
+
+    def _cluster_reusable(self):
+        with patch('dtest_setup.cluster_pool_key', return_value=self.key):
+            return self.dtest_setup._cluster_reusable()
+
+    def _session(self, keyspaces):
+        session = Mock()
+        session.cluster.metadata.keyspaces = dict.fromkeys(keyspaces)
+        self.dtest_setup.connections.append(session)
+        self.dtest_setup.cql_connection = Mock(return_value=session)
+        return session
+
+    def test_reusable(self):
+        assert self._cluster_reusable()
+
+    def test_not_pooled(self):
+        self.dtest_setup.cluster_pool_key = None
+        assert not self._cluster_reusable()
+
+    def test_dirty(self):
+        self.dtest_setup.mark_cluster_dirty()
+        assert not self._cluster_reusable()
+
+    def test_node_stopped(self):
+        self.nodes[1].is_running.return_value = False
+        assert not self._cluster_reusable()
+
+    def test_node_added(self):
+        self.nodes.append(self._node('node3'))
+        assert not self._cluster_reusable()
+
+    def test_configuration_changed(self):
+        with patch('dtest_setup.cluster_pool_key', return_value=((2,), '/cassandra', '4.0', "[('num_tokens', '16')]")):
+            assert not self.dtest_setup._cluster_reusable()
+
+    def test_ignored_errors(self):
+        self.dtest_setup.log_scanner.errors.side_effect = lambda node: ['ERROR boom'] if node.name == 'node2' else []
+        assert not self._cluster_reusable()
+
+    def test_reset_drops_user_keyspaces(self):
+        session = self._session(['system', 'system_auth', 'ks', 'other'])
+        self.dtest_setup._reset_cluster_for_reuse()
+        assert ['DROP KEYSPACE "ks"', 'DROP KEYSPACE "other"'] == \
+            [call[0][0] for call in session.execute.call_args_list]
+        session.cluster.shutdown.assert_called_once_with()
+        assert session not in self.dtest_setup.connections
+        for node in self.nodes:
+            node.nodetool.assert_called_once_with('clearsnapshot --all')
+
+    def test_reset_before_4_0(self):
+        self._session(['system'])
+        self.dtest_setup.cluster.version.return_value = '3.11'
+        self.dtest_setup._reset_cluster_for_reuse()
+        self.nodes[0].nodetool.assert_called_once_with('clearsnapshot')
+
+    def test_return_to_pool(self):
+        self._session(['system', 'ks'])
+        with patch('dtest_setup.cluster_pool_key', return_value=self.key):
+            assert self.dtest_setup._return_cluster_to_pool()
+        self.dtest_setup.cluster_pool.checkin.assert_called_once_with(self.key, self.dtest_setup.cluster,
+                                                                      self.dtest_setup.test_path)
+
+    def test_return_to_pool_fails_reset(self):
+        session = self._session(['system', 'ks'])
+        session.execute.side_effect = RuntimeError('timed out')
+        with patch('dtest_setup.cluster_pool_key', return_value=self.key):
+            assert not self.dtest_setup._return_cluster_to_pool()
+        assert not self.dtest_setup.cluster_pool.checkin.called
+        session.cluster.shutdown.assert_called_once_with()
+
+    def test_dirty_cluster_not_returned(self):
+        self.dtest_setup.mark_cluster_dirty()
+        assert not self.dtest_setup._return_cluster_to_pool()
+        assert not self.dtest_setup.cluster_pool.checkin.called
+
+
+class TestClusterJvmArgs(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        with patch.object(DTestSetup, 'get_test_path', return_value=os.path.join(self.tmp_dir, 'test')):
+            self.dtest_setup = DTestSetup(dtest_config=Mock(reuse_driver_sessions=False))
+        self.dtest_setup.cluster = Mock()
+        self.dtest_setup.cluster.get_path.return_value = self.tmp_dir
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_written_to_cassandra_in_sh_only(self):
+        self.dtest_setup._append_cluster_jvm_args(['-Xshare:auto'])
+        self.dtest_setup._append_cluster_jvm_args(['-javaagent:$CASSANDRA_CONF/../agent.jar'])
+        with open(os.path.join(self.tmp_dir, 'cassandra.in.sh')) as f:
+            assert '\nJVM_OPTS="$JVM_OPTS -Xshare:auto"\n\nJVM_OPTS="$JVM_OPTS -javaagent:$CASSANDRA_CONF/../agent.jar"\n' == \
+                f.read()
+        # tests pass jvm_args to node.start, which would apply the flags a second time
+        assert [] == self.dtest_setup.jvm_args
+
+    def test_jfr(self):
+        self.dtest_setup.dtest_config.profile_nodes = True
+        with patch('dtest_setup.is_win', return_value=False), \
+                patch('dtest_setup.java_executable'), \
+                patch('dtest_setup.java_version_output', return_value='java version "1.8.0_202"'):
+            self.dtest_setup.maybe_setup_jfr()
+        assert self.dtest_setup.jfr_recording
+        with open(os.path.join(self.tmp_dir, 'cassandra.in.sh')) as f:
+            assert '-XX:StartFlightRecording' in f.read()
+
+    def test_jfr_not_on_windows(self):
+        self.dtest_setup.dtest_config.profile_nodes = True
+        with patch('dtest_setup.is_win', return_value=True):
+            self.dtest_setup.maybe_setup_jfr()
+        # so the teardown doesn't try to dump a recording
+        assert not self.dtest_setup.jfr_recording
+        assert not os.path.exists(os.path.join(self.tmp_dir, 'cassandra.in.sh'))
+
+
+class TestReusableCqlConnection(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        self.node = Mock()
+        self.node.name = 'node1'
+        self.node.pid = 1234
+        self.node.is_running.return_value = True
+        self.node.cluster.version.return_value = '4.0'
+        self.node.network_interfaces = {'binary': ('127.0.0.1', 9042)}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def _dtest_setup(self, reuse_driver_sessions):
+        with patch.object(DTestSetup, 'get_test_path', return_value=os.path.join(self.tmp_dir, 'test')):
+            return DTestSetup(dtest_config=Mock(reuse_driver_sessions=reuse_driver_sessions))
+
+    @staticmethod
+    def _connect(*args, **kwargs):
+        session = Mock()
+        session.keyspace = None
+        session.is_shutdown = False
+        session.cluster.is_shutdown = False
+        return session
+
+    def test_reused_after_block(self):
+        dtest_setup = self._dtest_setup(reuse_driver_sessions=True)
+        with patch('dtest_setup.wait_for_native_transport'), \
+                patch('dtest_setup.PyCluster') as py_cluster:
+            py_cluster.return_value.connect.side_effect = self._connect
+            with dtest_setup.reusable_cql_connection(self.node, exclusive=True) as session:
+                # the session in use isn't handed to anybody else
+                with dtest_setup.reusable_cql_connection(self.node, exclusive=True) as other:
+                    assert other is not session
+            with dtest_setup.reusable_cql_connection(self.node, exclusive=True) as again:
+                assert again in (session, other)
+            # plain connections never get a reused session
+            assert dtest_setup.exclusive_cql_connection(self.node) not in (session, other)
+        assert not session.cluster.shutdown.called
+        assert 3 == len(dtest_setup.connections)
+
+    def test_shut_down_after_block_without_reuse(self):
+        dtest_setup = self._dtest_setup(reuse_driver_sessions=False)
+        with patch('dtest_setup.wait_for_native_transport'), \
+                patch('dtest_setup.PyCluster') as py_cluster:
+            py_cluster.return_value.connect.side_effect = self._connect
+            with dtest_setup.reusable_cql_connection(self.node) as session:
+                assert [session] == dtest_setup.connections
+        session.cluster.shutdown.assert_called_once_with()
+        assert [] == dtest_setup.connections
+
+
+class TestActiveLogWatch(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        with patch.object(DTestSetup, 'get_test_path', return_value=os.path.join(self.tmp_dir, 'test')):
+            self.dtest_setup = DTestSetup(dtest_config=Mock(reuse_driver_sessions=False))
+        self.node = Mock()
+        self.node.name = 'node1'
+        self.node.get_path.return_value = os.path.join(self.tmp_dir, 'node1')
+        os.makedirs(os.path.join(self.tmp_dir, 'node1', 'logs'))
+        self.ccm_watch_log_for = self.node.watch_log_for
+        self.dtest_setup.cluster = Mock()
+        self.dtest_setup.cluster.nodelist.return_value = [self.node]
+
+    def tearDown(self):
+        if self.dtest_setup.log_watch_thread is not None:
+            self.dtest_setup.stop_active_log_watch()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def _append(self, text):
+        with open(os.path.join(self.tmp_dir, 'node1', 'logs', 'system.log'), 'a') as f:
+            f.write(text)
+
+    def test_node_watches_routed_through_follower(self):
+        self._append("INFO  [main] Starting listening for CQL clients\n")
+        self.dtest_setup.begin_active_log_watch()
+        # waits on a node the follower already picked up
+        assert 'Starting listening' in self.dtest_setup.watch_log_for(self.node, 'Starting listening', timeout=10)[0]
+
+        line, _ = self.node.watch_log_for('Starting listening', from_mark=0, timeout=10)
+        assert 'INFO  [main] Starting listening for CQL clients' == line
+        assert not self.ccm_watch_log_for.called
+
+        # waits that watch the start process are left to ccm
+        process = Mock()
+        self.node.watch_log_for('Starting listening', process=process)
+        self.ccm_watch_log_for.assert_called_once_with('Starting listening', from_mark=None, timeout=600,
+                                                       process=process, verbose=False, filename='system.log')
+
+        self.dtest_setup.stop_active_log_watch()
+        assert self.ccm_watch_log_for is self.node.watch_log_for
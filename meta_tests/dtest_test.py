@@ -0,0 +1,121 @@
+import threading
+from types import SimpleNamespace
+from unittest import TestCase
+
+import pytest
+from mock import Mock, patch
+
+from dtest import MultiError, Tester, run_on_nodes
+
+
+def _node(name):
+    node = Mock()
+    node.name = name
+    return node
+
+
+class TestRunOnNodes(TestCase):
+
+    def test_results_by_node(self):
+        nodes = [_node('node1'), _node('node2'), _node('node3')]
+        results = run_on_nodes(nodes, lambda node: node.name.upper())
+        assert ['node1', 'node2', 'node3'] == list(results)
+        assert 'NODE2' == results['node2']
+
+    def test_runs_concurrently(self):
+        nodes = [_node('node1'), _node('node2')]
+        # would time out if the nodes were done one after the other
+        barrier = threading.Barrier(len(nodes), timeout=10)
+        run_on_nodes(nodes, lambda node: barrier.wait())
+
+    def test_errors_collected(self):
+        nodes = [_node('node1'), _node('node2'), _node('node3')]
+        done = []
+
+        def op(node):
+            if node.name != 'node2':
+                raise RuntimeError('{} failed'.format(node.name))
+            done.append(node.name)
+
+        with pytest.raises(MultiError) as e:
+            run_on_nodes(nodes, op)
+        assert ['node2'] == done
+        assert ['node1 failed', 'node3 failed'] == [str(exc) for exc in e.value.exceptions]
+        assert e.value.tracebacks[0].startswith('on node1:')
+
+    def test_single_error_raised_as_is(self):
+        nodes = [_node('node1'), _node('node2')]
+
+        def op(node):
+            if node.name == 'node2':
+                raise ValueError('node2 failed')
+
+        with pytest.raises(ValueError) as e:
+            run_on_nodes(nodes, op)
+        assert 'node2 failed' == str(e.value)
+
+    def test_no_nodes(self):
+        assert {} == run_on_nodes([], Mock())
+
+
+class TestWaitForQuiescence(TestCase):
+
+    def setUp(self):
+        self.nodes = [_node('node1'), _node('node2')]
+        for node in self.nodes:
+            node.get_cassandra_version.return_value = '4.0'
+        self.tester = Tester()
+        # Tester looks up what it doesn't have on its DTestSetup
+        self.tester.fixture_dtest_setup = SimpleNamespace(connections=[], cluster=Mock(),
+                                                          patient_exclusive_cql_connection=Mock())
+        self.tester.fixture_dtest_setup.cluster.nodelist.return_value = self.nodes
+        self.sessions = []
+
+        def connect(node, **kwargs):
+            session = Mock()
+            session.execute.return_value = [Mock(count=0)]
+            self.sessions.append(session)
+            self.tester.fixture_dtest_setup.connections.append(session)
+            return session
+        self.tester.fixture_dtest_setup.patient_exclusive_cql_connection.side_effect = connect
+
+    def _count_batches_and_fail(self, nodes, timeout, nodetool, count_batches):
+        assert 0 == count_batches(self.nodes[0])
+        assert 0 == count_batches(self.nodes[0])
+        raise RuntimeError('nodetool broke')
+
+    def test_batch_sessions_closed(self):
+        with patch('dtest.wait_for_quiescence', side_effect=self._count_batches_and_fail), \
+                pytest.raises(RuntimeError):
+            self.tester.wait_for_quiescence()
+        # a single session per node, shut down even though waiting failed
+        assert 1 == len(self.sessions)
+        self.sessions[0].cluster.shutdown.assert_called_once_with()
+        assert [] == self.tester.fixture_dtest_setup.connections
+
+    def test_no_sessions_without_batchlog(self):
+        with patch('dtest.wait_for_quiescence', return_value=True) as wait:
+            assert self.tester.wait_for_quiescence(timeout=30, check_batchlog=False)
+        assert 'count_batches' not in wait.call_args[1]
+        assert not self.sessions
+
+
+class TestJolokiaAgentsRunning(TestCase):
+
+    def setUp(self):
+        self.nodes = [_node('node1'), _node('node2'), _node('node3')]
+        self.tester = Tester()
+        self.tester.fixture_dtest_setup = SimpleNamespace(fast_nodetools={}, cluster=Mock())
+        self.tester.fixture_dtest_setup.cluster.nodelist.return_value = self.nodes
+        self.nodes[2].is_running.return_value = False
+
+    def test_stopped_nodes_ignored(self):
+        with patch('dtest.FastNodetool') as fast_nodetool:
+            fast_nodetool.return_value.has_agent.return_value = True
+            assert self.tester.jolokia_agents_running()
+        assert 2 == fast_nodetool.call_count
+
+    def test_node_without_agent(self):
+        with patch('dtest.FastNodetool') as fast_nodetool:
+            fast_nodetool.return_value.has_agent.side_effect = [True, False]
+            assert not self.tester.jolokia_agents_running()
@@ -0,0 +1,190 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import pytest
+from mock import Mock, patch
+
+from run_dtests import RunDTests, collect_tests, collection_cache_key, pump_output
+
+# writes to stdout and stderr in turn, leaving the pumps time to copy each write before the next
+INTERLEAVED_WRITER = """
+import sys, time
+for i in range(3):
+    for stream, name in ((sys.stdout, 'out'), (sys.stderr, 'err')):
+        stream.write('{}{} \\u00e9\\n'.format(name, i))
+        stream.flush()
+        time.sleep(0.05)
+"""
+
+# fills the stderr pipe well past its OS buffer before writing anything to stdout
+FLOODING_WRITER = """
+import sys
+sys.stderr.write('e' * 1024 * 1024)
+sys.stderr.flush()
+sys.stdout.write('done')
+"""
+
+
+def _pump(script, shared_destination=False):
+    sp = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out = io.StringIO()
+    err = out if shared_destination else io.StringIO()
+    pump_output(sp, {sp.stdout: out, sp.stderr: err})
+    assert 0 == sp.wait()
+    sp.stdout.close()
+    sp.stderr.close()
+    return out.getvalue(), err.getvalue()
+
+
+class TestPumpOutput(TestCase):
+
+    def test_interleaved_output(self):
+        out, err = _pump(INTERLEAVED_WRITER)
+        assert 'out0 é\nout1 é\nout2 é\n' == out
+        assert 'err0 é\nerr1 é\nerr2 é\n' == err
+
+    def test_copied_as_written(self):
+        # both pipes going to one stream keep the order the process wrote in
+        out, _ = _pump(INTERLEAVED_WRITER, shared_destination=True)
+        assert ['out0', 'err0', 'out1', 'err1', 'out2', 'err2'] == [line.split()[0] for line in out.splitlines()]
+
+    def test_characters_split_across_reads(self):
+        with patch('run_dtests.PUMP_CHUNK_SIZE', 1):
+            out, err = _pump(INTERLEAVED_WRITER)
+        assert 'out0 é\nout1 é\nout2 é\n' == out
+
+    def test_full_pipe_does_not_block_the_other(self):
+        out, err = _pump(FLOODING_WRITER)
+        assert 'done' == out
+        assert 1024 * 1024 == len(err)
+
+    def test_thread_per_pipe_on_windows(self):
+        with patch('run_dtests.is_win', return_value=True), \
+                patch('run_dtests.selectors.DefaultSelector') as selector:
+            out, err = _pump(INTERLEAVED_WRITER)
+        assert not selector.called
+        assert 'out0 é\nout1 é\nout2 é\n' == out
+        assert 'err0 é\nerr1 é\nerr2 é\n' == err
+
+
+class TestRunDTests(TestCase):
+
+    def _run(self, argv):
+        with patch.object(sys, 'argv', ['run_dtests.py'] + argv), \
+                patch('run_dtests.get_version_from_build', return_value='4.0'), \
+                pytest.raises(SystemExit) as e:
+            RunDTests().run(argv)
+        return e.value.code
+
+    def test_in_process(self):
+        with patch('run_dtests.pytest.main', return_value=3) as main, \
+                patch('run_dtests.subprocess.Popen') as popen:
+            assert 3 == self._run(['--cassandra-dir', '/cassandra', '--dtest-in-process', '--dtest-tests=cql_test.py'])
+        main.assert_called_once_with(['--cassandra-dir', '/cassandra', 'cql_test.py'])
+        assert not popen.called
+
+    def test_subprocess(self):
+        with patch('run_dtests.pytest.main') as main, \
+                patch('run_dtests.subprocess.Popen') as popen, \
+                patch('run_dtests.pump_output') as pump:
+            popen.return_value.returncode = 1
+            assert 1 == self._run(['--cassandra-dir', '/cassandra', '--pytest-options=-x'])
+        assert not main.called
+        assert [sys.executable, '-m', 'pytest', '-x', '--cassandra-dir', '/cassandra'] == popen.call_args[0][0]
+        sp = popen.return_value
+        pump.assert_called_once_with(sp, {sp.stdout: sys.stdout, sp.stderr: sys.stderr})
+
+
+class TestCollectionCache(TestCase):
+
+    def setUp(self):
+        self.dtest_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dtest_dir, '.collection_cache')
+        self.patches = [patch('run_dtests.DTEST_DIR', self.dtest_dir),
+                        patch('run_dtests.COLLECTION_CACHE_DIR', self.cache_dir)]
+        for p in self.patches:
+            p.start()
+        self._write('cql_test.py')
+        self._write('pytest.ini')
+        self.collections = 0
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.dtest_dir)
+
+    def _write(self, name, content='', mtime=None):
+        path = os.path.join(self.dtest_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def _popen(self, cmd_list, **kwargs):
+        # stands in for pytest with the collect_json plugin
+        self.collections += 1
+        collect_json = cmd_list[cmd_list.index('--collect-json') + 1]
+        with open(collect_json, 'w') as f:
+            json.dump([{'name': 'cql_test.py::TestCQL::test_{}'.format(self.collections), 'markers': []}], f)
+        sp = Mock(returncode=0)
+        sp.communicate.return_value = (b'', b'')
+        return sp
+
+    def _collect(self, args=('cql_test.py',)):
+        with patch('run_dtests.subprocess.Popen', side_effect=self._popen):
+            return [test['name'] for test in collect_tests(list(args))]
+
+    def test_key_depends_on_args(self):
+        assert collection_cache_key(['cql_test.py']) == collection_cache_key(['cql_test.py'])
+        assert collection_cache_key(['cql_test.py']) != collection_cache_key(['cql_test.py', '-m', 'not upgrade_test'])
+
+    def test_key_depends_on_test_files(self):
+        key = collection_cache_key([])
+        self._write('cql_test.py', mtime=1)
+        modified = collection_cache_key([])
+        assert key != modified
+        self._write('upgrade_tests/upgrade_test.py')
+        assert modified != collection_cache_key([])
+
+    def test_key_depends_on_ini_files(self):
+        key = collection_cache_key([])
+        self._write('pytest.ini', 'markers = x', mtime=1)
+        assert key != collection_cache_key([])
+
+    def test_key_ignores_other_files(self):
+        key = collection_cache_key([])
+        self._write('README.md')
+        self._write('logs/leftover.py')
+        self._write('__pycache__/cql_test.py')
+        self._write('.collection_cache/old.py')
+        assert key == collection_cache_key([])
+
+    def test_collection_cached(self):
+        assert ['cql_test.py::TestCQL::test_1'] == self._collect()
+        assert ['cql_test.py::TestCQL::test_1'] == self._collect()
+        assert 1 == self.collections
+        # no half written collections left behind
+        assert [collection_cache_key(['cql_test.py']) + '.json'] == os.listdir(self.cache_dir)
+
+    def test_cache_invalidated(self):
+        self._collect()
+        self._write('cql_test.py', 'def test_new(): pass', mtime=1)
+        assert ['cql_test.py::TestCQL::test_2'] == self._collect()
+        # other arguments are collected separately
+        assert ['cql_test.py::TestCQL::test_3'] == self._collect(['cql_test.py', '-m', 'resource_intensive'])
+
+    def test_failed_collection_not_cached(self):
+        sp = Mock(returncode=4)
+        sp.communicate.return_value = (b'no tests ran', b'')
+        with patch('run_dtests.subprocess.Popen', return_value=sp), \
+                pytest.raises(SystemExit) as e:
+            collect_tests(['cql_test.py'])
+        assert 4 == e.value.code
+        assert [] == os.listdir(self.cache_dir)
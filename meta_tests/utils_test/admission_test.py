@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock, patch
+from tools.admission import (DEFAULT_NODES, Footprint, RESOURCE_INTENSIVE_NODES, _fits, _live_reservations, admit,
+                             estimate_footprint, node_memory_mb)
+
+
+class TestEstimateFootprint(TestCase):
+
+    def _item(self, **markers):
+        item = Mock(name='item')
+        item.get_closest_marker.side_effect = lambda name: markers.get(name)
+        return item
+
+    def test_default(self):
+        assert Footprint(DEFAULT_NODES * node_memory_mb(), DEFAULT_NODES) == estimate_footprint(self._item())
+
+    def test_resource_intensive(self):
+        assert RESOURCE_INTENSIVE_NODES == estimate_footprint(self._item(resource_intensive=Mock())).cpus
+
+    def test_reusable_cluster_nodes(self):
+        assert 5 == estimate_footprint(self._item(reusable_cluster=Mock(kwargs={'nodes': [3, 2]}))).cpus
+        assert 1 == estimate_footprint(self._item(reusable_cluster=Mock(kwargs={'nodes': 1}),
+                                                  resource_intensive=Mock())).cpus
+
+    def test_heap_from_environment(self):
+        with patch.dict(os.environ, {'CCM_MAX_HEAP_SIZE': '512M'}):
+            assert 512 + 1024 == node_memory_mb()
+        with patch.dict(os.environ, {'CCM_MAX_HEAP_SIZE': '2G'}):
+            assert 2048 + 1024 == node_memory_mb()
+
+    def test_heap_defaults_to_ccm_default(self):
+        with patch.dict(os.environ, {'MAX_HEAP_SIZE': '8G'}):
+            os.environ.pop('CCM_MAX_HEAP_SIZE', None)
+            # ccm overwrites MAX_HEAP_SIZE for the nodes it starts
+            assert 500 + 1024 == node_memory_mb()
+        with patch.dict(os.environ, {'CCM_MAX_HEAP_SIZE': 'lots'}):
+            assert 500 + 1024 == node_memory_mb()
+
+
+class TestAdmission(TestCase):
+
+    def setUp(self):
+        self.reservation_dir = tempfile.mkdtemp()
+        self.patches = [patch('tools.admission.RESERVATION_DIR', self.reservation_dir),
+                        patch('tools.admission.platform.system', return_value='Linux'),
+                        patch('tools.admission.host_capacity', return_value=Footprint(memory_mb=10000, cpus=8)),
+                        patch('tools.admission.psutil.virtual_memory', return_value=Mock(available=8000 * 1024 * 1024))]
+        for p in self.patches:
+            p.start()
+        self.reservations = []
+
+    def tearDown(self):
+        for reservation in self.reservations:
+            reservation.release()
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.reservation_dir)
+
+    def _admit(self, memory_mb, cpus, **kwargs):
+        reservation = admit(Footprint(memory_mb=memory_mb, cpus=cpus), **kwargs)
+        self.reservations.append(reservation)
+        return reservation
+
+    def test_fits(self):
+        capacity = Footprint(memory_mb=10000, cpus=8)
+        assert _fits(Footprint(4000, 4), [Footprint(4000, 4)], capacity)
+        # too many CPUs
+        assert not _fits(Footprint(1000, 5), [Footprint(4000, 4)], capacity)
+        # more memory than the capacity
+        assert not _fits(Footprint(7000, 1), [Footprint(4000, 4)], capacity)
+
+    def test_fits_available_memory(self):
+        # 8000MB available and 4000MB reserved: something else uses the rest of the 10000MB
+        capacity = Footprint(memory_mb=20000, cpus=8)
+        assert _fits(Footprint(8000, 1), [Footprint(4000, 1)], capacity)
+        assert not _fits(Footprint(8001, 1), [Footprint(4000, 1)], capacity)
+
+    def test_fits_alone(self):
+        assert _fits(Footprint(100000, 100), [], Footprint(memory_mb=10000, cpus=8))
+
+    def test_live_reservations(self):
+        self._admit(1000, 1)
+        self._admit(2000, 2)
+        # left behind by a process that died without releasing it
+        with open(os.path.join(self.reservation_dir, 'reservation-dead.json'), 'w') as f:
+            json.dump({'memory_mb': 4000, 'cpus': 4}, f)
+        open(os.path.join(self.reservation_dir, 'other-file'), 'w').close()
+
+        assert [Footprint(1000, 1), Footprint(2000, 2)] == sorted(_live_reservations())
+        assert not os.path.exists(os.path.join(self.reservation_dir, 'reservation-dead.json'))
+
+    def test_release(self):
+        reservation = self._admit(1000, 1)
+        reservation.release()
+        # releasing twice is harmless
+        reservation.release()
+        assert [] == _live_reservations()
+
+    def test_admitted_when_room(self):
+        with patch('tools.admission.time.sleep') as sleep:
+            self._admit(4000, 4)
+            self._admit(4000, 4)
+        assert not sleep.called
+        assert 2 == len(_live_reservations())
+
+    def test_queued_until_room(self):
+        first = self._admit(6000, 4)
+        with patch('tools.admission.time.sleep', side_effect=lambda delay: first.release()) as sleep:
+            self._admit(6000, 4)
+        assert 1 == sleep.call_count
+        assert [Footprint(6000, 4)] == _live_reservations()
+
+    def test_runs_anyway_after_timeout(self):
+        self._admit(6000, 4)
+        with patch('tools.admission.time.sleep'), \
+                patch('tools.admission.time.time', side_effect=[0, 0, 0, 11, 11, 11]):
+            self._admit(6000, 4, timeout=10)
+        assert 2 == len(_live_reservations())
+
+    def test_not_limited_off_linux(self):
+        with patch('tools.admission.platform.system', return_value='Darwin'):
+            self._admit(100000, 100)
+        assert not os.listdir(self.reservation_dir)
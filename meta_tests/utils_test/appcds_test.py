@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+from tools import appcds, jdk
+
+JDK_8 = 'openjdk version "1.8.0_292"\nOpenJDK Runtime Environment (build 1.8.0_292-b10)\n'
+JDK_11 = 'openjdk version "11.0.11" 2021-04-20\nOpenJDK Runtime Environment (build 11.0.11+9)\n'
+
+
+class TestJavaFeatureVersion(TestCase):
+
+    def test_versions(self):
+        assert 8 == jdk.java_feature_version(JDK_8)
+        assert 11 == jdk.java_feature_version(JDK_11)
+        assert 17 == jdk.java_feature_version('openjdk version "17" 2021-09-14\n')
+
+    def test_unknown(self):
+        assert jdk.java_feature_version(None) is None
+        assert jdk.java_feature_version('command not found') is None
+
+
+class TestAppCDSArchiveCache(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.java_version = patch('tools.appcds.java_version_output', return_value=JDK_11).start()
+        patch('tools.appcds.cassandra_git_sha', return_value='abc123').start()
+        patch('tools.appcds.is_win', return_value=False).start()
+        self.addCleanup(patch.stopall)
+        self.cache = appcds.AppCDSArchiveCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_records_classes_without_archive(self):
+        assert ['-XX:DumpLoadedClassList={}'.format(appcds.CLASS_LIST_JVM_PATH)] == self.cache.jvm_args('/cassandra')
+
+    def test_uses_existing_archive(self):
+        archive = os.path.join(self.cache_dir, '{}.jsa'.format(appcds.appcds_archive_key('/cassandra', JDK_11)))
+        open(archive, 'w').close()
+        assert ['-Xshare:auto', '-XX:SharedArchiveFile={}'.format(archive)] == self.cache.jvm_args('/cassandra')
+
+    def test_archive_per_build(self):
+        key = appcds.appcds_archive_key('/cassandra', JDK_11)
+        assert key != appcds.appcds_archive_key('/cassandra-4.0', JDK_11)
+        assert key != appcds.appcds_archive_key('/cassandra', JDK_8)
+        with patch('tools.appcds.cassandra_git_sha', return_value='def456'):
+            assert key != appcds.appcds_archive_key('/cassandra', JDK_11)
+
+    def test_nothing_on_old_jdk(self):
+        self.java_version.return_value = JDK_8
+        assert [] == self.cache.jvm_args('/cassandra')
+
+
+class TestLongestClassList(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_longest_list_of_started_nodes(self):
+        paths = [os.path.join(self.tmp_dir, name) for name in ('node1', 'node2', 'node3')]
+        with open(paths[0], 'w') as f:
+            f.write('java/lang/Object\njava/lang/String\n')
+        with open(paths[1], 'w') as f:
+            f.write('java/lang/Object\njava/lang/String\n\njava/util/HashMap\n')
+        assert ['java/lang/Object', 'java/lang/String', 'java/util/HashMap'] == appcds.longest_class_list(paths)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import yaml
+from mock import Mock
+from tools.cluster_pool import ClusterPool, cluster_pool_key, normalize_node_counts, saved_config_options
+
+
+class TestClusterPoolKey(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cluster = self._cluster(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def _cluster(path):
+        cluster = Mock()
+        cluster.get_path.return_value = path
+        cluster.get_install_dir.return_value = '/cassandra'
+        cluster.version.return_value = '4.0'
+        return cluster
+
+    def _save_config(self, config_options):
+        with open(os.path.join(self.tmp_dir, 'cluster.conf'), 'w') as f:
+            yaml.safe_dump({'name': 'test', 'config_options': config_options}, f)
+
+    def test_normalize_node_counts(self):
+        assert (3,) == normalize_node_counts(3)
+        assert (2, 2) == normalize_node_counts([2, 2])
+
+    def test_unconfigured_cluster(self):
+        assert {} == saved_config_options(self.cluster)
+        assert ((3,), '/cassandra', '4.0', '[]') == cluster_pool_key(self.cluster, 3)
+
+    def test_same_options_same_key(self):
+        self._save_config({'num_tokens': 1, 'phi_convict_threshold': 5})
+        other_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(other_dir, 'cluster.conf'), 'w') as f:
+                yaml.safe_dump({'config_options': {'phi_convict_threshold': 5, 'num_tokens': 1}}, f)
+            assert cluster_pool_key(self.cluster, [1, 1]) == cluster_pool_key(self._cluster(other_dir), [1, 1])
+        finally:
+            shutil.rmtree(other_dir)
+
+    def test_options_change_key(self):
+        self._save_config({'num_tokens': 1})
+        key = cluster_pool_key(self.cluster, 3)
+        self._save_config({'num_tokens': 16})
+        assert key != cluster_pool_key(self.cluster, 3)
+
+    def test_topology_changes_key(self):
+        assert cluster_pool_key(self.cluster, 2) != cluster_pool_key(self.cluster, [1, 1])
+
+    def test_version_changes_key(self):
+        key = cluster_pool_key(self.cluster, 3)
+        self.cluster.version.return_value = '4.1'
+        assert key != cluster_pool_key(self.cluster, 3)
+
+
+class TestClusterPool(TestCase):
+
+    def setUp(self):
+        self.pool = ClusterPool()
+        self.test_paths = []
+
+    def tearDown(self):
+        for test_path in self.test_paths:
+            shutil.rmtree(test_path, ignore_errors=True)
+
+    def _test_path(self):
+        test_path = tempfile.mkdtemp()
+        self.test_paths.append(test_path)
+        return test_path
+
+    def test_checkout_same_key(self):
+        cluster, test_path = Mock(), self._test_path()
+        self.pool.checkin('key', cluster, test_path)
+        pooled = self.pool.checkout('key')
+        assert (cluster, test_path) == (pooled.cluster, pooled.test_path)
+        assert not cluster.remove.called
+        assert os.path.isdir(test_path)
+        assert self.pool.checkout('key') is None
+
+    def test_checkout_other_key_evicts(self):
+        cluster, test_path = Mock(), self._test_path()
+        self.pool.checkin('key', cluster, test_path)
+        assert self.pool.checkout('other key') is None
+        cluster.remove.assert_called_once_with()
+        assert not os.path.exists(test_path)
+
+    def test_checkin_keeps_one_cluster(self):
+        first, second = Mock(), Mock()
+        self.pool.checkin('key', first, self._test_path())
+        self.pool.checkin('other key', second, self._test_path())
+        first.remove.assert_called_once_with()
+        assert second is self.pool.checkout('other key').cluster
+
+    def test_clear_removes_test_path_when_remove_fails(self):
+        cluster, test_path = Mock(), self._test_path()
+        cluster.remove.side_effect = OSError('busy')
+        self.pool.checkin('key', cluster, test_path)
+        with self.assertRaises(OSError):
+            self.pool.clear()
+        assert not os.path.exists(test_path)
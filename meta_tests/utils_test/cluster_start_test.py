@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from mock import Mock
+from tools.cluster_start import GOSSIP_STARTED, split_nodes, start_nodes
+
+
+class TestStartNodes(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.events = []
+        self.lock = threading.Lock()
+        self.cluster = Mock()
+        self.node1 = self._node('node1', '127.0.0.1')
+        self.node2 = self._node('node2', '127.0.0.2')
+        self.node3 = self._node('node3', '127.0.0.3')
+        self.cluster.seeds = [self.node1]
+        self.cluster.get_seeds.return_value = ['127.0.0.1']
+        self.cluster.nodelist.return_value = [self.node1, self.node2, self.node3]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _record(self, *event):
+        with self.lock:
+            self.events.append(event)
+
+    def _node(self, name, address, auto_bootstrap=False, started_before=True):
+        node = Mock(auto_bootstrap=auto_bootstrap, mark=0)
+        node.name = name
+        node.network_interfaces = {'storage': (address, 7000)}
+        node.logfilename.return_value = os.path.join(self.tmp_dir, name + '.log')
+        if started_before:
+            open(node.logfilename.return_value, 'w').close()
+        running = []
+        node.is_running.side_effect = lambda: bool(running)
+        node.is_live.side_effect = lambda: bool(running)
+
+        def start(**kwargs):
+            self._record('start', name, kwargs.get('wait_other_notice'))
+            running.append(True)
+        node.start.side_effect = start
+        node.watch_log_for.side_effect = lambda expr, **kwargs: self._record('watch', name, expr)
+        node.watch_log_for_alive.side_effect = lambda others, **kwargs: self._record('alive', name, len(others))
+        return node
+
+    def test_seeds_gossip_before_others_start(self):
+        started = start_nodes(self.cluster)
+        assert [self.node1, self.node2, self.node3] == started
+        assert ('start', 'node1', False) == self.events[0]
+        assert ('watch', 'node1', GOSSIP_STARTED) == self.events[1]
+        assert {('start', 'node2', False), ('start', 'node3', False)} == set(self.events[2:4])
+        # every node waits on the other two together
+        assert [('alive', name, 2) for name in ('node1', 'node2', 'node3')] == self.events[4:]
+        for node in started:
+            node.wait_for_binary_interface.assert_called_once_with(from_mark=0, timeout=120)
+
+    def test_bootstrapping_nodes_start_last(self):
+        node4 = self._node('node4', '127.0.0.4', auto_bootstrap=True, started_before=False)
+        node5 = self._node('node5', '127.0.0.5', auto_bootstrap=True, started_before=False)
+        self.cluster.nodelist.return_value = [self.node1, self.node2, self.node3, node4, node5]
+        seeds, others, bootstrapping = split_nodes(self.cluster, self.cluster.nodelist())
+        assert ([self.node1], [self.node2, self.node3], [node4, node5]) == (seeds, others, bootstrapping)
+
+        start_nodes(self.cluster)
+        assert [('start', 'node4', True), ('start', 'node5', True)] == self.events[-2:]
+
+    def test_running_nodes_skipped(self):
+        self.node1.start()
+        self.events = []
+        assert [self.node2, self.node3] == start_nodes(self.cluster, wait_for_binary_proto=False)
+        assert not any(event[:2] == ('start', 'node1') for event in self.events)
+        # the running seed sees both new nodes, and they see each other
+        assert ('alive', 'node1', 2) in self.events
+        assert ('alive', 'node2', 1) in self.events
+        assert not self.node2.wait_for_binary_interface.called
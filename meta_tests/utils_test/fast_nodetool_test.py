@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+from mock import Mock
+from tools.fast_nodetool import FastNodetool, format_compactionstats, format_tpstats
+from tools.nodetool_parsers import parse_compactionstats
+
+
+class TestFormatTpstats(TestCase):
+
+    def test_format(self):
+        thread_pools = {
+            'org.apache.cassandra.metrics:name=ActiveTasks,path=request,scope=ReadStage,type=ThreadPools': {'Value': 1},
+            'org.apache.cassandra.metrics:name=PendingTasks,path=request,scope=ReadStage,type=ThreadPools': {'Value': 2},
+            'org.apache.cassandra.metrics:name=CompletedTasks,path=request,scope=ReadStage,type=ThreadPools': {'Value': 30},
+            'org.apache.cassandra.metrics:name=CurrentlyBlockedTasks,path=request,scope=ReadStage,type=ThreadPools': {'Count': 0},
+            'org.apache.cassandra.metrics:name=TotalBlockedTasks,path=request,scope=ReadStage,type=ThreadPools': {'Count': 4}}
+        dropped = {'org.apache.cassandra.metrics:name=Dropped,scope=MUTATION,type=DroppedMessage': {'Count': 5}}
+        lines = format_tpstats(thread_pools, dropped).splitlines()
+        assert ['ReadStage', '1', '2', '30', '0', '4'] == lines[1].split()
+        assert ['MUTATION', '5'] == lines[-1].split()
+
+
+class TestFastNodetool(TestCase):
+
+    def setUp(self):
+        self.node = Mock(pid=10)
+        self.node.name = 'node1'
+        self.node.is_running.return_value = True
+        self.node.nodetool.return_value = ('out', '', 0)
+        self.fast_nodetool = FastNodetool(self.node)
+        self.jmx = self.fast_nodetool.jmx = Mock()
+        self.jmx.is_agent_running.return_value = True
+
+    def test_flush_through_agent(self):
+        assert ('', '', 0) == self.fast_nodetool.nodetool('flush ks tbl1 tbl2')
+        self.jmx.execute_method.assert_called_once_with(
+            'org.apache.cassandra.db:type=StorageService',
+            'forceKeyspaceFlush(java.lang.String,[Ljava.lang.String;)', ['ks', ['tbl1', 'tbl2']])
+        assert not self.node.nodetool.called
+
+    def test_unsupported_command(self):
+        assert ('out', '', 0) == self.fast_nodetool.nodetool('status')
+        assert ('out', '', 0) == self.fast_nodetool.nodetool('compact --split-output ks')
+        assert 2 == self.node.nodetool.call_count
+
+    def test_without_agent(self):
+        self.jmx.is_agent_running.return_value = False
+        self.fast_nodetool.nodetool('drain')
+        self.fast_nodetool.nodetool('drain')
+        self.node.nodetool.assert_called_with('drain')
+        # checked once per node process
+        assert 1 == self.jmx.is_agent_running.call_count
+
+    def test_has_agent(self):
+        assert self.fast_nodetool.has_agent()
+        self.node.is_running.return_value = False
+        assert not self.fast_nodetool.has_agent()
+
+    def test_falls_back_on_failure(self):
+        self.jmx.execute_method.side_effect = Exception('Jolokia agent returned non-200 status')
+        assert ('out', '', 0) == self.fast_nodetool.nodetool('replaybatchlog')
+        self.node.nodetool.assert_called_once_with('replaybatchlog')
+
+
+class TestFormatCompactionstats(TestCase):
+
+    def test_parsed_back(self):
+        compactions = [{'compactionId': '8d5ed9f4-7764-4dbd-bad8-43fddce94b7c', 'id': 'ignored',
+                        'taskType': 'Anticompaction after repair', 'keyspace': 'ks', 'columnfamily': 'cf',
+                        'completed': '10', 'total': '40', 'unit': 'bytes'}]
+        stats = parse_compactionstats(format_compactionstats(3, compactions))
+        assert 3 == stats.pending_tasks
+        assert [('8d5ed9f4-7764-4dbd-bad8-43fddce94b7c', 'Anticompaction after repair', 'ks', 'cf', 10, 40, 'bytes',
+                 25.0)] == stats.active
+
+    def test_idle(self):
+        assert 'pending tasks: 0\n' == format_compactionstats(0, [])
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from tools import jfr
+
+
+def _frame(class_name, method_name):
+    return {'method': {'type': {'name': class_name}, 'name': method_name}}
+
+
+def _event(event_type, frames, **values):
+    values['stackTrace'] = {'truncated': False, 'frames': frames}
+    return {'type': event_type, 'values': values}
+
+
+class TestJfrJvmArgs(TestCase):
+
+    def test_oracle_jdk_8(self):
+        version = 'java version "1.8.0_202"\nJava(TM) SE Runtime Environment (build 1.8.0_202-b08)\n'
+        assert ['-XX:+UnlockCommercialFeatures', '-XX:+FlightRecorder'] == jfr.jfr_jvm_args(version)
+
+    def test_openjdk_8(self):
+        version = 'openjdk version "1.8.0_292"\nOpenJDK Runtime Environment (build 1.8.0_292-b10)\n'
+        assert ['-XX:+FlightRecorder'] == jfr.jfr_jvm_args(version)
+
+    def test_jdk_11(self):
+        version = 'openjdk version "11.0.11" 2021-04-20\nOpenJDK Runtime Environment (build 11.0.11+9)\n'
+        assert [] == jfr.jfr_jvm_args(version)
+        assert ['-XX:StartFlightRecording=name=dtest,settings=profile,dumponexit=true,filename=/tmp/r.jfr'] == \
+            jfr.recording_jvm_args(version, '/tmp/r.jfr')
+
+
+class TestSummarizeEvents(TestCase):
+
+    def test_summary(self):
+        flush = _frame('org.apache.cassandra.db.Memtable', 'flush')
+        events = [_event('jdk.ExecutionSample', [flush]),
+                  _event('jdk.ExecutionSample', [flush]),
+                  _event('jdk.ExecutionSample', [_frame('java.lang.String', 'hashCode'), flush]),
+                  _event('jdk.ObjectAllocationSample', [_frame('java.util.ArrayList', 'grow'), flush],
+                         objectClass={'name': 'java.lang.Object[]'}, weight=2 * 1024 * 1024),
+                  _event('jdk.JavaMonitorEnter', [flush], monitorClass={'name': 'java.lang.Object'},
+                         duration='PT0.25S'),
+                  _event('jdk.ThreadPark', [_frame('jdk.internal.misc.Unsafe', 'park'), flush],
+                         parkedClass=None, duration='PT1M0.5S')]
+        summary = jfr.summarize_events(events)
+        assert '       2  66.67%  org.apache.cassandra.db.Memtable.flush' in summary
+        assert '       1  33.33%  java.lang.String.hashCode' in summary
+        assert '       2.0MB  java.lang.Object[] in org.apache.cassandra.db.Memtable.flush' in summary
+        assert 'Lock contention (60.750s blocked):' in summary
+        assert '    60.500s  <unknown> in org.apache.cassandra.db.Memtable.flush' in summary
+
+    def test_empty_recording(self):
+        assert 'Top methods on CPU (0 samples):' in jfr.summarize_events([])
@@ -0,0 +1,101 @@
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import pytest
+from mock import Mock, patch
+from tools.jmxutils import JOLOKIA_PORT, JolokiaAgent, jolokia_startup_jvm_args
+
+
+def _response(body, status=200):
+    response = Mock(status=status)
+    response.read.return_value = json.dumps(body).encode('utf-8')
+    return response
+
+
+class TestJolokiaAgent(TestCase):
+
+    def setUp(self):
+        node = Mock()
+        node.network_interfaces = {'binary': ('127.0.0.1', 9042), 'storage': ('127.0.0.2', 7000)}
+        self.agent = JolokiaAgent(node)
+        self.connection_class = patch('tools.jmxutils.http.client.HTTPConnection').start()
+        self.addCleanup(patch.stopall)
+        self.connection = self.connection_class.return_value
+
+    def _sent(self, call):
+        return json.loads(call[1]['body'].decode('utf-8'))
+
+    def test_connects_to_storage_address(self):
+        self.connection.getresponse.return_value = _response({'status': 200, 'value': 1})
+        self.agent.read_attribute('org.apache.cassandra.db:type=Tables', 'Count')
+        assert ('127.0.0.2', JOLOKIA_PORT) == self.connection_class.call_args[0]
+
+    def test_connection_kept_open(self):
+        self.connection.getresponse.side_effect = [_response({'status': 200, 'value': 1}),
+                                                   _response({'status': 200, 'value': 2})]
+        assert 1 == self.agent.read_attribute('org.apache.cassandra.db:type=Tables', 'Count')
+        assert 2 == self.agent.read_attribute('org.apache.cassandra.db:type=Tables', 'Count')
+        assert 1 == self.connection_class.call_count
+
+    def test_reconnects_when_closed_by_agent(self):
+        self.connection.getresponse.side_effect = [_response({'status': 200, 'value': 1}),
+                                                   http.client.RemoteDisconnected(),
+                                                   _response({'status': 200, 'value': 2})]
+        self.agent.read_attribute('org.apache.cassandra.db:type=Tables', 'Count')
+        assert 2 == self.agent.read_attribute('org.apache.cassandra.db:type=Tables', 'Count')
+        assert 2 == self.connection_class.call_count
+
+    def test_read_many(self):
+        self.connection.getresponse.return_value = _response([{'status': 200, 'value': 3},
+                                                              {'status': 200, 'value': 0.5}])
+        mbean = 'org.apache.cassandra.metrics:type=ReadRepair,name=RepairedBlocking'
+        values = self.agent.read_many([(mbean, 'Count'), (mbean, 'OneMinuteRate', 'x')])
+        assert {(mbean, 'Count'): 3, (mbean, 'OneMinuteRate', 'x'): 0.5} == values
+
+        [sent] = [self._sent(call) for call in self.connection.request.call_args_list]
+        assert [{'type': 'read', 'mbean': mbean, 'attribute': 'Count'},
+                {'type': 'read', 'mbean': mbean, 'attribute': 'OneMinuteRate', 'path': 'x'}] == sent
+
+    def test_bulk_failure(self):
+        self.connection.getresponse.return_value = _response([{'status': 200, 'value': 3},
+                                                              {'status': 404, 'error': 'no such mbean'}])
+        with pytest.raises(Exception, match='non-200 status'):
+            self.agent.bulk([{'type': 'read', 'mbean': 'a', 'attribute': 'Count'},
+                             {'type': 'read', 'mbean': 'b', 'attribute': 'Count'}], verbose=False)
+
+    def test_connects_to_agent_loaded_at_startup(self):
+        self.connection.getresponse.return_value = _response({'status': 200, 'value': {'agent': '1.2.3'}})
+        with patch('tools.jmxutils.subprocess.check_output') as check_output:
+            self.agent.start()
+            self.agent.stop()
+        assert not check_output.called
+
+    def test_attaches_agent(self):
+        self.connection.getresponse.side_effect = ConnectionRefusedError()
+        with patch('tools.jmxutils.subprocess.check_output') as check_output:
+            self.agent.start()
+            self.agent.stop()
+        assert 2 == check_output.call_count
+        assert 'start' in check_output.call_args_list[0][0][0]
+        assert '127.0.0.2' in check_output.call_args_list[0][0][0]
+        assert 'stop' in check_output.call_args_list[1][0][0]
+
+
+class TestJolokiaStartupJvmArgs(TestCase):
+
+    @pytest.mark.skipif(sys.platform.startswith('win'), reason="cassandra.in.sh is only sourced on Unix")
+    def test_listens_on_listen_address(self):
+        conf_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, conf_dir)
+        with open(os.path.join(conf_dir, 'cassandra.yaml'), 'w') as f:
+            f.write("rpc_address: 127.0.0.1\nlisten_address: 127.0.0.2\n")
+        [agent] = jolokia_startup_jvm_args()
+        expanded = subprocess.check_output(['sh', '-c', 'echo "{}"'.format(agent)],
+                                           env={'CASSANDRA_CONF': conf_dir}).decode('utf-8').strip()
+        assert expanded.endswith('=host=127.0.0.2,port={}'.format(JOLOKIA_PORT))
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from unittest import TestCase
+
+from mock import Mock, patch
+from tools.jfr import RECORDING_FILE
+from tools.log_archive import LogArchiver, _LogSlice
+
+
+class TestLogArchiver(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.tmp_dir, 'saved')
+        self.node = Mock(name='node')
+        self.node.name = 'node1'
+        self.node.logfilename.return_value = os.path.join(self.tmp_dir, 'system.log')
+        self.node.debuglogfilename.return_value = os.path.join(self.tmp_dir, 'debug.log')
+        self.node.gclogfilename.return_value = os.path.join(self.tmp_dir, 'gc.log')
+        self.node.compactionlogfilename.return_value = os.path.join(self.tmp_dir, 'compaction.log')
+        self.node.get_path.return_value = self.tmp_dir
+        self.cluster = Mock(name='cluster')
+        self.cluster.nodelist.return_value = [self.node]
+        with open(self.node.logfilename(), 'w') as f:
+            f.write('a' * 100 + 'b' * 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _archive(self, archiver, full, errors=None):
+        archiver.archive(self.cluster, self.log_dir, 'test', os.path.join(self.log_dir, 'last'), full=full, errors=errors)
+        archiver.wait()
+        with tarfile.open(os.path.join(self.log_dir, 'last')) as tar:
+            return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+
+    def test_full_archive(self):
+        assert {'node1.log': b'a' * 100 + b'b' * 10} == self._archive(LogArchiver(tail_bytes=10), full=True)
+
+    def test_profile_saved_whole(self):
+        os.mkdir(os.path.join(self.tmp_dir, 'logs'))
+        with open(os.path.join(self.tmp_dir, 'logs', RECORDING_FILE), 'wb') as f:
+            f.write(b'j' * 100)
+        contents = self._archive(LogArchiver(tail_bytes=10), full=False)
+        assert b'j' * 100 == contents['node1.jfr']
+
+    def test_tail_and_errors(self):
+        contents = self._archive(LogArchiver(tail_bytes=10), full=False, errors={'node1': [['ERROR boom', '\tat x']]})
+        assert {'node1.log.tail': b'b' * 10, 'node1_errors.txt': b'ERROR boom\n\tat x\n'} == contents
+
+    def test_log_removed_before_archive_is_written(self):
+        archiver = LogArchiver(tail_bytes=10)
+        archiver.archive(self.cluster, self.log_dir, 'test', os.path.join(self.log_dir, 'last'), full=True)
+        os.unlink(self.node.logfilename())
+        archiver.wait()
+        with tarfile.open(os.path.join(self.log_dir, 'test.tar.gz')) as tar:
+            assert b'a' * 100 + b'b' * 10 == tar.extractfile('node1.log').read()
+
+    def test_last_linked_once_written(self):
+        archiver = LogArchiver(tail_bytes=10)
+        last_link = os.path.join(self.log_dir, 'last')
+        writing = threading.Event()
+        add_to = _LogSlice.add_to
+
+        def slow_add_to(log_slice, tar):
+            writing.wait(10)
+            add_to(log_slice, tar)
+
+        with patch('tools.log_archive._LogSlice.add_to', slow_add_to):
+            archiver.archive(self.cluster, self.log_dir, 'test', last_link, full=True)
+            assert not os.path.lexists(last_link)
+            writing.set()
+            archiver.wait()
+        assert 'test.tar.gz' == os.readlink(last_link)
+
+    def test_synchronous(self):
+        assert {'node1.log': b'a' * 100 + b'b' * 10} == self._archive(LogArchiver(tail_bytes=10, background=False), full=True)
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+import pytest
+from ccmlib.node import TimeoutError
+from mock import Mock, patch
+from tools.log_follower import LogFollower
+
+
+class TestLogFollower(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.node = self._node('node1')
+        self.cluster = Mock()
+        self.cluster.nodelist.return_value = [self.node]
+        self.errors = []
+        self.follower = None
+
+    def tearDown(self):
+        if self.follower is not None:
+            self.follower.join(timeout=10)
+        shutil.rmtree(self.tmp_dir)
+
+    def _node(self, name):
+        node = Mock()
+        node.name = name
+        node.get_path.return_value = os.path.join(self.tmp_dir, name)
+        os.makedirs(os.path.join(self.tmp_dir, name, 'logs'))
+        return node
+
+    def _log(self, node=None):
+        return os.path.join((node or self.node).get_path(), 'logs', 'system.log')
+
+    def _append(self, text, node=None):
+        with open(self._log(node), 'a') as f:
+            f.write(text)
+
+    def _start(self, on_error=None, start_marks=None):
+        self.follower = LogFollower(self.cluster, on_error=on_error or self.errors.append, start_marks=start_marks)
+        self.follower.start()
+        return self.follower
+
+    def _append_later(self, text, delay=0.2):
+        timer = threading.Timer(delay, self._append, (text,))
+        timer.start()
+        return timer
+
+    def test_watch_for_across_appends(self):
+        self._append("INFO  [main] starting\n")
+        follower = self._start()
+        timer = self._append_later("INFO  [main] Starting listening for CQL clients\n")
+        line, _ = follower.watch_for(self.node, 'Starting listening', timeout=10)
+        timer.join()
+        assert 'INFO  [main] Starting listening for CQL clients' == line
+
+        # several expressions, matched by lines written at different times
+        mark = follower.mark(self.node)
+        self._append("INFO  [main] first\n")
+        timer = self._append_later("INFO  [main] sec")
+        self._append_later("ond\n", delay=0.4)
+        matchings = follower.watch_for(self.node, ['first', 'second'], from_mark=mark, timeout=10)
+        timer.join()
+        assert ['INFO  [main] first', 'INFO  [main] second'] == [line for line, _ in matchings]
+
+    def test_watch_for_skips_lines_before_mark(self):
+        self._append("INFO  [main] ready\n")
+        follower = self._start()
+        mark = follower.mark(self.node)
+        with pytest.raises(TimeoutError):
+            follower.watch_for(self.node, 'ready', from_mark=mark, timeout=0.5)
+
+    def test_errors_reported(self):
+        self._start()
+        self._append("ERROR [main] boom\n\tat Foo.bar\nINFO  [main] done\n")
+        self.follower.join(timeout=10)
+        assert [{'node1': [['ERROR [main] boom', '\tat Foo.bar']]}] == self.errors
+
+    def test_start_marks(self):
+        self._append("ERROR [main] before the test\n")
+        self._start(start_marks={'node1': os.path.getsize(self._log())})
+        self._append("ERROR [main] during the test\n")
+        self.follower.join(timeout=10)
+        assert [{'node1': [['ERROR [main] during the test']]}] == self.errors
+
+    def test_rotation(self):
+        self._append("INFO  [main] {}\n".format('x' * 1000))
+        follower = self._start()
+        follower.watch_for(self.node, 'xxx', timeout=10)
+
+        rotated = self._log() + '.new'
+        with open(rotated, 'w') as f:
+            f.write("ERROR [main] after rotation\n")
+        os.rename(rotated, self._log())
+        line, _ = follower.watch_for(self.node, 'after rotation', from_mark=0, timeout=10)
+        assert 'ERROR [main] after rotation' == line
+        follower.join(timeout=10)
+        assert [{'node1': [['ERROR [main] after rotation']]}] == self.errors
+
+    def test_added_node(self):
+        follower = self._start()
+        node2 = self._node('node2')
+        self.cluster.nodelist.return_value = [self.node, node2]
+        threading.Timer(0.2, self._append, ("INFO  [main] node2 up\n", node2)).start()
+        assert 'INFO  [main] node2 up' == follower.watch_for(node2, 'node2 up', timeout=10)[0]
+
+    def test_new_nodes_reported_once(self):
+        seen = []
+        self.follower = LogFollower(self.cluster, on_new_node=seen.append)
+        self.follower.start()
+        self._append("INFO  [main] node1 up\n")
+        self.follower.watch_for(self.node, 'node1 up', timeout=10)
+        node2 = self._node('node2')
+        self.cluster.nodelist.return_value = [self.node, node2]
+        threading.Timer(0.2, self._append, ("INFO  [main] node2 up\n", node2)).start()
+        self.follower.watch_for(node2, 'node2 up', timeout=10)
+        self.follower.join(timeout=10)
+        assert [self.node, node2] == seen
+
+    def test_polling_without_inotify(self):
+        with patch('tools.log_follower._Inotify.create', return_value=None), \
+                patch('tools.log_follower.POLL_INTERVAL', 0.01):
+            follower = self._start()
+            self._append_later("ERROR [main] boom\n")
+            assert 'ERROR [main] boom' == follower.watch_for(self.node, 'boom', timeout=10)[0]
+            follower.join(timeout=10)
+        assert not follower.is_alive()
+        assert [{'node1': [['ERROR [main] boom']]}] == self.errors
+
+    def test_callback_errors_recorded(self):
+        def on_error(errordata):
+            raise RuntimeError('handler bug')
+
+        self._start(on_error=on_error)
+        self._append("ERROR [main] boom\n")
+        self.follower.join(timeout=10)
+        assert ['handler bug'] == [str(e) for e in self.follower.callback_errors]
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock
+from tools.log_scanner import LogErrorScanner, matches_any_pattern
+
+
+class TestLogErrorScanner(TestCase):
+
+    def setUp(self):
+        self.node_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.node_dir, 'logs'))
+        self.log = os.path.join(self.node_dir, 'logs', 'system.log')
+        # like a ccm node that mark_log_for_errors() was never called on
+        self.node = Mock(name='node', spec=['get_path'])
+        self.node.get_path.return_value = self.node_dir
+        self.scanner = LogErrorScanner()
+
+    def tearDown(self):
+        shutil.rmtree(self.node_dir)
+
+    def _append(self, text):
+        with open(self.log, 'a') as f:
+            f.write(text)
+
+    def test_missing_log(self):
+        assert [] == self.scanner.scan(self.node)
+
+    def test_error_with_stack_trace(self):
+        self._append("INFO  [main] starting\nERROR [main] boom\n\tat Foo.bar\nINFO  [main] done\n")
+        assert [['ERROR [main] boom', '\tat Foo.bar']] == self.scanner.scan(self.node)
+
+    def test_warn_only_reported_with_exception(self):
+        self._append("WARN  [main] slow\nWARN  [main] java.io.IOException: oops\n")
+        assert [['WARN  [main] java.io.IOException: oops']] == self.scanner.scan(self.node)
+
+    def test_scan_only_reads_new_lines(self):
+        self._append("ERROR [main] first\n")
+        assert [['ERROR [main] first']] == self.scanner.scan(self.node)
+        self._append("ERROR [main] second\n")
+        assert [['ERROR [main] second']] == self.scanner.scan(self.node)
+        assert [] == self.scanner.scan(self.node)
+
+    def test_errors_accumulate(self):
+        self._append("ERROR [main] first\n")
+        self.scanner.scan(self.node)
+        self._append("ERROR [main] second\n")
+        assert [['ERROR [main] first'], ['ERROR [main] second']] == self.scanner.errors(self.node)
+
+    def test_stack_trace_split_across_scans(self):
+        self._append("ERROR [main] boom\n\tat Foo.bar\n")
+        self.scanner.scan(self.node)
+        self._append("\tat Foo.baz\nINFO  [main] done\n")
+        assert [] == self.scanner.scan(self.node)
+        assert [['ERROR [main] boom', '\tat Foo.bar', '\tat Foo.baz']] == self.scanner.errors(self.node)
+
+    def test_incomplete_line_left_for_next_scan(self):
+        self._append("ERR")
+        assert [] == self.scanner.scan(self.node)
+        self._append("OR [main] boom\n")
+        assert [['ERROR [main] boom']] == self.scanner.scan(self.node)
+
+    def test_mark_skips_existing_errors(self):
+        self._append("ERROR [main] old\n")
+        self.scanner.mark(self.node)
+        self._append("ERROR [main] new\n")
+        assert [['ERROR [main] new']] == self.scanner.errors(self.node)
+
+    def _mark_log_for_errors(self):
+        # what ccm's node.mark_log_for_errors() does
+        self.node.error_mark = os.path.getsize(self.log)
+
+    def test_error_mark_before_first_scan(self):
+        self._append("ERROR [main] expected\n")
+        self._mark_log_for_errors()
+        self._append("ERROR [main] new\n")
+        assert [['ERROR [main] new']] == self.scanner.errors(self.node)
+
+    def test_error_mark_after_scans(self):
+        self._append("ERROR [main] expected\n")
+        assert [['ERROR [main] expected']] == self.scanner.errors(self.node)
+        self._mark_log_for_errors()
+        assert [] == self.scanner.errors(self.node)
+        self._append("ERROR [main] new\n")
+        assert [['ERROR [main] new']] == self.scanner.errors(self.node)
+
+    def test_error_mark_behind_scan(self):
+        self._append("ERROR [main] expected\n")
+        self._mark_log_for_errors()
+        self._append("ERROR [main] new\n")
+        self.node.error_mark, mark = 0, self.node.error_mark
+        assert 2 == len(self.scanner.errors(self.node))
+        # the scanner already read past the mark, the errors after it are still reported
+        self.node.error_mark = mark
+        assert [['ERROR [main] new']] == self.scanner.errors(self.node)
+
+
+class TestMatchesAnyPattern(TestCase):
+
+    def test_no_patterns(self):
+        assert not matches_any_pattern([], 'anything')
+
+    def test_matches_any(self):
+        assert matches_any_pattern(['foo', r'ba+r'], 'xx baaar xx')
+        assert not matches_any_pattern(('foo', 'bar'), 'baz')
+
+    def test_alternation_inside_pattern(self):
+        assert matches_any_pattern(['a|b', 'c'], 'b')
+        assert not matches_any_pattern(['^a|^b', 'c'], 'xb')
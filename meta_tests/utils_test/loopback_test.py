@@ -0,0 +1,111 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+from mock import Mock, patch
+from tools.loopback import LoopbackLease, _shift_port
+from tools.misc import new_node
+
+
+class TestLoopbackLease(TestCase):
+
+    def setUp(self):
+        self.lease_dir = tempfile.mkdtemp()
+        self.patches = [patch('tools.loopback.LEASE_DIR', self.lease_dir),
+                        patch('tools.loopback.platform.system', return_value='Linux')]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.lease_dir)
+
+    def test_acquire_distinct_blocks(self):
+        first = LoopbackLease.acquire()
+        second = LoopbackLease.acquire()
+        try:
+            assert (1, 2) == (first.block, second.block)
+            assert '127.0.2.' == second.ipprefix
+            assert 2 == second.port_offset
+        finally:
+            first.release()
+            second.release()
+
+    def test_release_frees_block(self):
+        first = LoopbackLease.acquire()
+        first.release()
+        # releasing twice is harmless
+        first.release()
+        second = LoopbackLease.acquire()
+        try:
+            assert 1 == second.block
+        finally:
+            second.release()
+
+    def test_all_blocks_leased(self):
+        with patch('tools.loopback.MAX_BLOCK', 1):
+            lease = LoopbackLease.acquire()
+            try:
+                with pytest.raises(RuntimeError):
+                    LoopbackLease.acquire()
+            finally:
+                lease.release()
+
+    def test_default_block_off_linux(self):
+        with patch('tools.loopback.platform.system', return_value='Darwin'):
+            assert 0 == LoopbackLease.acquire().block
+
+
+class TestApply(TestCase):
+
+    def test_shift_port(self):
+        assert '7103' == _shift_port('7100', 3)
+        assert '2003' == _shift_port(2000, 3)
+        assert '0' == _shift_port('0', 3)
+        assert _shift_port(None, 3) is None
+
+    def test_apply(self):
+        cluster = Mock()
+        add = cluster.add
+        LoopbackLease(3).apply(cluster)
+        cluster.set_ipprefix.assert_called_once_with('127.0.3.')
+
+        node = Mock(jmx_port='7100', remote_debug_port='0', byteman_port='4000')
+        cluster.add(node, True, data_center='dc1')
+        assert ('7103', '0', '4003') == (node.jmx_port, node.remote_debug_port, node.byteman_port)
+        node.import_config_files.assert_called_once_with()
+        add.assert_called_once_with(node, True, data_center='dc1')
+
+    def test_default_block_left_alone(self):
+        cluster = Mock()
+        add = cluster.add
+        LoopbackLease(0).apply(cluster)
+        assert not cluster.set_ipprefix.called
+        assert add is cluster.add
+
+    def test_ccm_without_set_ipprefix(self):
+        cluster = Mock(spec=['add', 'populate'])
+        add = cluster.add
+        with pytest.raises(RuntimeError) as e:
+            LoopbackLease(3).apply(cluster)
+        assert 'set_ipprefix' in str(e.value)
+        assert add is cluster.add
+
+
+class TestNewNode(TestCase):
+
+    def test_default_addresses_without_get_ipprefix(self):
+        cluster = Mock(spec=['nodes', 'add'], nodes={'node1': Mock(), 'node2': Mock()})
+        with patch('tools.misc.Node') as node_class:
+            new_node(cluster)
+        args = node_class.call_args[0]
+        assert ('node3', ('127.0.0.3', 9160), ('127.0.0.3', 7000)) == (args[0], args[3], args[4])
+
+    def test_leased_addresses(self):
+        cluster = Mock(nodes={})
+        cluster.get_ipprefix.return_value = '127.0.3.'
+        with patch('tools.misc.Node') as node_class:
+            new_node(cluster)
+        assert ('127.0.3.1', 9042) == node_class.call_args[1]['binary_interface']
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import yaml
+from mock import Mock
+from tools.node_templates import NodeTemplateCache, copy_tree, node_template_key
+
+
+class TestNodeTemplates(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = NodeTemplateCache(os.path.join(self.tmp_dir, 'templates'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def _cluster(self, name, node_count=2):
+        cluster_path = os.path.join(self.tmp_dir, name)
+        cluster = Mock()
+        cluster.get_path.return_value = cluster_path
+        nodes = []
+        for i in range(1, node_count + 1):
+            node = Mock()
+            node.name = 'node{}'.format(i)
+            node.get_path.return_value = os.path.join(cluster_path, node.name)
+            os.makedirs(os.path.join(node.get_path.return_value, 'conf'))
+            nodes.append(node)
+        cluster.nodelist.return_value = nodes
+        return cluster
+
+    def _sstable(self, node):
+        return os.path.join(node.get_path(), 'data0', 'system', 'local', 'nb-1-big-Data.db')
+
+    def test_key(self):
+        cluster = Mock(spec=['name', 'get_path', 'get_install_dir', 'version'])
+        cluster.name = 'test'
+        cluster.get_path.return_value = self.tmp_dir
+        cluster.get_install_dir.return_value = '/cassandra'
+        cluster.version.return_value = '4.0'
+        # ccm without get_ipprefix
+        key = node_template_key(cluster, 3, 1)
+        assert key == node_template_key(cluster, [3], 1)
+        assert key != node_template_key(cluster, 3, 2)
+
+        with open(os.path.join(self.tmp_dir, 'cluster.conf'), 'w') as f:
+            yaml.safe_dump({'config_options': {'num_tokens': 16}}, f)
+        assert key != node_template_key(cluster, 3, 1)
+
+    def test_key_changes_with_rebuild(self):
+        install_dir = os.path.join(self.tmp_dir, 'cassandra')
+        jar = os.path.join(install_dir, 'build', 'apache-cassandra-4.0-SNAPSHOT.jar')
+        self._write(os.path.join(install_dir, 'build.xml'), '<project/>')
+        self._write(jar, 'jar')
+        os.utime(jar, (1000, 1000))
+        cluster = Mock(spec=['name', 'get_path', 'get_install_dir', 'version'])
+        cluster.name = 'test'
+        cluster.get_path.return_value = self.tmp_dir
+        cluster.get_install_dir.return_value = install_dir
+        cluster.version.return_value = '4.0'
+        key = node_template_key(cluster, 3, 1)
+        assert key == node_template_key(cluster, 3, 1)
+
+        # ant jar on the same checkout
+        os.utime(jar, (2000, 2000))
+        assert key != node_template_key(cluster, 3, 1)
+
+    def test_save_and_materialize(self):
+        source = self._cluster('source')
+        for node in source.nodelist():
+            self._write(self._sstable(node), 'sstable of ' + node.name)
+            self._write(os.path.join(node.get_path(), 'commitlogs', 'CommitLog-7-1.log'), 'commitlog')
+            self._write(os.path.join(node.get_path(), 'logs', 'system.log'), 'not part of the template')
+
+        assert not self.cache.has_template('key')
+        self.cache.save('key', source)
+        assert self.cache.has_template('key')
+        # no staging directory left behind
+        assert ['key'] == os.listdir(self.cache.cache_dir)
+        assert not os.path.exists(os.path.join(self.cache.cache_dir, 'key', 'node1', 'logs'))
+
+        target = self._cluster('target')
+        stale = os.path.join(target.nodelist()[0].get_path(), 'commitlogs', 'stale.log')
+        self._write(stale, 'stale')
+        self.cache.materialize('key', target)
+        for node in target.nodelist():
+            assert 'sstable of ' + node.name == self._read(self._sstable(node))
+            assert 1 == os.stat(self._sstable(node)).st_nlink
+        assert not os.path.exists(stale)
+
+    def test_materialized_files_are_not_shared(self):
+        source = self._cluster('source', node_count=1)
+        self._write(self._sstable(source.nodelist()[0]), 'original')
+        self.cache.save('key', source)
+
+        target = self._cluster('target', node_count=1)
+        self.cache.materialize('key', target)
+        self._write(self._sstable(target.nodelist()[0]), 'rewritten')
+        assert 'original' == self._read(os.path.join(self.cache.cache_dir, 'key', 'node1', 'data0', 'system',
+                                                     'local', 'nb-1-big-Data.db'))
+
+    def test_save_again_keeps_first_template(self):
+        source = self._cluster('source', node_count=1)
+        self._write(self._sstable(source.nodelist()[0]), 'first')
+        self.cache.save('key', source)
+        self._write(self._sstable(source.nodelist()[0]), 'second')
+        self.cache.save('key', source)
+        assert ['key'] == os.listdir(self.cache.cache_dir)
+
+    def test_copy_tree(self):
+        src = os.path.join(self.tmp_dir, 'src')
+        self._write(os.path.join(src, 'a', 'b-Data.db'), 'data')
+        copy_tree(src, os.path.join(self.tmp_dir, 'dst', 'copy'))
+        copied = os.path.join(self.tmp_dir, 'dst', 'copy', 'a', 'b-Data.db')
+        assert 'data' == self._read(copied)
+        assert 1 == os.stat(copied).st_nlink
@@ -0,0 +1,235 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+from tools import nodetool_parsers
+from tools.nodetool_parsers import (parse_compactionstats, parse_gcstats, parse_netstats, parse_size, parse_status,
+                                    parse_tablestats, parse_tpstats)
+
+STATUS_21 = """Datacenter: datacenter1
+=======================
+Status=Up/Down
+|/ State=Normal/Leaving/Joining/Moving
+--  Address    Load       Tokens  Owns (effective)  Host ID                               Rack
+UN  127.0.0.1  47.66 KB   256     66.7%             8d5ed9f4-7764-4dbd-bad8-43fddce94b7c  rack1
+DN  127.0.0.2  ?          256     33.3%             a1b2c3d4-7764-4dbd-bad8-43fddce94b7c  rack1
+"""
+
+STATUS_40 = """Datacenter: dc1
+===============
+Status=Up/Down
+|/ State=Normal/Leaving/Joining/Moving
+--  Address    Load       Owns (effective)  Host ID                               Token                                    Rack
+UJ  127.0.0.1  70.2 KiB   100.0%            8d5ed9f4-7764-4dbd-bad8-43fddce94b7c  -9223372036854775808                     rack1
+"""
+
+TPSTATS_21 = """Pool Name                    Active   Pending      Completed   Blocked  All time blocked
+MutationStage                     0         0             12         0                 0
+ReadStage                         2         5             40         0                 0
+Native-Transport-Requests         0         0              7         0                 1
+
+Message type           Dropped
+READ                         0
+MUTATION                     3
+"""
+
+TPSTATS_40 = """Pool Name                    Active Pending Completed Blocked All time blocked
+CompactionExecutor           0      0       30        0       0
+ValidationExecutor           0      0       0         n/a     n/a
+
+Message type         Dropped                  Latency waiting in queue (micros)
+                                             50%               95%               99%               Max
+READ_RSP                   0               0.00              0.00              0.00              0.00
+MUTATION_REQ               2               0.00              0.00              0.00              0.00
+"""
+
+CFSTATS_21 = """Keyspace: ks
+\tRead Count: 0
+\tWrite Count: 10
+\t\tTable: cf
+\t\tSSTable count: 2
+\t\tSpace used (live): 5120
+\t\tSpace used (total): 6144
+\t\tSSTables in each level: [2, 0, 0, 0, 0, 0, 0, 0, 0]
+"""
+
+TABLESTATS_40 = """Total number of tables: 40
+----------------
+Keyspace : ks
+\tRead Count: 0
+\t\tTable: cf
+\t\tSSTable count: 1
+\t\tSpace used (live): 1.5 KiB
+\t\tSpace used (total): 1.5 KiB
+\t\tTable: cf2
+\t\tSSTable count: 0
+\t\tSpace used (live): 0
+\t\tSpace used (total): 0
+"""
+
+NETSTATS_21 = """Mode: NORMAL
+Not sending any streams.
+Read Repair Statistics:
+Attempted: 0
+Mismatch (Blocking): 1
+Mismatch (Background): 0
+Pool Name                    Active   Pending      Completed
+Commands                        n/a         0            123
+Responses                       n/a         2            456
+"""
+
+NETSTATS_40 = """Mode: JOINING
+Bootstrap 8d5ed9f4-7764-4dbd-bad8-43fddce94b7c
+    /127.0.0.2
+        Receiving 3 files, 1024 bytes total. Already received 1 files, 512 bytes total
+Read Repair Statistics:
+Attempted: 0
+Mismatch (Blocking): 0
+Mismatch (Background): 0
+Pool Name                    Active   Pending      Completed   Dropped
+Large messages                  n/a         0              0         0
+Small messages                  n/a         1             10         4
+"""
+
+COMPACTIONSTATS_21 = """pending tasks: 1
+   compaction type   keyspace   table   completed   total    unit   progress
+        Compaction         ks      cf        1234    5678   bytes     21.73%
+Active compaction remaining time :   0h00m00s
+"""
+
+COMPACTIONSTATS_40 = """pending tasks: 2
+- ks.cf: 2
+
+id                                   compaction type             keyspace table completed total unit  progress
+8d5ed9f4-7764-4dbd-bad8-43fddce94b7c Anticompaction after repair ks       cf    10        40    bytes 25.00%
+Active compaction remaining time :   0h00m00s
+"""
+
+GCSTATS = """       Interval (ms) Max GC Elapsed (ms)Total GC Elapsed (ms)Stdev GC Elapsed (ms)   GC Reclaimed (MB)         Collections      Direct Memory Bytes
+               12345                  20                  35                 NaN                 100                   2               4096
+"""
+
+
+class TestParseSize(TestCase):
+
+    def test_units(self):
+        assert 1024.0 == parse_size('1024')
+        assert 1536.0 == parse_size('1.5 KB')
+        assert 1536.0 == parse_size('1.5 KiB')
+        assert 2 * 1024 ** 3 == parse_size('2 GiB')
+        assert 10.0 == parse_size('10 bytes')
+        assert parse_size('?') is None
+
+
+class TestParsers(TestCase):
+
+    def test_status_21(self):
+        up, down = parse_status(STATUS_21)
+        assert ('datacenter1', 'U', 'N', '127.0.0.1') == (up.datacenter, up.status, up.state, up.address)
+        assert 47.66 * 1024 == up.load_bytes
+        assert 256 == up.tokens
+        assert 66.7 == up.owns
+        assert '8d5ed9f4-7764-4dbd-bad8-43fddce94b7c' == up.host_id
+        assert 'rack1' == up.rack
+        assert down.load_bytes is None
+        assert 'D' == down.status
+
+    def test_status_40_token_per_node(self):
+        [node] = parse_status(STATUS_40)
+        assert ('dc1', 'J') == (node.datacenter, node.state)
+        assert 70.2 * 1024 == node.load_bytes
+        assert 1 == node.tokens
+        assert 100.0 == node.owns
+        assert '8d5ed9f4-7764-4dbd-bad8-43fddce94b7c' == node.host_id
+        assert 'rack1' == node.rack
+
+    def test_tpstats_21(self):
+        stats = parse_tpstats(TPSTATS_21)
+        assert ['MutationStage', 'ReadStage', 'Native-Transport-Requests'] == list(stats.pools)
+        assert (2, 5, 40, 0, 0) == stats.pools['ReadStage']
+        assert 1 == stats.pools['Native-Transport-Requests'].all_time_blocked
+        assert {'READ': 0, 'MUTATION': 3} == stats.dropped
+
+    def test_tpstats_40(self):
+        stats = parse_tpstats(TPSTATS_40)
+        assert (0, 0, 0, None, None) == stats.pools['ValidationExecutor']
+        assert {'READ_RSP': 0, 'MUTATION_REQ': 2} == stats.dropped
+
+    def test_cfstats_21(self):
+        [table] = parse_tablestats(CFSTATS_21)
+        assert ('ks', 'cf', 2) == (table.keyspace, table.table, table.sstable_count)
+        assert 5120.0 == table.space_used_live
+        assert 6144.0 == table.space_used_total
+        assert '[2, 0, 0, 0, 0, 0, 0, 0, 0]' == table.attributes['SSTables in each level']
+        assert 'Read Count' not in table.attributes
+
+    def test_tablestats_40(self):
+        cf, cf2 = parse_tablestats(TABLESTATS_40)
+        assert ('ks', 'cf', 1536.0) == (cf.keyspace, cf.table, cf.space_used_total)
+        assert ('ks', 'cf2', 0) == (cf2.keyspace, cf2.table, cf2.sstable_count)
+
+    def test_netstats_21(self):
+        stats = parse_netstats(NETSTATS_21)
+        assert 'NORMAL' == stats.mode
+        assert not stats.streaming
+        assert 1 == stats.read_repair['Mismatch (Blocking)']
+        assert (None, 2, 456, None) == stats.pools['Responses']
+
+    def test_netstats_40(self):
+        stats = parse_netstats(NETSTATS_40)
+        assert 'JOINING' == stats.mode
+        assert stats.streaming
+        assert ['Large messages', 'Small messages'] == list(stats.pools)
+        assert (None, 1, 10, 4) == stats.pools['Small messages']
+
+    def test_compactionstats_21(self):
+        stats = parse_compactionstats(COMPACTIONSTATS_21)
+        assert 1 == stats.pending_tasks
+        [compaction] = stats.active
+        assert (None, 'Compaction', 'ks', 'cf') == compaction[:4]
+        assert (1234, 5678, 'bytes', 21.73) == compaction[4:]
+
+    def test_compactionstats_40(self):
+        stats = parse_compactionstats(COMPACTIONSTATS_40)
+        assert 2 == stats.pending_tasks
+        assert {'ks.cf': 2} == stats.pending_by_table
+        [compaction] = stats.active
+        assert '8d5ed9f4-7764-4dbd-bad8-43fddce94b7c' == compaction.id
+        assert 'Anticompaction after repair' == compaction.compaction_type
+        assert 25.0 == compaction.progress
+
+    def test_compactionstats_idle(self):
+        assert (0, {}, []) == parse_compactionstats('pending tasks: 0\n')
+
+    def test_gcstats(self):
+        stats = parse_gcstats(GCSTATS)
+        assert 12345 == stats.interval_ms
+        assert 2 == stats.collections
+        assert 4096 == stats.direct_memory_bytes
+
+
+class TestCache(TestCase):
+
+    def setUp(self):
+        nodetool_parsers.clear_cache()
+        self.node = Mock()
+        self.node.get_path.return_value = '/tmp/test/node1'
+        self.node.nodetool.return_value = (TPSTATS_21, '', 0)
+
+    def test_cached_within_ttl(self):
+        with patch('tools.nodetool_parsers.time.time', side_effect=[100.0, 101.0, 103.0]):
+            first = nodetool_parsers.tpstats(self.node)
+            assert first is nodetool_parsers.tpstats(self.node)
+            assert 1 == self.node.nodetool.call_count
+            nodetool_parsers.tpstats(self.node)
+        assert 2 == self.node.nodetool.call_count
+
+    def test_no_ttl(self):
+        nodetool_parsers.tpstats(self.node, ttl=0)
+        nodetool_parsers.tpstats(self.node, ttl=0)
+        assert 2 == self.node.nodetool.call_count
+
+    def test_keyed_by_command(self):
+        nodetool_parsers.tpstats(self.node)
+        self.node.nodetool.return_value = (CFSTATS_21, '', 0)
+        assert 6144.0 == nodetool_parsers.tablestats(self.node, 'ks', 'cf').space_used_total
+        self.node.nodetool.assert_called_with('cfstats ks.cf')
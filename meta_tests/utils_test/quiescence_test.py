@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from cassandra import OperationTimedOut
+from cassandra.cluster import NoHostAvailable
+from mock import Mock, patch
+from tools.quiescence import busy_reason, hint_targets, wait_for_quiescence
+
+HOST_ID1 = '8d5ed9f4-7764-4dbd-bad8-43fddce94b7c'
+HOST_ID2 = 'a1b2c3d4-7764-4dbd-bad8-43fddce94b7c'
+
+IDLE_TPSTATS = """Pool Name                    Active   Pending      Completed   Blocked  All time blocked
+MutationStage                     0         0             12         0                 0
+CompactionExecutor                0         0              3         0                 0
+"""
+
+BUSY_TPSTATS = """Pool Name                    Active   Pending      Completed   Blocked  All time blocked
+MutationStage                     0         0             12         0                 0
+CompactionExecutor                1         2              3         0                 0
+"""
+
+STATUS = """Datacenter: datacenter1
+=======================
+--  Address    Load       Tokens  Owns (effective)  Host ID                               Rack
+UN  127.0.0.1  47.66 KB   1       50.0%             {}  rack1
+DN  127.0.0.2  ?          1       50.0%             {}  rack1
+""".format(HOST_ID1, HOST_ID2)
+
+
+def _describecluster(*versions):
+    return "Cluster Information:\n\tName: test\n\tSchema versions:\n" + \
+        "".join("\t\t{}: [{}]\n\n".format(version, ', '.join(addresses)) for version, addresses in versions)
+
+
+class TestQuiescence(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.node1 = self._node('node1', '127.0.0.1')
+        self.node2 = self._node('node2', '127.0.0.2')
+        self.outputs = {'tpstats': IDLE_TPSTATS,
+                        'compactionstats': 'pending tasks: 4\n',
+                        'status': STATUS,
+                        'describecluster': _describecluster(('v1', ['127.0.0.1:7000', '127.0.0.2:7000']))}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _node(self, name, address, release='4.0'):
+        node = Mock()
+        node.name = name
+        node.address.return_value = address
+        node.get_cassandra_version.return_value = release
+        node.get_path.return_value = os.path.join(self.tmp_dir, name)
+        os.makedirs(os.path.join(self.tmp_dir, name, 'hints'))
+        return node
+
+    def _nodetool(self, node, cmd):
+        return self.outputs[cmd], '', 0
+
+    def _busy_reason(self, **kwargs):
+        return busy_reason([self.node1, self.node2], self._nodetool, **kwargs)
+
+    def _add_hints(self, node, host_id):
+        open(os.path.join(node.get_path(), 'hints', '{}-1600000000000-1.hints'.format(host_id)), 'w').close()
+
+    def test_idle(self):
+        # the estimated pending compactions don't count
+        assert self._busy_reason() is None
+
+    def test_busy_pool(self):
+        self.outputs['tpstats'] = BUSY_TPSTATS
+        assert 'node1 has active or pending tasks in CompactionExecutor' == self._busy_reason()
+
+    def test_running_compaction(self):
+        self.outputs['compactionstats'] = """pending tasks: 1
+   compaction type   keyspace   table   completed   total    unit   progress
+        Compaction         ks      cf        1234    5678   bytes     21.73%
+"""
+        assert 'node1 is running 1 compactions' == self._busy_reason()
+
+    def test_hints_for_live_node(self):
+        self._add_hints(self.node2, HOST_ID1)
+        assert 'node2 has hints for nodes that are up' == self._busy_reason()
+
+    def test_hints_for_down_node_ignored(self):
+        self._add_hints(self.node1, HOST_ID2)
+        assert {HOST_ID2} == hint_targets(self.node1)
+        assert self._busy_reason() is None
+
+    def test_batchlog(self):
+        assert 'node2 has 3 batches in its batchlog' == \
+            self._busy_reason(count_batches=lambda node: 3 if node is self.node2 else 0)
+
+    def test_schema_disagreement(self):
+        self.outputs['describecluster'] = _describecluster(('v1', ['127.0.0.1']), ('v2', ['127.0.0.2']))
+        reason = self._busy_reason()
+        assert reason.startswith("nodes disagree on the schema: {'4.0': ")
+        assert 'v1' in reason and 'v2' in reason
+
+    def test_releases_compared_separately(self):
+        self.node2.get_cassandra_version.return_value = '3.11'
+        self.outputs['describecluster'] = _describecluster(('v1', ['127.0.0.1']), ('v2', ['127.0.0.2']),
+                                                           ('UNREACHABLE', ['127.0.0.3']))
+        assert self._busy_reason() is None
+
+    def test_waits_until_idle(self):
+        tpstats = [BUSY_TPSTATS, IDLE_TPSTATS]
+        nodetool = Mock(side_effect=lambda node, cmd: (tpstats.pop(0) if cmd == 'tpstats' else self.outputs[cmd], '', 0))
+        with patch('tools.quiescence.sleep_until_next_attempt') as sleep:
+            assert wait_for_quiescence([self.node1], timeout=10, nodetool=nodetool)
+        assert 1 == sleep.call_count
+
+    def test_driver_errors_mean_busy(self):
+        errors = [NoHostAvailable('down', {}), OperationTimedOut('slow')]
+
+        def count_batches(node):
+            if errors:
+                raise errors.pop(0)
+            return 0
+
+        with patch('tools.quiescence.sleep_until_next_attempt') as sleep:
+            assert wait_for_quiescence([self.node1], timeout=10, nodetool=self._nodetool, count_batches=count_batches)
+        assert 2 == sleep.call_count
+
+    def test_timeout(self):
+        self.outputs['tpstats'] = BUSY_TPSTATS
+        with patch('tools.quiescence.sleep_until_next_attempt'), \
+                patch('tools.quiescence.time.time', side_effect=[0, 0, 5, 11, 11]):
+            assert not wait_for_quiescence([self.node1], timeout=10, nodetool=self._nodetool)
+
+    def test_stopped_nodes_skipped(self):
+        self.node1.is_running.return_value = False
+        nodetool = Mock()
+        assert wait_for_quiescence([self.node1], nodetool=nodetool)
+        assert not nodetool.called
@@ -0,0 +1,38 @@
+import socket
+from itertools import islice
+from unittest import TestCase
+
+from mock import Mock
+from tools.readiness import backoff_delays, wait_for_native_transport
+
+
+class TestBackoffDelays(TestCase):
+
+    def test_delays_grow_up_to_maximum(self):
+        delays = list(islice(backoff_delays(initial=0.1, maximum=0.4), 6))
+        assert 0.05 <= delays[0] <= 0.1
+        assert 0.1 <= delays[1] <= 0.2
+        assert all(0.2 <= delay <= 0.4 for delay in delays[3:])
+
+
+class TestWaitForNativeTransport(TestCase):
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.node = Mock(name='node')
+        self.node.network_interfaces = {'binary': self.server.getsockname()}
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_listening(self):
+        self.server.listen(1)
+        assert wait_for_native_transport(self.node, timeout=5)
+
+    def test_not_listening(self):
+        assert not wait_for_native_transport(self.node, timeout=0.2)
+
+    def test_no_binary_interface(self):
+        self.node.network_interfaces = {'binary': None}
+        assert wait_for_native_transport(self.node, timeout=0.2)
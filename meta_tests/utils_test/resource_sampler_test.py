@@ -0,0 +1,70 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock, patch
+from tools.resource_sampler import NodeSamples, ResourceSampler, SAMPLES_FILE, SUMMARY_FILE
+
+
+class TestNodeSamples(TestCase):
+
+    def test_summary_adds_up_restarts(self):
+        samples = NodeSamples()
+        # time, pid, cpu_seconds, rss_bytes, read_bytes, write_bytes, open_files, threads
+        samples.append((0.0, 10, 1.0, 100, 0, 1000, 50, 20))
+        samples.append((1.0, 10, 1.5, 300, 0, 3000, 60, 30))
+        samples.append((2.0, 11, 0.5, 200, 0, 500, 40, 25))
+        summary = samples.summary()
+        assert 3 == summary['samples']
+        assert 2.0 == summary['duration_seconds']
+        assert 1.0 == summary['cpu_seconds']
+        assert 50.0 == summary['cpu_percent']
+        assert 2500 == summary['write_bytes']
+        assert 300 == summary['max_rss_bytes']
+        assert 200 == summary['mean_rss_bytes']
+        assert 60 == summary['max_open_files']
+
+    def test_unavailable_fields(self):
+        samples = NodeSamples()
+        samples.append((0.0, 10, 1.0, 100, float('nan'), float('nan'), 50, 20))
+        samples.append((1.0, 10, 1.5, 100, float('nan'), float('nan'), 50, 20))
+        summary = samples.summary()
+        assert summary['read_bytes'] is None
+        json.dumps(summary, allow_nan=False)
+
+
+class TestResourceSampler(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'logs'))
+        self.node = Mock(pid=10)
+        self.node.name = 'node1'
+        self.node.get_path.return_value = self.tmp_dir
+        self.stopped_node = Mock(pid=None)
+        self.stopped_node.name = 'node2'
+        patch('tools.resource_sampler.psutil.Process').start()
+        self.sample_process = patch('tools.resource_sampler.sample_process',
+                                    return_value=(1.0, 100, 0, 1000, 50, 20)).start()
+        self.addCleanup(patch.stopall)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_samples_running_nodes(self):
+        sampler = ResourceSampler(lambda: [self.node, self.stopped_node], interval=1)
+        sampler.sample()
+        sampler.sample()
+        assert ['node1'] == list(sampler.samples)
+        assert 2 == len(sampler.samples['node1'])
+
+        sampler.write([self.node, self.stopped_node])
+        with open(os.path.join(self.tmp_dir, 'logs', SAMPLES_FILE)) as f:
+            rows = list(csv.reader(f))
+        assert 3 == len(rows)
+        assert ['10', '1', '100', '0', '1000', '50', '20'] == rows[1][1:]
+        with open(os.path.join(self.tmp_dir, 'logs', SUMMARY_FILE)) as f:
+            assert 2 == json.load(f)['samples']
@@ -0,0 +1,111 @@
+from unittest import TestCase
+
+from mock import Mock
+from tools.session_cache import SessionCache, session_cache_key
+
+
+class TestSessionCache(TestCase):
+
+    def setUp(self):
+        self.node = Mock(name='node')
+        self.node.name = 'node1'
+        self.node.pid = 1234
+        self.node.is_running.return_value = True
+        self.session = self._session()
+        self.profile = self.session.get_execution_profile.return_value
+        self.cache = SessionCache(enabled=True)
+
+    @staticmethod
+    def _session():
+        session = Mock(name='session')
+        session.keyspace = None
+        session.is_shutdown = False
+        session.cluster.is_shutdown = False
+        session.default_fetch_size = 5000
+        session.get_execution_profile.return_value.consistency_level = 'ONE'
+        return session
+
+    def _key(self, keyspace=None, **kwargs):
+        return session_cache_key(self.node, keyspace, None, None, True, 4, 9042, None, False, kwargs)
+
+    def _put_and_release(self, key=None):
+        key = key or self._key()
+        self.cache.put(key, self.node, self.session)
+        assert self.cache.release(self.session)
+
+    def test_disabled(self):
+        cache = SessionCache(enabled=False)
+        cache.put(self._key(), self.node, self.session)
+        assert not cache.release(self.session)
+        assert cache.get(self._key()) is None
+
+    def test_session_in_use_not_reused(self):
+        self.cache.put(self._key(), self.node, self.session)
+        assert self.cache.get(self._key()) is None
+
+    def test_reused_once_released(self):
+        self._put_and_release()
+        assert self.session is self.cache.get(self._key())
+        # until it is released again, nobody else gets it
+        assert self.cache.get(self._key()) is None
+        assert self.cache.release(self.session)
+        assert self.session is self.cache.get(self._key())
+
+    def test_unknown_session_not_released(self):
+        assert not self.cache.release(self.session)
+
+    def test_several_idle_sessions(self):
+        other = self._session()
+        self.cache.put(self._key(), self.node, self.session)
+        self.cache.put(self._key(), self.node, other)
+        self.cache.release(self.session)
+        self.cache.release(other)
+        assert {self.session, other} == {self.cache.get(self._key()), self.cache.get(self._key())}
+
+    def test_reuse_resets_settings(self):
+        self._put_and_release()
+        self.session.default_fetch_size = 10
+        self.profile.consistency_level = 'ALL'
+        assert self.session is self.cache.get(self._key())
+        assert 5000 == self.session.default_fetch_size
+        assert 'ONE' == self.profile.consistency_level
+
+    def test_key_includes_profile_kwargs(self):
+        self._put_and_release(self._key(request_timeout=10))
+        assert self.cache.get(self._key()) is None
+        assert self.session is self.cache.get(self._key(request_timeout=10))
+
+    def test_restarted_node_not_reused(self):
+        self._put_and_release()
+        self.node.pid = 4321
+        assert self.cache.get(self._key()) is None
+
+    def test_stopped_node_not_reused(self):
+        self._put_and_release()
+        self.node.is_running.return_value = False
+        assert self.cache.get(self._key()) is None
+        # the session is dropped, not shut down, as its owner shuts it down at the end of the test
+        assert not self.session.cluster.shutdown.called
+
+    def test_shutdown_session_not_reused(self):
+        self._put_and_release()
+        self.session.is_shutdown = True
+        assert self.cache.get(self._key()) is None
+
+    def test_session_that_gained_a_keyspace_not_reused(self):
+        self._put_and_release()
+        self.session.keyspace = 'ks'
+        assert self.cache.get(self._key()) is None
+        assert not self.session.cluster.shutdown.called
+
+    def test_keyspace_restored(self):
+        self.session.keyspace = 'ks'
+        self._put_and_release(self._key(keyspace='ks'))
+        self.session.keyspace = 'other'
+        assert self.session is self.cache.get(self._key(keyspace='ks'))
+        self.session.set_keyspace.assert_called_once_with('ks')
+
+    def test_clear(self):
+        self._put_and_release()
+        self.cache.clear()
+        assert self.cache.get(self._key()) is None
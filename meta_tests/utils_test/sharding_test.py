@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock
+from tools.sharding import DurationHistory, DurationRecorder, merge_durations, plan_shards
+
+
+class TestPlanShards(TestCase):
+
+    def test_balanced_by_duration(self):
+        tests = [('a', 10, False), ('b', 7, False), ('c', 5, False), ('d', 4, False), ('e', 3, False), ('f', 1, False)]
+        shards = plan_shards(tests, 2)
+        durations = dict((test, duration) for test, duration, _ in tests)
+        assert [15, 15] == sorted(sum(durations[test] for test in shard) for shard in shards)
+        assert sorted(durations) == sorted(test for shard in shards for test in shard)
+
+    def test_longest_resource_intensive_first(self):
+        tests = [('short', 1, False), ('long', 10, False), ('intensive', 2, True), ('long_intensive', 5, True)]
+        assert [['long_intensive', 'intensive', 'long', 'short']] == plan_shards(tests, 1)
+
+    def test_unknown_durations_are_typical(self):
+        tests = [('unknown', None, False), ('a', 1, False), ('b', 2, False), ('c', 30, False)]
+        assert [['c', 'unknown', 'b', 'a']] == plan_shards(tests, 1)
+
+    def test_more_shards_than_tests(self):
+        assert [['a'], []] == plan_shards([('a', None, False)], 2)
+
+
+class TestDurationHistory(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'durations.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _record(self, path, *reports):
+        recorder = DurationRecorder(path)
+        for nodeid, duration, keywords in reports:
+            recorder.pytest_runtest_logreport(Mock(nodeid=nodeid, duration=duration, keywords=keywords))
+        recorder.pytest_sessionfinish(Mock())
+
+    def test_record_and_merge(self):
+        recorded = os.path.join(self.tmp_dir, 'recorded.json')
+        self._record(recorded, ('t.py::T::test', 1.5, {'resource_intensive': 1}), ('t.py::T::test', 0.5, {}))
+        assert DurationHistory(self.path).duration('t.py::T::test') is None
+        merge_durations(self.path, [recorded])
+        history = DurationHistory(self.path)
+        assert 2.0 == history.duration('t.py::T::test')
+        assert history.tests['t.py::T::test']['resource_intensive']
+
+    def test_history_only_written_by_merge(self):
+        self._record(self.path, ('a', 1, {}))
+        recorded = [os.path.join(self.tmp_dir, 'shard{}.json'.format(i)) for i in range(2)]
+        self._record(recorded[0], ('a', 3, {}))
+        self._record(recorded[1], ('b', 2, {}))
+        # shards planning meanwhile still see the durations every shard started from
+        assert (1, None) == (DurationHistory(self.path).duration('a'), DurationHistory(self.path).duration('b'))
+        merge_durations(self.path, recorded)
+        history = DurationHistory(self.path)
+        assert (3, 2) == (history.duration('a'), history.duration('b'))
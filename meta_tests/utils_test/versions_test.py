@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+from distutils.version import LooseVersion
+from unittest import TestCase
+
+from mock import patch
+from tools import versions
+
+
+class TestResolveVersion(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.install_dir = os.path.join(self.tmp_dir, 'cassandra')
+        os.mkdir(self.install_dir)
+        self.build_xml = os.path.join(self.install_dir, 'build.xml')
+        open(self.build_xml, 'w').close()
+        patches = [patch('tools.versions.get_default_path', return_value=self.tmp_dir),
+                   patch('tools.versions.get_version_from_build', return_value=LooseVersion('3.11.4')),
+                   patch('tools.versions.ccmlib.repository.setup', return_value=(self.install_dir, '3.11.4'))]
+        self.mocks = [p.start() for p in patches]
+        self.setup = self.mocks[2]
+        for p in patches:
+            self.addCleanup(p.stop)
+        versions._resolved = None
+        versions._build_versions.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_release_resolved_once(self):
+        assert (self.install_dir, LooseVersion('3.11.4')) == versions.resolve_version('3.11.4')
+        assert (self.install_dir, LooseVersion('3.11.4')) == versions.resolve_version('3.11.4')
+        assert 1 == self.setup.call_count
+
+    def test_persisted_across_processes(self):
+        versions.resolve_version('3.11.4')
+        versions._resolved = None
+        assert (self.install_dir, LooseVersion('3.11.4')) == versions.resolve_version('3.11.4')
+        assert 1 == self.setup.call_count
+
+    def test_branch_resolved_again_after_ttl(self):
+        versions.resolve_version('github:apache/cassandra-3.11')
+        versions._resolved['github:apache/cassandra-3.11']['resolved_at'] -= versions.BRANCH_REF_TTL + 1
+        versions.resolve_version('github:apache/cassandra-3.11')
+        assert 2 == self.setup.call_count
+
+    def test_removed_install_dir_resolved_again(self):
+        versions.resolve_version('3.11.4')
+        shutil.rmtree(self.install_dir)
+        versions.resolve_version('3.11.4')
+        assert 2 == self.setup.call_count
+
+    def test_changed_build_xml_resolved_again(self):
+        versions.resolve_version('local:/src/cassandra:trunk')
+        versions.resolve_version('local:/src/cassandra:trunk')
+        assert 1 == self.setup.call_count
+        os.utime(self.build_xml, (1, 1))
+        self.mocks[1].return_value = LooseVersion('4.0')
+        assert (self.install_dir, LooseVersion('4.0')) == versions.resolve_version('local:/src/cassandra:trunk')
+        assert 2 == self.setup.call_count
@@ -30,7 +30,9 @@ class BasePagingTester(Tester):
         supports_v5 = self.supports_v5_protocol(self.cluster.version())
         protocol_version = 5 if supports_v5 else None
         cluster = self.cluster
-        cluster.populate(3).start(wait_for_binary_proto=True)
+        # the cluster of the classes marked with reusable_cluster is already started
+        if not cluster.nodelist():
+            cluster.populate(3).start(wait_for_binary_proto=True)
         node1 = cluster.nodelist()[0]
         session = self.patient_cql_connection(node1,
                                               protocol_version=protocol_version,
@@ -40,6 +42,7 @@ class BasePagingTester(Tester):
 
 
 @since('2.0')
+@pytest.mark.reusable_cluster(nodes=3)
 class TestPagingSize(BasePagingTester, PageAssertionMixin):
     """
     Basic tests relating to page size (relative to results set)
@@ -180,6 +183,7 @@ class TestPagingSize(BasePagingTester, PageAssertionMixin):
 
 
 @since('2.0')
+@pytest.mark.reusable_cluster(nodes=3)
 class TestPagingWithModifiers(BasePagingTester, PageAssertionMixin):
     """
     Tests concerned with paging when CQL modifiers (such as order, limit, allow filtering) are used.
@@ -423,6 +427,7 @@ class TestPagingWithModifiers(BasePagingTester, PageAssertionMixin):
 
 
 @since('2.0')
+@pytest.mark.reusable_cluster(nodes=3)
 class TestPagingData(BasePagingTester, PageAssertionMixin):
 
     def test_paging_a_single_wide_row(self):
@@ -3047,6 +3052,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
 
 
 @since('2.0')
+@pytest.mark.reusable_cluster(nodes=3)
 class TestPagingQueryIsolation(BasePagingTester, PageAssertionMixin):
     """
     Tests concerned with isolation of paged queries (queries can't affect each other).
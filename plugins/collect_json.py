@@ -0,0 +1,31 @@
+"""
+pytest plugin writing the collected tests and the names of their markers to a JSON file.
+
+Load it with -p plugins.collect_json and pass --collect-json=<file>, usually along with --collect-only.
+The file holds a list of {"name": "test_file.py::TestClass::test_function", "markers": [...]}.
+"""
+import json
+import os
+
+
+def pytest_addoption(parser):
+    parser.addoption("--collect-json", action="store", default=None,
+                     help="Write the node ids and marker names of the collected tests to this file as JSON")
+
+
+def collected_test_name(nodeid):
+    # pytest before 4.0 has an extra '()' node for the class instance in the node ids of methods
+    return nodeid.replace("::()", "")
+
+
+def pytest_collection_finish(session):
+    path = session.config.getoption("--collect-json")
+    if path is None:
+        return
+
+    tests = [{"name": collected_test_name(item.nodeid),
+              "markers": sorted(set(marker.name for marker in item.iter_markers()))}
+             for item in session.items]
+    with open(path + ".tmp", "w") as f:
+        json.dump(tests, f)
+    os.replace(path + ".tmp", path)
@@ -163,8 +163,8 @@ class TestIncRepair(Tester):
         # sstables are compacted out of pending repair by a compaction
         # task, we disabled compaction earlier in the test, so here we
         # force the compaction and check that all sstables are promoted
+        self.on_all_nodes(lambda node: node.nodetool('compact ks tbl'))
         for node in self.cluster.nodelist():
-            node.nodetool('compact ks tbl')
             self.assertAllRepairedSSTables(node, 'ks')
 
     def _make_fake_session(self, keyspace, table):
@@ -197,8 +197,7 @@ class TestIncRepair(Tester):
             node.flush()
             node.stop(gently=False)
 
-        for node in self.cluster.nodelist():
-            node.start()
+        self.start_nodes(wait_for_binary_proto=False)
 
         return session_id
 
@@ -74,8 +74,7 @@ class TestPreviewRepair(Tester):
 
         # repair the data...
         node1.repair(options=['ks'])
-        for node in cluster.nodelist():
-            node.nodetool('compact ks tbl')
+        self.on_all_nodes(lambda node: node.nodetool('compact ks tbl'))
 
         # ...and everything should be in sync
         result = node1.repair(options=['ks', '--preview'])
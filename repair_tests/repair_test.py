@@ -84,8 +84,7 @@ class BaseRepairTest(Tester):
             assert len([x for x in res if len(x) != 0]) == 0, res
 
         if restart:
-            for node in stopped_nodes:
-                node.start(wait_other_notice=True)
+            self.start_nodes(stopped_nodes, wait_for_binary_proto=False)
 
     def _populate_cluster(self, start=True):
         cluster = self.cluster
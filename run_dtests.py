@@ -2,8 +2,10 @@
 """
 usage: run_dtests.py [-h] [--use-vnodes] [--use-off-heap-memtables] [--num-tokens NUM_TOKENS] [--data-dir-count-per-instance DATA_DIR_COUNT_PER_INSTANCE] [--force-resource-intensive-tests]
                      [--skip-resource-intensive-tests] [--cassandra-dir CASSANDRA_DIR] [--cassandra-version CASSANDRA_VERSION] [--delete-logs] [--execute-upgrade-tests] [--disable-active-log-watching]
-                     [--keep-test-dir] [--enable-jacoco-code-coverage] [--dtest-enable-debug-logging] [--dtest-print-tests-only] [--dtest-print-tests-output DTEST_PRINT_TESTS_OUTPUT]
-                     [--pytest-options PYTEST_OPTIONS] [--dtest-tests DTEST_TESTS]
+                     [--keep-test-dir] [--enable-jacoco-code-coverage] [--test-durations-file TEST_DURATIONS_FILE]
+                     [--test-durations-output TEST_DURATIONS_OUTPUT] [--shard-count SHARD_COUNT] [--shard-index SHARD_INDEX] [--dtest-enable-debug-logging]
+                     [--dtest-print-tests-only] [--dtest-print-tests-output DTEST_PRINT_TESTS_OUTPUT]
+                     [--pytest-options PYTEST_OPTIONS] [--dtest-tests DTEST_TESTS] [--dtest-in-process]
 
 optional arguments:
   -h, --help                                                 show this help message and exit
@@ -21,30 +23,48 @@ optional arguments:
                                                              processing by consuming ccm _log_error_handler callbacks (default: False)
   --keep-test-dir                                            Do not remove/cleanup the test ccm cluster directory and it's artifacts after the test completes (default: False)
   --enable-jacoco-code-coverage                              Enable JaCoCo Code Coverage Support (default: False)
+  --test-durations-file TEST_DURATIONS_FILE                  JSON file with the durations of earlier runs of the tests. The tests are ordered so the longest
+                                                             (resource_intensive first) start first, and shards are balanced by duration. The file is only read, so
+                                                             every shard plans from the same durations (default: None)
+  --test-durations-output TEST_DURATIONS_OUTPUT              Write the durations of the tests of this run to this JSON file. Merge the files of all shards into the
+                                                             --test-durations-file once they are done, with python -m tools.sharding TEST_DURATIONS_FILE OUTPUT
+                                                             [OUTPUT ...] (default: None)
+  --shard-count SHARD_COUNT                                  Split the selected tests into this many shards of similar total duration (default: 1)
+  --shard-index SHARD_INDEX                                  Which of the --shard-count shards to run, starting at 0 (default: 0)
   --dtest-enable-debug-logging                               Enable debug logging (for this script, pytest, and during execution of test functions) (default: False)
-  --dtest-print-tests-only                                   Print list of all tests found eligible for execution given the provided options. (default: False)
-  --dtest-print-tests-output DTEST_PRINT_TESTS_OUTPUT        Path to file where the output of --dtest-print-tests-only should be written to (default: False)
+  --dtest-print-tests-only                                   Print list of all tests found eligible for execution given the provided options. The result is
+                                                             cached in .collection_cache until the options or any test file change (default: False)
+  --dtest-print-tests-output DTEST_PRINT_TESTS_OUTPUT        Path to file where the output of --dtest-print-tests-only should be written to (default: None)
   --pytest-options PYTEST_OPTIONS                            Additional command line arguments to proxy directly thru when invoking pytest. (default: None)
   --dtest-tests DTEST_TESTS                                  Comma separated list of test files, test classes, or test methods to execute. (default: None)
+  --dtest-in-process                                         Run pytest inside this process instead of a separate Python interpreter (default: False)
 """
 import subprocess
 import sys
 import os
-import re
 import logging
+import codecs
+import hashlib
+import json
+import selectors
+import threading
 
-from os import getcwd
-from tempfile import NamedTemporaryFile
-from bs4 import BeautifulSoup
+import pytest
 
 from _pytest.config.argparsing import Parser
 import argparse
 
 from conftest import pytest_addoption
-from ccmlib.common import get_version_from_build
+from ccmlib.common import get_version_from_build, is_win
 
 logger = logging.getLogger(__name__)
 
+PUMP_CHUNK_SIZE = 64 * 1024
+
+DTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+COLLECTION_CACHE_DIR = os.path.join(DTEST_DIR, ".collection_cache")
+COLLECTION_CACHE_SKIPPED_DIRS = ("logs", "__pycache__")
+
 
 class RunDTests():
     def run(self, argv):
@@ -76,13 +96,16 @@ class RunDTests():
                             help="Enable debug logging (for this script, pytest, and during execution "
                                  "of test functions)")
         parser.add_argument("--dtest-print-tests-only", action="store_true", default=False,
-                            help="Print list of all tests found eligible for execution given the provided options.")
-        parser.add_argument("--dtest-print-tests-output", action="store", default=False,
+                            help="Print list of all tests found eligible for execution given the provided options. "
+                                 "The result is cached in .collection_cache until the options or any test file change")
+        parser.add_argument("--dtest-print-tests-output", action="store", default=None,
                             help="Path to file where the output of --dtest-print-tests-only should be written to")
         parser.add_argument("--pytest-options", action="store", default=None,
                             help="Additional command line arguments to proxy directly thru when invoking pytest.")
         parser.add_argument("--dtest-tests", action="store", default=None,
                             help="Comma separated list of test files, test classes, or test methods to execute.")
+        parser.add_argument("--dtest-in-process", action="store_true", default=False,
+                            help="Run pytest inside this process instead of a separate Python interpreter")
 
         args = parser.parse_args()
 
@@ -110,180 +133,135 @@ class RunDTests():
 
         args_to_invoke_pytest = []
         if args.pytest_options:
-            for arg in args.pytest_options.split(" "):
-                args_to_invoke_pytest.append("'{the_arg}'".format(the_arg=arg))
+            args_to_invoke_pytest.extend(args.pytest_options.split(" "))
 
         for arg in argv:
             if arg.startswith("--pytest-options") or arg.startswith("--dtest-"):
                 continue
-            args_to_invoke_pytest.append("'{the_arg}'".format(the_arg=arg))
-
-        if args.dtest_print_tests_only:
-            args_to_invoke_pytest.append("'--collect-only'")
+            args_to_invoke_pytest.append(arg)
 
         if args.dtest_tests:
-            for test in args.dtest_tests.split(","):
-                args_to_invoke_pytest.append("'{test_name}'".format(test_name=test))
-
-        original_raw_cmd_args = ", ".join(args_to_invoke_pytest)
-
-        logger.debug("args to call with: [%s]" % original_raw_cmd_args)
-
-        # the original run_dtests.py script did it like this to hack around nosetest
-        # limitations -- i'm not sure if they still apply or not in a pytest world
-        # but for now just leaving it as is, because it does the job (although
-        # certainly is still pretty complicated code and has a hacky feeling)
-        to_execute = (
-                "import pytest\n" +
-                (
-                "pytest.main([{options}])\n").format(options=original_raw_cmd_args)
-        )
-        temp = NamedTemporaryFile(dir=getcwd())
-        logger.debug('Writing the following to {}:'.format(temp.name))
-
-        logger.debug('```\n{to_execute}```\n'.format(to_execute=to_execute))
-        temp.write(to_execute.encode("utf-8"))
-        temp.flush()
-
-        # We pass nose_argv as options to the python call to maintain
-        # compatibility with the nosetests command. Arguments passed in via the
-        # command line are treated one way, args passed in as
-        # nose.main(argv=...) are treated another. Compare with the options
-        # -xsv for an example.
-        cmd_list = [sys.executable, temp.name]
-        logger.debug('subprocess.call-ing {cmd_list}'.format(cmd_list=cmd_list))
+            args_to_invoke_pytest.extend(args.dtest_tests.split(","))
 
-        sp = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=os.environ.copy())
+        logger.debug("args to call with: {}".format(args_to_invoke_pytest))
 
         if args.dtest_print_tests_only:
-            stdout, stderr = sp.communicate()
-
-            if stderr:
-                print(stderr.decode("utf-8"))
-                result = sp.returncode
-                exit(result)
-
-            all_collected_test_modules = collect_test_modules(stdout)
-            joined_test_modules = "\n".join(all_collected_test_modules)
-            #print("Collected %d Test Modules" % len(all_collected_test_modules))
+            joined_test_modules = "\n".join(test["name"] for test in collect_tests(args_to_invoke_pytest))
             if args.dtest_print_tests_output is not None:
-                collected_tests_output_file = open(args.dtest_print_tests_output, "w")
-                collected_tests_output_file.write(joined_test_modules)
-                collected_tests_output_file.close()
+                with open(args.dtest_print_tests_output, "w") as collected_tests_output_file:
+                    collected_tests_output_file.write(joined_test_modules)
 
             print(joined_test_modules)
-        else:
-            while True:
-                stdout_output = sp.stdout.readline()
-                stdout_output_str = stdout_output.decode("utf-8")
-                if stdout_output_str == '' and sp.poll() is not None:
-                    break
-                if stdout_output_str:
-                    print(stdout_output_str.strip())
-
-                stderr_output = sp.stderr.readline()
-                stderr_output_str = stderr_output.decode("utf-8")
-                if stderr_output_str == '' and sp.poll() is not None:
-                    break
-                if stderr_output_str:
-                    print(stderr_output_str.strip())
+            exit(0)
+
+        if args.dtest_in_process:
+            # pytest's own output goes straight to our stdout and stderr, nothing to pump
+            exit(pytest.main(args_to_invoke_pytest))
+
+        cmd_list = [sys.executable, "-m", "pytest"] + args_to_invoke_pytest
+        logger.debug('subprocess.call-ing {cmd_list}'.format(cmd_list=cmd_list))
+
+        sp = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=os.environ.copy())
+
+        pump_output(sp, {sp.stdout: sys.stdout, sp.stderr: sys.stderr})
+        sp.wait()
 
         exit(sp.returncode)
 
 
-def collect_test_modules(stdout):
+def pump_output(sp, destinations):
+    """
+    Copies everything the process writes to its pipes to the matching destination streams as soon as it
+    is written, draining all pipes concurrently so a chatty pipe can never stall the process on another.
+    Only one PUMP_CHUNK_SIZE read per pipe is buffered at a time.
+    :param sp: the subprocess.Popen whose pipes to drain
+    :param destinations: dict of pipe to the text stream its output should be written to
+    """
+    if is_win():
+        # select() only supports sockets on Windows, so fall back to a thread per pipe
+        threads = [threading.Thread(target=_pump_pipe, args=(pipe, destination))
+                   for pipe, destination in destinations.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return
+
+    decoders = {}
+    with selectors.DefaultSelector() as selector:
+        for pipe, destination in destinations.items():
+            selector.register(pipe, selectors.EVENT_READ, destination)
+            decoders[pipe] = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while selector.get_map():
+            for key, _ in selector.select():
+                chunk = os.read(key.fd, PUMP_CHUNK_SIZE)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                _write_and_flush(key.data, decoders[key.fileobj].decode(chunk, final=not chunk))
+
+
+def _pump_pipe(pipe, destination):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        chunk = os.read(pipe.fileno(), PUMP_CHUNK_SIZE)
+        _write_and_flush(destination, decoder.decode(chunk, final=not chunk))
+        if not chunk:
+            return
+
+
+def _write_and_flush(stream, text):
+    if text:
+        stream.write(text)
+        stream.flush()
+
+
+def collection_cache_key(pytest_args):
+    """
+    :param pytest_args: the arguments pytest is invoked with to collect the tests
+    :return: a key that changes whenever the collected tests might: when the arguments change, or when
+             any python or ini file of the dtests is modified, added or removed
+    """
+    key = hashlib.sha1(repr(pytest_args).encode("utf-8"))
+    for dirpath, dirnames, filenames in os.walk(DTEST_DIR):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d not in COLLECTION_CACHE_SKIPPED_DIRS)
+        for filename in sorted(filenames):
+            if filename.endswith((".py", ".ini")):
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                entry = "{}:{}:{}\n".format(os.path.relpath(path, DTEST_DIR), stat.st_mtime_ns, stat.st_size)
+                key.update(entry.encode("utf-8"))
+    return key.hexdigest()
+
+
+def collect_tests(pytest_args):
     """
-    Takes the xml-ish (no, it's not actually xml so we need to format it a bit) --collect-only output as printed
-    by pytest to stdout and normalizes it to get a list of all collected tests in a human friendly format
-    :param stdout: the stdout from pytest (should have been invoked with the --collect-only cmdline argument)
-    :return: a formatted list of collected test modules in format test_file.py::TestClass::test_function
+    Collects the tests pytest would run with pytest_args, reusing the result of an earlier identical
+    collection from the on-disk cache when nothing changed since.
+    :param pytest_args: the arguments pytest would be invoked with to run the tests
+    :return: a list of {"name": test_file.py::TestClass::test_function, "markers": [marker names]}
     """
-    # unfortunately, pytest emits xml like output -- but it's not actually xml, so we'll fail to parse
-    # if we try. first step is to fix up the pytest output to create well formatted xml
-    xml_line_regex_pattern = re.compile(r"^([\s])*<(Module|Class|Function|Instance) '(.*)'>")
-    is_first_module = True
-    is_first_class = True
-    has_closed_class = False
-    section_has_instance = False
-    section_has_class = False
-    test_collect_xml_lines = []
-
-    test_collect_xml_lines.append("<?xml version=\"1.0\" encoding=\"UTF-8\"?>")
-    test_collect_xml_lines.append("<Modules>")
-    for line in stdout.decode("utf-8").split('\n'):
-        re_ret = re.search(xml_line_regex_pattern, line)
-        if re_ret:
-            if not is_first_module and re_ret.group(2) == "Module":
-                if section_has_instance:
-                    test_collect_xml_lines.append("      </Instance>")
-                if section_has_class:
-                    test_collect_xml_lines.append("    </Class>")
-
-                test_collect_xml_lines.append("  </Module>")
-                is_first_class = True
-                has_closed_class = False
-                section_has_instance = False
-                section_has_class = False
-                is_first_module = False
-            elif is_first_module and re_ret.group(2) == "Module":
-                if not has_closed_class and section_has_instance:
-                    test_collect_xml_lines.append("      </Instance>")
-                if not has_closed_class and section_has_class:
-                    test_collect_xml_lines.append("    </Class>")
-
-                is_first_class = True
-                is_first_module = False
-                has_closed_class = False
-                section_has_instance = False
-                section_has_class = False
-            elif re_ret.group(2) == "Instance":
-                section_has_instance = True
-            elif not is_first_class and re_ret.group(2) == "Class":
-                if section_has_instance:
-                    test_collect_xml_lines.append("      </Instance>")
-                if section_has_class:
-                    test_collect_xml_lines.append("    </Class>")
-                has_closed_class = True
-                section_has_class = True
-            elif re_ret.group(2) == "Class":
-                is_first_class = False
-                section_has_class = True
-                has_closed_class = False
-
-            if re_ret.group(2) == "Function":
-                test_collect_xml_lines.append("          <Function name=\"{name}\"></Function>"
-                                              .format(name=re_ret.group(3)))
-            elif re_ret.group(2) == "Class":
-                test_collect_xml_lines.append("    <Class name=\"{name}\">".format(name=re_ret.group(3)))
-            elif re_ret.group(2) == "Module":
-                test_collect_xml_lines.append("  <Module name=\"{name}\">".format(name=re_ret.group(3)))
-            elif re_ret.group(2) == "Instance":
-                test_collect_xml_lines.append("      <Instance name=\"\">".format(name=re_ret.group(3)))
-            else:
-                test_collect_xml_lines.append(line)
-
-    test_collect_xml_lines.append("      </Instance>")
-    test_collect_xml_lines.append("    </Class>")
-    test_collect_xml_lines.append("  </Module>")
-    test_collect_xml_lines.append("</Modules>")
-
-    all_collected_test_modules = []
-
-    # parse the now valid xml
-    print("\n".join(test_collect_xml_lines))
-    test_collect_xml = BeautifulSoup("\n".join(test_collect_xml_lines), "lxml-xml")
-
-    # find all Modules (followed by classes in those modules, and then finally functions)
-    for pytest_module in test_collect_xml.findAll("Module"):
-        for test_class_name in pytest_module.findAll("Class"):
-            for function_name in test_class_name.findAll("Function"):
-                # adds to test list in format like test_file.py::TestClass::test_function for every test function found
-                all_collected_test_modules.append("{module_name}::{class_name}::{function_name}"
-                                                  .format(module_name=pytest_module.attrs['name'],
-                                                          class_name=test_class_name.attrs['name'],
-                                                          function_name=function_name.attrs['name']))
-
-    return all_collected_test_modules
+    cache_file = os.path.join(COLLECTION_CACHE_DIR, collection_cache_key(pytest_args) + ".json")
+    if os.path.exists(cache_file):
+        logger.debug("Using cached collection {}".format(cache_file))
+        with open(cache_file) as f:
+            return json.load(f)
+
+    os.makedirs(COLLECTION_CACHE_DIR, exist_ok=True)
+    collect_json = cache_file + ".{}.collecting".format(os.getpid())
+    cmd_list = [sys.executable, "-m", "pytest", "-p", "plugins.collect_json", "--collect-json", collect_json,
+                "--collect-only", "-q"] + pytest_args
+    logger.debug('subprocess.call-ing {cmd_list}'.format(cmd_list=cmd_list))
+    sp = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=os.environ.copy())
+    stdout, stderr = sp.communicate()
+    if not os.path.exists(collect_json):
+        print(stdout.decode("utf-8"))
+        print(stderr.decode("utf-8"))
+        exit(sp.returncode or 1)
+
+    with open(collect_json) as f:
+        collected_tests = json.load(f)
+    os.replace(collect_json, cache_file)
+    return collected_tests
 
 
 if __name__ == '__main__':
@@ -0,0 +1,177 @@
+"""
+Admission control for tests running concurrently on one host (e.g. pytest-xdist workers).
+
+Each test reserves an estimate of the memory and CPUs its cluster needs before the cluster is
+created, and waits while the host can't hold it next to the reservations of the tests already
+running. Reservations are files in RESERVATION_DIR, each exclusively locked by the process that
+holds it, so the reservations of processes that died are ignored. Admission decisions are
+serialized with a lock on a separate file.
+"""
+import errno
+import json
+import logging
+import os
+import platform
+import re
+import tempfile
+import time
+
+from collections import namedtuple
+
+import psutil
+
+from tools.readiness import backoff_delays
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_DIR = os.path.join(tempfile.gettempdir(), 'dtest-admission')
+# nodes assumed for tests that don't declare their cluster shape
+DEFAULT_NODES = 3
+RESOURCE_INTENSIVE_NODES = 9
+# memory of a node on top of its heap, and the heap ccm gives nodes unless CCM_MAX_HEAP_SIZE says otherwise
+NODE_OVERHEAD_MB = 1024
+DEFAULT_HEAP_SIZE = '500M'
+CPUS_PER_NODE = 1
+# share of the host's memory reservations may add up to
+MEMORY_FRACTION = 0.9
+MAX_QUEUE_DELAY = 5.0
+QUEUE_TIMEOUT = 60 * 60
+
+Footprint = namedtuple('Footprint', ('memory_mb', 'cpus'))
+
+
+def _parse_size_mb(size):
+    match = re.match(r'^(\d+)([MmGg])$', size.strip())
+    if match is None:
+        return None
+    return int(match.group(1)) * (1024 if match.group(2) in 'Gg' else 1)
+
+
+def node_memory_mb():
+    """
+    @return The memory a node is expected to use, based on the heap ccm starts it with (CCM_MAX_HEAP_SIZE,
+            which ccm passes to the node as MAX_HEAP_SIZE)
+    """
+    heap_mb = _parse_size_mb(os.environ.get('CCM_MAX_HEAP_SIZE', DEFAULT_HEAP_SIZE))
+    if heap_mb is None:
+        heap_mb = _parse_size_mb(DEFAULT_HEAP_SIZE)
+    return heap_mb + NODE_OVERHEAD_MB
+
+
+def estimate_footprint(item):
+    """
+    @param item The pytest test item
+    @return The Footprint of the test's cluster, from the node count of its reusable_cluster marker or,
+            failing that, whether it is resource_intensive
+    """
+    reusable_cluster = item.get_closest_marker('reusable_cluster')
+    if reusable_cluster is not None and 'nodes' in reusable_cluster.kwargs:
+        nodes = reusable_cluster.kwargs['nodes']
+        node_count = nodes if isinstance(nodes, int) else sum(nodes)
+    elif item.get_closest_marker('resource_intensive') is not None:
+        node_count = RESOURCE_INTENSIVE_NODES
+    else:
+        node_count = DEFAULT_NODES
+    return Footprint(memory_mb=node_count * node_memory_mb(), cpus=node_count * CPUS_PER_NODE)
+
+
+def host_capacity():
+    """
+    @return The Footprint all tests on this host may reserve together
+    """
+    return Footprint(memory_mb=psutil.virtual_memory().total / 1024 / 1024 * MEMORY_FRACTION,
+                     cpus=psutil.cpu_count())
+
+
+class Reservation(object):
+
+    def __init__(self, footprint, reservation_file=None):
+        self.footprint = footprint
+        self._reservation_file = reservation_file
+
+    def release(self):
+        if self._reservation_file is not None:
+            os.unlink(self._reservation_file.name)
+            # closing the file drops the lock
+            self._reservation_file.close()
+            self._reservation_file = None
+
+
+def _flock(f, blocking):
+    import fcntl
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return True
+    except OSError as e:
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            return False
+        raise
+
+
+def _live_reservations():
+    """
+    @return The footprints of the reservations held by running processes
+    """
+    footprints = []
+    for name in os.listdir(RESERVATION_DIR):
+        if not name.startswith('reservation-'):
+            continue
+        path = os.path.join(RESERVATION_DIR, name)
+        try:
+            with open(path) as f:
+                if _flock(f, blocking=False):
+                    # nobody holds it any more
+                    os.unlink(path)
+                    continue
+                footprints.append(Footprint(**json.load(f)))
+        except (IOError, OSError, ValueError):
+            # released while we looked at it
+            continue
+    return footprints
+
+
+def _fits(footprint, reserved, capacity):
+    if not reserved:
+        # a test always runs when it has the host to itself
+        return True
+    # memory used by anything but the running clusters isn't available to reserve either
+    free_mb = psutil.virtual_memory().available / 1024 / 1024 + sum(r.memory_mb for r in reserved)
+    fits_memory = sum(r.memory_mb for r in reserved) + footprint.memory_mb <= min(capacity.memory_mb, free_mb)
+    fits_cpus = sum(r.cpus for r in reserved) + footprint.cpus <= capacity.cpus
+    return fits_memory and fits_cpus
+
+
+def admit(footprint, timeout=QUEUE_TIMEOUT):
+    """
+    Waits until the host can hold a test with footprint next to the tests already running, and reserves it.
+
+    @return A Reservation to release() once the test's cluster is gone
+    """
+    if platform.system() != 'Linux':
+        logger.warning("Admission control is only supported on Linux, not limiting concurrent tests")
+        return Reservation(footprint)
+
+    os.makedirs(RESERVATION_DIR, exist_ok=True)
+    capacity = host_capacity()
+    deadline = time.time() + timeout
+    delays = backoff_delays(maximum=MAX_QUEUE_DELAY)
+    queued = False
+    while True:
+        with open(os.path.join(RESERVATION_DIR, 'admission.lock'), 'w') as admission_lock:
+            _flock(admission_lock, blocking=True)
+            reserved = _live_reservations()
+            if _fits(footprint, reserved, capacity) or time.time() > deadline:
+                if queued and time.time() > deadline:
+                    logger.warning("Waited {}s for resources, running anyway".format(timeout))
+                reservation_file = tempfile.NamedTemporaryFile(mode='w', prefix='reservation-', suffix='.json',
+                                                               dir=RESERVATION_DIR, delete=False)
+                _flock(reservation_file, blocking=True)
+                json.dump(footprint._asdict(), reservation_file)
+                reservation_file.flush()
+                return Reservation(footprint, reservation_file)
+
+        if not queued:
+            logger.info("Queueing test needing {:.0f}MB and {} CPUs until other tests finish, {} running"
+                        .format(footprint.memory_mb, footprint.cpus, len(reserved)))
+            queued = True
+        time.sleep(next(delays))
@@ -0,0 +1,159 @@
+"""
+Class data sharing (AppCDS) archives for faster Cassandra node startup.
+
+Every node JVM parses and verifies the same few thousand JDK classes while it starts. With JDK 11
+or later those classes can be mapped from a class data sharing archive instead. Archives are built
+once per Cassandra build (its install dir and git SHA) and JDK: the first cluster of a build runs
+its nodes with -XX:DumpLoadedClassList, writing the classes each node loaded to the node's
+directory, and when that cluster is cleaned up the longest list is dumped into an archive in the
+cache directory. The nodes of later clusters of that build start with -XX:SharedArchiveFile.
+
+Only classes of the JDK end up in the archive. Application classes would need the class path the
+archive was dumped with to match the one of every node, and a node's class path starts with its
+own conf directory.
+"""
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+
+from ccmlib.common import is_win
+
+from tools.git import cassandra_git_sha
+from tools.jdk import java_executable, java_feature_version, java_version_output
+from tools.versions import version_from_build
+
+logger = logging.getLogger(__name__)
+
+MIN_JAVA_VERSION = 11
+# written by each node of a cluster without an archive, relative to the node's directory.
+# The path is expanded by cassandra.in.sh, where CASSANDRA_CONF is the node's conf directory
+CLASS_LIST_FILE = 'appcds.classlist'
+CLASS_LIST_JVM_PATH = os.path.join('$CASSANDRA_CONF', os.path.pardir, CLASS_LIST_FILE)
+# the archive only works with compressed oops when it was dumped with them, so dump with a heap
+# as small as the one of a node
+DUMP_HEAP_SIZE = '512M'
+
+# keys whose archive failed to dump in this process, so it isn't attempted after every test
+_failed_keys = set()
+
+
+def _build_id(install_dir):
+    try:
+        sha = cassandra_git_sha(install_dir)
+    except RuntimeError:
+        # not a git checkout, e.g. a binary release
+        sha = None
+    return sha or str(version_from_build(install_dir))
+
+
+def appcds_archive_key(install_dir, java_version):
+    """
+    @param install_dir The Cassandra install dir of the cluster
+    @param java_version What `java -version` printed for the JDK the nodes run with
+    @return A string identifying the archive nodes of this build on this JDK can use
+    """
+    key = repr((install_dir, _build_id(install_dir), java_version))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def longest_class_list(paths):
+    """
+    @return The lines of the longest of the class lists at paths, i.e. of the node that loaded the most classes.
+            Lists aren't merged, as JDK 15 and later number the classes in them.
+    """
+    longest = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                lines = [line for line in f.read().splitlines() if line.strip()]
+        except IOError:
+            # the node never started
+            continue
+        if len(lines) > len(longest):
+            longest = lines
+    return longest
+
+
+class AppCDSArchiveCache(object):
+    """
+    A directory of class data sharing archives, one per archive key.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.java = java_executable()
+
+    def _archive_path(self, key):
+        return os.path.join(self.cache_dir, '{}.jsa'.format(key))
+
+    def _key(self, install_dir):
+        """
+        @return The archive key for nodes of install_dir, or None if the JDK can't use archives
+        """
+        if is_win():
+            # the flags are passed through cassandra.in.sh
+            return None
+        java_version = java_version_output(self.java)
+        feature_version = java_feature_version(java_version)
+        if feature_version is None or feature_version < MIN_JAVA_VERSION:
+            logger.debug("Not using a class data sharing archive, it needs JDK {} or later, found {}"
+                         .format(MIN_JAVA_VERSION, feature_version))
+            return None
+        return appcds_archive_key(install_dir, java_version)
+
+    def jvm_args(self, install_dir):
+        """
+        @param install_dir The Cassandra install dir of the cluster
+        @return The JVM arguments for the nodes of the cluster: using the archive of the build when there
+                is one, recording the classes the nodes load otherwise. They may refer to CASSANDRA_CONF,
+                so belong in the cluster's cassandra.in.sh
+        """
+        key = self._key(install_dir)
+        if key is None:
+            return []
+        archive_path = self._archive_path(key)
+        if os.path.isfile(archive_path):
+            logger.debug("Nodes will start with class data sharing archive {}".format(archive_path))
+            # -Xshare:auto starts the node without the archive should it not match the JVM after all
+            return ['-Xshare:auto', '-XX:SharedArchiveFile={}'.format(archive_path)]
+        return ['-XX:DumpLoadedClassList={}'.format(CLASS_LIST_JVM_PATH)]
+
+    def save(self, cluster):
+        """
+        Dumps the classes the nodes of cluster loaded into the archive for its build, unless it exists.
+        The nodes must have been started with the arguments from jvm_args() while it didn't.
+        """
+        key = self._key(cluster.get_install_dir())
+        if key is None or key in _failed_keys or os.path.isfile(self._archive_path(key)):
+            return
+
+        classes = longest_class_list(os.path.join(node.get_path(), CLASS_LIST_FILE) for node in cluster.nodelist())
+        if not classes:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # dump next to the final location and rename it into place, so that concurrent dtest
+        # processes never start nodes with a half written archive
+        fd, class_list_path = tempfile.mkstemp(prefix='{}.'.format(key), suffix='.classlist', dir=self.cache_dir)
+        staging_path = '{}.{}.tmp'.format(self._archive_path(key), os.getpid())
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(classes) + '\n')
+            p = subprocess.Popen([self.java, '-Xshare:dump', '-Xmx{}'.format(DUMP_HEAP_SIZE),
+                                  '-XX:SharedClassListFile={}'.format(class_list_path),
+                                  '-XX:SharedArchiveFile={}'.format(staging_path)],
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            out, _ = p.communicate()
+            if p.returncode != 0 or not os.path.isfile(staging_path):
+                _failed_keys.add(key)
+                logger.warning("Unable to dump class data sharing archive: {}".format(out.decode('utf-8', 'replace')))
+                return
+            os.replace(staging_path, self._archive_path(key))
+            logger.debug("Saved class data sharing archive of {} loaded classes to {}"
+                         .format(len(classes), self._archive_path(key)))
+        finally:
+            os.unlink(class_list_path)
+            if os.path.exists(staging_path):
+                os.unlink(staging_path)
@@ -0,0 +1,111 @@
+"""
+Session wide pool of started ccm clusters that can be handed from one test to the next.
+
+Tests opt in with the reusable_cluster mark, e.g. @pytest.mark.reusable_cluster(nodes=3). When
+--reuse-clusters is given, the cluster a passing test leaves behind is reset (user keyspaces dropped,
+snapshots cleared) and parked in the pool instead of being removed. The next test asking for an
+identically configured cluster gets it back already running, skipping JVM boot, gossip settle and
+schema init.
+"""
+import logging
+import os
+import shutil
+import threading
+
+from collections import namedtuple, OrderedDict
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_KEYSPACES = frozenset(['system', 'system_auth', 'system_distributed', 'system_schema',
+                              'system_traces', 'system_views', 'system_virtual_schema'])
+
+PooledCluster = namedtuple('PooledCluster', ('key', 'cluster', 'test_path'))
+
+
+def normalize_node_counts(nodes):
+    """
+    @param nodes Node count as accepted by ccm's Cluster.populate, either an int or a list of per-DC counts
+    @return A tuple of per-DC node counts
+    """
+    if isinstance(nodes, int):
+        return (nodes,)
+    return tuple(nodes)
+
+
+def saved_config_options(cluster):
+    """
+    @return The yaml options of cluster, as ccm saved them to its cluster.conf when they were set
+    """
+    try:
+        with open(os.path.join(cluster.get_path(), 'cluster.conf')) as f:
+            return (yaml.safe_load(f) or {}).get('config_options') or {}
+    except IOError:
+        # ccm only writes the file once something is configured
+        return {}
+
+
+def cluster_pool_key(cluster, nodes):
+    """
+    Builds the key clusters are pooled under. Two clusters are interchangeable when they have the
+    same topology, run the same Cassandra build and were configured with the same yaml options.
+
+    @param cluster The ccm cluster, configured but not necessarily populated
+    @param nodes Node count as accepted by ccm's Cluster.populate
+    """
+    config_options = sorted((k, repr(v)) for k, v in saved_config_options(cluster).items())
+    return (normalize_node_counts(nodes),
+            cluster.get_install_dir(),
+            str(cluster.version()),
+            repr(config_options))
+
+
+class ClusterPool(object):
+    """
+    Holds idle, running clusters keyed by cluster_pool_key.
+
+    All dtest clusters bind the same loopback addresses and ports, so only one of them may be
+    running at a time. The pool therefore keeps at most one idle cluster and evicts it as soon
+    as a test needs something else.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+
+    def checkout(self, key):
+        """
+        @return The PooledCluster registered under key, or None. Idle clusters with a different
+                key are evicted so the caller is free to start a new cluster.
+        """
+        with self._lock:
+            pooled = self._idle.pop(key, None)
+        if pooled is not None:
+            logger.debug("reusing pooled ccm cluster at {path}".format(path=pooled.test_path))
+        self.clear()
+        return pooled
+
+    def checkin(self, key, cluster, test_path):
+        """
+        Parks a reset, running cluster so a later test can check it out.
+        """
+        self.clear()
+        with self._lock:
+            self._idle[key] = PooledCluster(key, cluster, test_path)
+        logger.debug("returned ccm cluster at {path} to the pool".format(path=test_path))
+
+    def clear(self):
+        """
+        Stops and removes every idle cluster.
+        """
+        with self._lock:
+            evicted = list(self._idle.values())
+            self._idle.clear()
+        for pooled in evicted:
+            logger.debug("removing pooled ccm cluster at {path}".format(path=pooled.test_path))
+            try:
+                pooled.cluster.remove()
+            finally:
+                shutil.rmtree(pooled.test_path, ignore_errors=True)
@@ -0,0 +1,108 @@
+"""
+Starting the nodes of a cluster together.
+
+The loops tests write over node.start(wait_other_notice=True, wait_for_binary_proto=True) to
+restart some of the nodes of a cluster bring them up strictly one after another, each waiting to
+be seen UP before the next launches. start_nodes launches the seeds first, then every other node
+concurrently as soon as the seeds are gossiping, and only then waits for all of them together to
+see each other and to listen for CQL clients. It doesn't replace ccm's Cluster.start, which
+already launches every node of a new cluster before waiting for any, and also runs the ccm
+extension hooks and the JDK and address checks. Nodes that will bootstrap are started last, one at a time, as Cassandra doesn't
+allow several nodes to join the ring at once.
+"""
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+GOSSIP_STARTED = 'Starting up server gossip'
+START_TIMEOUT = 120
+
+
+def is_seed(cluster, node):
+    return node in cluster.seeds or node.network_interfaces['storage'][0] in cluster.get_seeds()
+
+
+def will_bootstrap(cluster, node):
+    """
+    @return Whether node is going to bootstrap when started: a non-seed set to auto bootstrap that was never started
+    """
+    return node.auto_bootstrap and not is_seed(cluster, node) and not os.path.exists(node.logfilename())
+
+
+def split_nodes(cluster, nodes):
+    """
+    @return The seeds, the other nodes that can start alongside them, and the nodes that will bootstrap, among nodes
+    """
+    seeds = [node for node in nodes if is_seed(cluster, node)]
+    bootstrapping = [node for node in nodes if will_bootstrap(cluster, node)]
+    others = [node for node in nodes if node not in seeds and node not in bootstrapping]
+    return seeds, others, bootstrapping
+
+
+def _launch(nodes, wait_for, timeout, start_kwargs):
+    """
+    Starts nodes concurrently, and waits for each to log wait_for, if given.
+    """
+    def launch(node):
+        process = node.start(wait_other_notice=False, wait_for_binary_proto=False, **start_kwargs)
+        if wait_for is not None:
+            node.watch_log_for(wait_for, from_mark=node.mark, timeout=timeout, process=process)
+
+    if not nodes:
+        return
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        futures = [executor.submit(launch, node) for node in nodes]
+    for future in futures:
+        # raises the first error
+        future.result()
+
+
+def _wait_until_up(cluster, nodes, marks, wait_other_notice, wait_for_binary_proto, timeout):
+    """
+    Waits for every live node to see nodes UP and for nodes to listen for CQL clients. The nodes all make progress
+    meanwhile, so waiting on one after the other takes about as long as the slowest of them.
+    """
+    if wait_other_notice:
+        for observer in cluster.nodelist():
+            if not observer.is_live():
+                continue
+            others = [node for node in nodes if node is not observer]
+            if others:
+                observer.watch_log_for_alive(others, from_mark=marks.get(observer.name, observer.mark),
+                                             timeout=timeout)
+    if wait_for_binary_proto:
+        for node in nodes:
+            node.wait_for_binary_interface(from_mark=node.mark, timeout=timeout)
+
+
+def start_nodes(cluster, nodes=None, wait_other_notice=True, wait_for_binary_proto=True, timeout=START_TIMEOUT,
+                **start_kwargs):
+    """
+    Starts the nodes of cluster that aren't running, seeds first and the rest of them concurrently.
+    @param nodes The nodes to start, all the nodes of cluster by default
+    @param wait_other_notice Whether to wait for every live node to see the started nodes UP
+    @param wait_for_binary_proto Whether to wait for the started nodes to listen for CQL clients
+    @param timeout Seconds to wait for each of the things waited for
+    @param start_kwargs Passed on to node.start, e.g. jvm_args
+    @return The nodes started
+    """
+    if nodes is None:
+        nodes = cluster.nodelist()
+    nodes = [node for node in nodes if not node.is_running()]
+    seeds, others, bootstrapping = split_nodes(cluster, nodes)
+    # nodes that are already up have to see the new ones too
+    marks = {node.name: node.mark_log() for node in cluster.nodelist() if node.is_live()}
+
+    logger.debug("Starting seeds {}, then {} concurrently".format([node.name for node in seeds],
+                                                                  [node.name for node in others]))
+    _launch(seeds, GOSSIP_STARTED if others else None, timeout, start_kwargs)
+    _launch(others, None, timeout, start_kwargs)
+    _wait_until_up(cluster, seeds + others, marks, wait_other_notice, wait_for_binary_proto, timeout)
+
+    for node in bootstrapping:
+        logger.debug("Starting {}, which bootstraps".format(node.name))
+        node.start(wait_other_notice=wait_other_notice, wait_for_binary_proto=wait_for_binary_proto, **start_kwargs)
+    return nodes
@@ -0,0 +1,194 @@
+"""
+nodetool commands run through a node's Jolokia agent.
+
+Every node.nodetool() call launches a nodetool JVM, which takes a second or two. FastNodetool runs
+the commands tests use most (flush, compact, drain, replaybatchlog, tpstats, compactionstats) as JMX operations
+over the keep-alive HTTP connection of a JolokiaAgent instead, returning the same
+(stdout, stderr, rc) tuple. Everything else, and every command whose JMX version fails, is handed
+to node.nodetool(), which also raises the usual ToolError when the command fails.
+
+Only nodes that already have an agent listening are used, i.e. ones started with
+--jolokia-at-startup or with an agent a test attached. Attaching one here would need the node to
+have been started without -XX:+PerfDisableSharedMem.
+"""
+import logging
+import re
+
+from collections import defaultdict
+
+from tools.jmxutils import JolokiaAgent, make_mbean
+
+logger = logging.getLogger(__name__)
+
+# flushes and compactions run as long as they take, like with nodetool
+OPERATION_TIMEOUT = 60 * 60
+STORAGE_SERVICE = make_mbean('db', 'StorageService')
+BATCHLOG_MANAGER = make_mbean('db', 'BatchlogManager')
+COMPACTION_MANAGER = make_mbean('db', 'CompactionManager')
+PENDING_COMPACTIONS = make_mbean('metrics', type='Compaction', name='PendingTasks')
+THREAD_POOLS = 'org.apache.cassandra.metrics:type=ThreadPools,*'
+DROPPED_MESSAGES = 'org.apache.cassandra.metrics:type=DroppedMessage,name=Dropped,*'
+# the columns of nodetool tpstats, and the metric each comes from
+TPSTATS_COLUMNS = (('Active', 'ActiveTasks', 'Value'),
+                   ('Pending', 'PendingTasks', 'Value'),
+                   ('Completed', 'CompletedTasks', 'Value'),
+                   ('Blocked', 'CurrentlyBlockedTasks', 'Count'),
+                   ('All time blocked', 'TotalBlockedTasks', 'Count'))
+TPSTATS_POOL_FORMAT = '{:<30}{:>10}{:>10}{:>15}{:>10}{:>18}'
+TPSTATS_DROPPED_FORMAT = '{:<20}{:>10}'
+COMPACTIONSTATS_FORMAT = '{:>25}{:>16}{:>16}{:>16}{:>16}{:>10}{:>10}'
+
+
+def _mbean_properties(mbean):
+    return dict(prop.split('=', 1) for prop in mbean.split(':', 1)[1].split(','))
+
+
+def format_tpstats(thread_pools, dropped_messages):
+    """
+    @param thread_pools The attributes of every ThreadPools metric mbean, keyed by mbean name
+    @param dropped_messages The attributes of every DroppedMessage Dropped mbean, keyed by mbean name
+    @return The thread pool and dropped message tables, the way nodetool tpstats prints them
+    """
+    pools = defaultdict(dict)
+    for mbean, attributes in thread_pools.items():
+        properties = _mbean_properties(mbean)
+        pools[properties['scope']][properties['name']] = attributes
+
+    lines = [TPSTATS_POOL_FORMAT.format('Pool Name', *(column for column, _, _ in TPSTATS_COLUMNS))]
+    for pool, metrics in sorted(pools.items()):
+        values = [metrics.get(metric, {}).get(attribute, 'n/a') for _, metric, attribute in TPSTATS_COLUMNS]
+        lines.append(TPSTATS_POOL_FORMAT.format(pool, *values))
+    lines.append('')
+    lines.append(TPSTATS_DROPPED_FORMAT.format('Message type', 'Dropped'))
+    for verb, count in sorted((_mbean_properties(mbean)['scope'], attributes['Count'])
+                              for mbean, attributes in dropped_messages.items()):
+        lines.append(TPSTATS_DROPPED_FORMAT.format(verb, count))
+    return '\n'.join(lines) + '\n'
+
+
+def format_compactionstats(pending_tasks, compactions):
+    """
+    @param pending_tasks The value of the compaction PendingTasks metric
+    @param compactions The Compactions attribute of the CompactionManager mbean
+    @return The pending tasks and active compactions, the way nodetool compactionstats prints them
+    """
+    lines = ['pending tasks: {}'.format(pending_tasks)]
+    if compactions:
+        # compactionId was added in 3.0, id is the table's before that
+        with_id = 'compactionId' in compactions[0]
+        header = ('compaction type', 'keyspace', 'table', 'completed', 'total', 'unit', 'progress')
+        lines.append(('{:<37}'.format('id') if with_id else '') + COMPACTIONSTATS_FORMAT.format(*header))
+        for compaction in compactions:
+            completed, total = int(compaction['completed']), int(compaction['total'])
+            progress = '{:.2f}%'.format(100.0 * completed / total if total else 0.0)
+            row = COMPACTIONSTATS_FORMAT.format(compaction['taskType'], compaction['keyspace'],
+                                                compaction['columnfamily'], completed, total, compaction['unit'],
+                                                progress)
+            lines.append(('{:<37}'.format(compaction['compactionId']) if with_id else '') + row)
+    return '\n'.join(lines) + '\n'
+
+
+class FastNodetool(object):
+    """
+    Runs nodetool commands against one node, through its Jolokia agent when it can.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.jmx = JolokiaAgent(node, timeout=OPERATION_TIMEOUT)
+        # pid of the node process last checked for an agent, and whether it had one
+        self._checked_pid = None
+        self._agent_running = False
+        self._commands = {'flush': self._flush,
+                          'compact': self._compact,
+                          'drain': self._drain,
+                          'replaybatchlog': self._replaybatchlog,
+                          'tpstats': self._tpstats,
+                          'compactionstats': self._compactionstats}
+
+    def close(self):
+        self.jmx.close()
+
+    def _keyspace_and_tables(self, args):
+        if args:
+            return [(args[0], args[1:])]
+        return [(keyspace, []) for keyspace in self.jmx.read_attribute(STORAGE_SERVICE, 'Keyspaces')]
+
+    def _flush(self, args):
+        if any(arg.startswith('-') for arg in args):
+            return None
+        for keyspace, tables in self._keyspace_and_tables(args):
+            self.jmx.execute_method(STORAGE_SERVICE, 'forceKeyspaceFlush(java.lang.String,[Ljava.lang.String;)',
+                                    [keyspace, tables])
+        return ''
+
+    def _compact(self, args):
+        if any(arg.startswith('-') for arg in args):
+            # split output, token ranges and user defined compactions are left to nodetool
+            return None
+        for keyspace, tables in self._keyspace_and_tables(args):
+            self.jmx.execute_method(STORAGE_SERVICE,
+                                    'forceKeyspaceCompaction(boolean,java.lang.String,[Ljava.lang.String;)',
+                                    [False, keyspace, tables])
+        return ''
+
+    def _drain(self, args):
+        if args:
+            return None
+        self.jmx.execute_method(STORAGE_SERVICE, 'drain')
+        return ''
+
+    def _replaybatchlog(self, args):
+        if args:
+            return None
+        self.jmx.execute_method(BATCHLOG_MANAGER, 'forceBatchlogReplay')
+        return ''
+
+    def _tpstats(self, args):
+        if args:
+            # e.g. --format json
+            return None
+        thread_pools, dropped_messages = self.jmx.bulk([{'type': 'read', 'mbean': THREAD_POOLS},
+                                                        {'type': 'read', 'mbean': DROPPED_MESSAGES}])
+        return format_tpstats(thread_pools['value'], dropped_messages['value'])
+
+    def _compactionstats(self, args):
+        if args:
+            # e.g. -H
+            return None
+        pending_tasks, compactions = self.jmx.bulk([{'type': 'read', 'mbean': PENDING_COMPACTIONS, 'attribute': 'Value'},
+                                                    {'type': 'read', 'mbean': COMPACTION_MANAGER,
+                                                     'attribute': 'Compactions'}])
+        return format_compactionstats(pending_tasks['value'], compactions['value'])
+
+    def _use_agent(self):
+        # a restarted node only has an agent if it was loaded at startup
+        if self.node.pid != self._checked_pid:
+            self._agent_running = self.jmx.is_agent_running()
+            self._checked_pid = self.node.pid
+        return self._agent_running
+
+    def has_agent(self):
+        """
+        @return Whether the node is running with a Jolokia agent listening, i.e. commands go through it
+        """
+        return self.node.is_running() and self._use_agent()
+
+    def nodetool(self, cmd, **kwargs):
+        """
+        Same as node.nodetool(cmd, **kwargs). Only commands without any keyword arguments go through Jolokia.
+        @return A tuple of stdout, stderr and the return code
+        """
+        args = re.split(r'\s+', cmd.strip())
+        command = self._commands.get(args[0])
+        if command is not None and not kwargs and self.has_agent():
+            try:
+                stdout = command(args[1:])
+                if stdout is not None:
+                    return stdout, '', 0
+            except Exception as e:
+                logger.debug("Running `nodetool {}` on {} through Jolokia failed, running nodetool instead: {}"
+                             .format(cmd, self.node.name, e))
+                self.jmx.close()
+                self._checked_pid = None
+        return self.node.nodetool(cmd, **kwargs)
@@ -0,0 +1,43 @@
+"""
+The JDK Cassandra nodes run with, as found by Cassandra's startup scripts.
+"""
+import functools
+import logging
+import os
+import re
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+
+def java_executable():
+    """
+    @return The java executable the nodes run with, the way Cassandra's startup scripts find it
+    """
+    java_home = os.environ.get('JAVA_HOME')
+    if java_home:
+        return os.path.join(java_home, 'bin', 'java')
+    return 'java'
+
+
+@functools.lru_cache(maxsize=None)
+def java_version_output(java):
+    """
+    @return What `java -version` prints, or None if java can't be run
+    """
+    try:
+        p = subprocess.Popen([java, '-version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        logger.debug("Unable to run {}: {}".format(java, e))
+        return None
+    out, _ = p.communicate()
+    return out.decode('utf-8', 'replace') if p.returncode == 0 else None
+
+
+def java_feature_version(version_output):
+    """
+    @param version_output What `java -version` printed
+    @return The feature release of the JDK, e.g. 8 for 1.8.0_292 and 11 for 11.0.2, or None if unknown
+    """
+    match = re.search(r'version "(?:1\.)?(\d+)', version_output or '')
+    return int(match.group(1)) if match is not None else None
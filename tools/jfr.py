@@ -0,0 +1,172 @@
+"""
+Java Flight Recorder profiles of Cassandra nodes.
+
+With --profile-nodes every node starts with a flight recording using the JDK's "profile" settings,
+dumped to RECORDING_FILE in the node's log directory when the test is over (and by the JVM itself
+when a node is stopped gently, so a restarted node keeps the recording of its last JVM). The
+recording is then summarized into SUMMARY_FILE with the JDK's jfr tool: the methods most often on
+CPU, where the most memory gets allocated and which locks threads waited for the longest.
+"""
+import json
+import logging
+import os
+import re
+import subprocess
+
+from collections import Counter
+
+from tools.jdk import java_feature_version
+
+logger = logging.getLogger(__name__)
+
+RECORDING_NAME = 'dtest'
+RECORDING_FILE = 'flight_recording.jfr'
+SUMMARY_FILE = 'flight_recording_summary.txt'
+# how many entries each section of a summary lists
+SUMMARY_TOP = 20
+
+CPU_EVENTS = ('jdk.ExecutionSample',)
+# the profile settings of JDK 16 and later sample allocations, earlier ones record every new TLAB
+ALLOCATION_EVENTS = {'jdk.ObjectAllocationSample': 'weight',
+                     'jdk.ObjectAllocationInNewTLAB': 'tlabSize',
+                     'jdk.ObjectAllocationOutsideTLAB': 'allocationSize'}
+LOCK_EVENTS = {'jdk.JavaMonitorEnter': 'monitorClass',
+               'jdk.ThreadPark': 'parkedClass'}
+JDK_PACKAGES = ('java.', 'javax.', 'jdk.', 'sun.', 'com.sun.')
+ISO_DURATION = re.compile(r'^PT(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?$')
+
+
+def jfr_jvm_args(version_output):
+    """
+    @param version_output What `java -version` printed for the JDK the nodes run with
+    @return The JVM arguments flight recorder needs on that JDK
+    """
+    feature_version = java_feature_version(version_output)
+    if feature_version is None or feature_version >= 11:
+        # flight recorder is part of every JDK since 11 and enabled by default
+        return []
+    if 'OpenJDK' in version_output:
+        # backported to OpenJDK 8u262, where it is free to use
+        return ['-XX:+FlightRecorder']
+    return ['-XX:+UnlockCommercialFeatures', '-XX:+FlightRecorder']
+
+
+def recording_jvm_args(version_output, filename):
+    """
+    @param filename Where the JVM dumps the recording when it exits
+    @return The JVM arguments starting a profiling flight recording along with the JVM
+    """
+    recording = '-XX:StartFlightRecording=name={},settings=profile,dumponexit=true,filename={}'
+    return jfr_jvm_args(version_output) + [recording.format(RECORDING_NAME, filename)]
+
+
+def jfr_executable():
+    """
+    @return The JDK's jfr tool, which JDK 8 doesn't have
+    """
+    java_home = os.environ.get('JAVA_HOME')
+    if java_home:
+        return os.path.join(java_home, 'bin', 'jfr')
+    return 'jfr'
+
+
+def _method_name(frame):
+    method = frame['method']
+    return '{}.{}'.format(method['type']['name'], method['name'])
+
+
+def _frames(event):
+    stack_trace = event['values'].get('stackTrace')
+    return stack_trace['frames'] if stack_trace else []
+
+
+def _top_frame(event):
+    frames = _frames(event)
+    return _method_name(frames[0]) if frames else '<unknown>'
+
+
+def _calling_frame(event):
+    """
+    @return The first method outside the JDK on the stack of event, i.e. the Cassandra code allocating or locking
+    """
+    for frame in _frames(event):
+        name = _method_name(frame)
+        if not name.startswith(JDK_PACKAGES):
+            return name
+    return _top_frame(event)
+
+
+def _seconds(duration):
+    if isinstance(duration, (int, float)):
+        return float(duration)
+    match = ISO_DURATION.match(duration or '')
+    if match is None:
+        return 0.0
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+
+def _class_name(value):
+    return value['name'] if value else '<unknown>'
+
+
+def summarize_events(events):
+    """
+    @param events The events of a recording, as printed by `jfr print --json`
+    @return A text summary of the recording
+    """
+    cpu_samples = Counter()
+    allocated_bytes = Counter()
+    blocked_seconds = Counter()
+    for event in events:
+        event_type = event['type']
+        values = event['values']
+        if event_type in CPU_EVENTS:
+            cpu_samples[_top_frame(event)] += 1
+        elif event_type in ALLOCATION_EVENTS:
+            key = '{} in {}'.format(_class_name(values.get('objectClass')), _calling_frame(event))
+            allocated_bytes[key] += values.get(ALLOCATION_EVENTS[event_type]) or 0
+        elif event_type in LOCK_EVENTS:
+            key = '{} in {}'.format(_class_name(values.get(LOCK_EVENTS[event_type])), _calling_frame(event))
+            blocked_seconds[key] += _seconds(values.get('duration'))
+
+    total_samples = sum(cpu_samples.values())
+    lines = ['Top methods on CPU ({} samples):'.format(total_samples)]
+    lines.extend('  {:8d} {:6.2f}%  {}'.format(count, 100.0 * count / total_samples, method)
+                 for method, count in cpu_samples.most_common(SUMMARY_TOP))
+    lines.append('')
+    lines.append('Allocation hot spots ({:.1f}MB):'.format(sum(allocated_bytes.values()) / 1024 / 1024))
+    lines.extend('  {:10.1f}MB  {}'.format(allocated / 1024 / 1024, site)
+                 for site, allocated in allocated_bytes.most_common(SUMMARY_TOP))
+    lines.append('')
+    lines.append('Lock contention ({:.3f}s blocked):'.format(sum(blocked_seconds.values())))
+    lines.extend('  {:10.3f}s  {}'.format(blocked, site)
+                 for site, blocked in blocked_seconds.most_common(SUMMARY_TOP))
+    return '\n'.join(lines) + '\n'
+
+
+def summarize_recording(recording, summary):
+    """
+    Writes a text summary of the flight recording at path recording to the file at path summary.
+    @return Whether the summary was written
+    """
+    event_types = list(CPU_EVENTS) + list(ALLOCATION_EVENTS) + list(LOCK_EVENTS)
+    try:
+        p = subprocess.Popen([jfr_executable(), 'print', '--json', '--events', ','.join(event_types), recording],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        logger.debug("Unable to run the jfr tool to summarize {}: {}".format(recording, e))
+        return False
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        logger.warning("Unable to summarize flight recording {}: {}".format(recording, stderr.decode('utf-8', 'replace')))
+        return False
+
+    try:
+        events = json.loads(stdout.decode('utf-8'))['recording']['events']
+    except (ValueError, KeyError) as e:
+        logger.warning("Unable to parse flight recording {}: {}".format(recording, e))
+        return False
+    with open(summary, 'w') as f:
+        f.write(summarize_events(events))
+    return True
@@ -1,9 +1,8 @@
 import glob
+import http.client
 import json
 import os
 import subprocess
-import urllib.request
-import urllib.parse
 import logging
 
 import ccmlib.common as common
@@ -13,6 +12,8 @@ from distutils.version import LooseVersion
 logger = logging.getLogger(__name__)
 
 JOLOKIA_JAR = os.path.join('lib', 'jolokia-jvm-1.2.3-agent.jar')
+JOLOKIA_PORT = 8778
+JOLOKIA_TIMEOUT = 10.0
 CLASSPATH_SEP = ';' if common.is_win() else ':'
 
 
@@ -33,6 +34,25 @@ def java_bin():
         return 'java'
 
 
+def jolokia_address(node):
+    """
+    @return The address the Jolokia agent of node listens on: its storage interface, which unlike the
+            native transport address (e.g. rpc_address set to 127.0.0.1 on every node) no two nodes share
+    """
+    return node.network_interfaces['storage'][0]
+
+
+def jolokia_startup_jvm_args():
+    """
+    @return The JVM arguments loading the Jolokia agent into a node when it starts, for the cluster-wide
+            cassandra.in.sh: the agent listens on jolokia_address(node), which ccm writes to the node's
+            cassandra.yaml as listen_address and the script reads from there when the node starts
+    """
+    agent_jar = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), JOLOKIA_JAR)
+    host = """$(sed -n 's/^listen_address: *//p' "$CASSANDRA_CONF/cassandra.yaml")"""
+    return ['-javaagent:{jar}=host={host},port={port}'.format(jar=agent_jar, host=host, port=JOLOKIA_PORT)]
+
+
 def make_mbean(package, type, **kwargs):
     '''
     Builds the name for an mbean.
@@ -191,18 +211,42 @@ class JolokiaAgent(object):
 
     node = None
 
-    def __init__(self, node):
+    def __init__(self, node, timeout=JOLOKIA_TIMEOUT):
+        """
+        `timeout` is how many seconds a request may take, including the
+        JMX operation it runs.
+        """
         self.node = node
+        self.timeout = timeout
+        self._connection = None
+        self._attached = False
+
+    def is_agent_running(self):
+        """
+        Checks whether an agent answers on the node, whoever started it.
+        """
+        try:
+            self._query({'type': 'version'}, verbose=False)
+            return True
+        except Exception:
+            self.close()
+            return False
 
     def start(self):
         """
         Starts the Jolokia agent.  The process will fork from the parent
         and continue running until stop() is called.
+
+        Nodes started with the agent already loaded (see --jolokia-at-startup)
+        are just connected to.
         """
+        if self.is_agent_running():
+            return
+
         args = (java_bin(),
                 '-cp', jolokia_classpath(),
                 'org.jolokia.jvmagent.client.AgentLauncher',
-                '--host', self.node.network_interfaces['binary'][0],
+                '--host', jolokia_address(self.node),
                 'start', str(self.node.pid))
 
         try:
@@ -212,11 +256,16 @@ class JolokiaAgent(object):
             print("Exit status was: %d" % (exc.returncode,))
             print("Output was: %s" % (exc.output,))
             raise
+        self._attached = True
 
     def stop(self):
         """
-        Stops the Jolokia agent.
+        Stops the Jolokia agent, unless it was loaded when the node started.
         """
+        self.close()
+        if not self._attached:
+            return
+        self._attached = False
         args = (java_bin(),
                 '-cp', jolokia_classpath(),
                 'org.jolokia.jvmagent.client.AgentLauncher',
@@ -229,16 +278,45 @@ class JolokiaAgent(object):
             print("Output was: %s" % (exc.output,))
             raise
 
-    def _query(self, body, verbose=True):
+    def close(self):
+        """
+        Closes the HTTP connection to the agent, if one is open.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _post(self, body):
+        """
+        Posts body as JSON to the agent over a connection that is kept open between requests,
+        reconnecting once should the agent have closed it.
+        @return The decoded JSON response
+        """
         request_data = json.dumps(body).encode("utf-8")
-        url = 'http://%s:8778/jolokia/' % (self.node.network_interfaces['binary'][0],)
-        req = urllib.request.Request(url)
-        response = urllib.request.urlopen(req, data=request_data, timeout=10.0)
-        if response.code != 200:
-            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (response.code, response.readlines()))
-
-        raw_response = response.readline()
-        response = json.loads(raw_response.decode(encoding='utf-8'))
+        for attempt in range(2):
+            reused = self._connection is not None
+            if not reused:
+                self._connection = http.client.HTTPConnection(jolokia_address(self.node), JOLOKIA_PORT,
+                                                              timeout=self.timeout)
+            try:
+                self._connection.request('POST', '/jolokia/', body=request_data,
+                                         headers={'Content-Type': 'application/json'})
+                response = self._connection.getresponse()
+                # the whole response has to be read before the connection can be used again
+                raw_response = response.read()
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            break
+
+        if response.status != 200:
+            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (response.status, raw_response))
+        return json.loads(raw_response.decode(encoding='utf-8'))
+
+    @staticmethod
+    def _check_response(response, verbose=True):
         if response['status'] != 200:
             stacktrace = response.get('stacktrace')
             if stacktrace and verbose:
@@ -248,6 +326,49 @@ class JolokiaAgent(object):
             raise Exception("Jolokia agent returned non-200 status: %s" % (response,))
         return response
 
+    def _query(self, body, verbose=True):
+        return self._check_response(self._post(body), verbose=verbose)
+
+    def bulk(self, bodies, verbose=True):
+        """
+        Sends several requests to the agent in one round trip.
+
+        `bodies` is a list of Jolokia requests, like the ones read_attribute() or
+        execute_method() send.
+
+        Returns the responses in the same order, raising if any of them failed.
+        """
+        if not bodies:
+            return []
+        return [self._check_response(response, verbose=verbose) for response in self._post(list(bodies))]
+
+    def read_many(self, reads, verbose=True):
+        """
+        Reads several JMX attributes in one round trip.
+
+        `reads` is a list of (mbean, attribute) or (mbean, attribute, path)
+        tuples, as would be passed to read_attribute().
+
+        Returns a dict of each of those tuples to the value read.
+
+        Example usage:
+
+            mbean = make_mbean('metrics', type='ReadRepair', name='RepairedBlocking')
+            values = jmx.read_many([(mbean, 'Count'), (mbean, 'OneMinuteRate')])
+            count = values[(mbean, 'Count')]
+        """
+        reads = list(reads)
+        bodies = []
+        for read in reads:
+            body = {'type': 'read',
+                    'mbean': read[0],
+                    'attribute': read[1]}
+            if len(read) > 2 and read[2]:
+                body['path'] = read[2]
+            bodies.append(body)
+        responses = self.bulk(bodies, verbose=verbose)
+        return {read: response['value'] for read, response in zip(reads, responses)}
+
     def has_mbean(self, mbean, verbose=True):
         """
         Check for the existence of an MBean
@@ -0,0 +1,194 @@
+"""
+Saving the logs of a test's cluster once the test is over.
+
+copy_logs() copies every log of every node to the logs directory, which is what dtests have always
+done. LogArchiver instead streams the logs into one compressed archive per test on a background
+thread, so teardown doesn't block on copying large files. It only keeps complete logs for failed
+tests; for passing tests it keeps the end of each log and the errors found in it.
+"""
+import io
+import logging
+import os
+import tarfile
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ccmlib.common import is_win
+
+from tools import jfr, resource_sampler
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def node_log_files(node):
+    """
+    @return A list of (saved name, path) of the log files of node that get saved after a test
+    """
+    return [(node.name + ".log", node.logfilename()),
+            (node.name + "_debug.log", node.debuglogfilename()),
+            (node.name + "_gc.log", node.gclogfilename()),
+            (node.name + "_compaction.log", node.compactionlogfilename())]
+
+
+def node_profile_files(node):
+    """
+    @return A list of (saved name, path) of the flight recording and resource samples of node and their
+            summaries, which are always saved whole
+    """
+    log_dir = os.path.join(node.get_path(), 'logs')
+    return [(node.name + ".jfr", os.path.join(log_dir, jfr.RECORDING_FILE)),
+            (node.name + "_profile.txt", os.path.join(log_dir, jfr.SUMMARY_FILE)),
+            (node.name + "_resources.csv", os.path.join(log_dir, resource_sampler.SAMPLES_FILE)),
+            (node.name + "_resources.json", os.path.join(log_dir, resource_sampler.SUMMARY_FILE))]
+
+
+def _link_last(directory, target, last_link):
+    if os.path.lexists(last_link):
+        os.unlink(last_link)
+    if not is_win():
+        os.symlink(os.path.relpath(target, directory), last_link)
+
+
+def copy_logs(cluster, directory, basedir, last_link):
+    """
+    Copies the log files of every node of cluster to directory/basedir and points last_link at it.
+    """
+    if not os.path.exists(directory):
+        os.mkdir(directory)
+    nodes = list(cluster.nodelist())
+    if not nodes:
+        return
+    logdir = os.path.join(directory, basedir)
+    os.mkdir(logdir)
+    for node in nodes:
+        for saved_name, log in node_log_files(node) + node_profile_files(node):
+            if os.path.exists(log):
+                with open(log, 'rb') as src, open(os.path.join(logdir, saved_name), 'wb') as dst:
+                    _copy_range(src, dst, 0, os.fstat(src.fileno()).st_size)
+    _link_last(directory, logdir, last_link)
+
+
+def _copy_range(src, dst, start, length):
+    src.seek(start)
+    while length > 0:
+        buf = src.read(min(COPY_BUFFER_SIZE, length))
+        if not buf:
+            break
+        dst.write(buf)
+        length -= len(buf)
+
+
+class _LogSlice(object):
+    """
+    The part of an open log file that goes into an archive, taken when the test ended so that
+    the node can keep logging (or its directory can be removed) while the archive is written.
+    """
+
+    def __init__(self, saved_name, fileobj, start, end):
+        self.saved_name = saved_name
+        self.fileobj = fileobj
+        self.start = start
+        self.end = end
+
+    def add_to(self, tar):
+        info = tarfile.TarInfo(self.saved_name)
+        info.size = self.end - self.start
+        info.mtime = time.time()
+        self.fileobj.seek(self.start)
+        tar.addfile(info, self.fileobj)
+
+
+class LogArchiver(object):
+    """
+    Writes a <basedir>.tar.gz archive per test, one at a time, on a background thread.
+    """
+
+    def __init__(self, tail_bytes, background=None):
+        """
+        @param tail_bytes How much of the end of each log to keep for passing tests
+        @param background Whether to write archives on a background thread. Defaults to everywhere
+                          but Windows, where files that are held open can't be removed along with
+                          the cluster directory.
+        """
+        self.tail_bytes = tail_bytes
+        if background is None:
+            background = not is_win()
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+
+    def archive(self, cluster, directory, basedir, last_link, full, errors=None):
+        """
+        Archives the logs of every node of cluster to directory/basedir.tar.gz and points last_link at it.
+        Returns as soon as the log files are open, the archive itself is written in the background.
+
+        @param full Whether to archive the complete logs, or only their last tail_bytes
+        @param errors Optional dict of node name to the errors found in its log (in the format of
+                      ccm's grep_log_for_errors), saved in the archive as <node>_errors.txt
+        """
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+        nodes = list(cluster.nodelist())
+        if not nodes:
+            return
+
+        slices = []
+        for node in nodes:
+            for saved_name, log in node_log_files(node):
+                if not os.path.exists(log):
+                    continue
+                fileobj = open(log, 'rb')
+                end = os.fstat(fileobj.fileno()).st_size
+                start = 0
+                if not full and end > self.tail_bytes:
+                    start = end - self.tail_bytes
+                    saved_name += ".tail"
+                slices.append(_LogSlice(saved_name, fileobj, start, end))
+            for saved_name, path in node_profile_files(node):
+                if os.path.exists(path):
+                    fileobj = open(path, 'rb')
+                    slices.append(_LogSlice(saved_name, fileobj, 0, os.fstat(fileobj.fileno()).st_size))
+
+        excerpts = []
+        for node_name, node_errors in sorted((errors or {}).items()):
+            if node_errors:
+                text = '\n\n'.join('\n'.join(error) for error in node_errors) + '\n'
+                excerpts.append((node_name + "_errors.txt", text.encode('utf-8')))
+
+        archive = os.path.join(directory, basedir + ".tar.gz")
+        if self._executor is None:
+            self._write(directory, archive, last_link, slices, excerpts)
+        else:
+            self._executor.submit(self._write, directory, archive, last_link, slices, excerpts)
+
+    @staticmethod
+    def _write(directory, archive, last_link, slices, excerpts):
+        # write to a temporary name so that an archive that exists is always complete, and only
+        # point last_link at it once it does
+        partial_archive = archive + ".partial"
+        try:
+            with tarfile.open(partial_archive, 'w:gz', compresslevel=6) as tar:
+                for log_slice in slices:
+                    log_slice.add_to(tar)
+                for saved_name, data in excerpts:
+                    info = tarfile.TarInfo(saved_name)
+                    info.size = len(data)
+                    info.mtime = time.time()
+                    tar.addfile(info, io.BytesIO(data))
+            os.rename(partial_archive, archive)
+            _link_last(directory, archive, last_link)
+        except Exception:
+            logger.error("Error archiving logs to {}: {}".format(archive, traceback.format_exc()))
+        finally:
+            for log_slice in slices:
+                log_slice.fileobj.close()
+
+    def wait(self):
+        """
+        Waits for every archive to be written.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
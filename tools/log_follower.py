@@ -0,0 +1,300 @@
+"""
+Event driven following of node logs.
+
+A single LogFollower thread per cluster tails the system.log of every node and hands each new line
+to whoever is interested: the active error watch, and any number of watch_for() calls blocked
+waiting for a message. On Linux the thread sleeps on inotify and wakes up as soon as a node writes
+to its log, instead of every watcher polling the log files on its own every 0.25s. Elsewhere it
+falls back to polling.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import platform
+import re
+import select
+import struct
+import threading
+import time
+
+from collections import OrderedDict
+
+from ccmlib.node import TimeoutError
+
+from tools.log_scanner import ErrorLineGrouper
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.25
+# with inotify the thread only wakes up on its own to notice nodes added to the cluster
+HOUSEKEEPING_INTERVAL = 1.0
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+_IN_MODIFY = 0x00000002
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+
+
+class _Inotify(object):
+    """
+    Minimal ctypes binding to Linux inotify, only used to learn that something changed.
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watched = set()
+
+    @classmethod
+    def create(cls):
+        """
+        @return An _Inotify instance, or None if inotify isn't available on this platform
+        """
+        if platform.system() != 'Linux':
+            return None
+        try:
+            return cls()
+        except (OSError, AttributeError) as e:
+            logger.debug("inotify not available, polling logs instead: {}".format(e))
+            return None
+
+    def watch(self, directory):
+        if directory in self._watched or not os.path.isdir(directory):
+            return
+        if self._libc.inotify_add_watch(self.fd, directory.encode('utf-8'), _IN_MODIFY | _IN_CREATE | _IN_MOVED_TO) < 0:
+            logger.debug("inotify_add_watch({}) failed with errno {}".format(directory, ctypes.get_errno()))
+            return
+        self._watched.add(directory)
+
+    def drain(self):
+        """
+        @return The names of the files that changed since the last call
+        """
+        names = set()
+        header_size = struct.calcsize('iIII')
+        try:
+            while True:
+                buf = os.read(self.fd, 64 * 1024)
+                if not buf:
+                    break
+                pos = 0
+                while pos + header_size <= len(buf):
+                    _, _, _, name_len = struct.unpack_from('iIII', buf, pos)
+                    pos += header_size
+                    names.add(buf[pos:pos + name_len].rstrip(b'\0').decode('utf-8', errors='replace'))
+                    pos += name_len
+        except BlockingIOError:
+            pass
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Waiter(object):
+
+    def __init__(self, node_name, exprs, from_mark):
+        self.node_name = node_name
+        self.remaining = [re.compile(e) for e in exprs]
+        self.from_mark = from_mark
+        self.matchings = []
+        self.done = threading.Event()
+
+    def feed(self, offset, line):
+        if offset < self.from_mark or self.done.is_set():
+            return
+        for e in list(self.remaining):
+            m = e.search(line)
+            if m:
+                self.matchings.append((line, m))
+                self.remaining.remove(e)
+        if not self.remaining:
+            self.done.set()
+
+
+class LogFollower(threading.Thread):
+    """
+    Follows the logs of every node of a cluster, including nodes added after it started.
+
+    The interface mirrors ccm's actively_watch_logs_for_error thread: on_error is called with an
+    OrderedDict mapping node name to a list of errors whenever new errors are logged, and join()
+    stops the thread after a final pass over the logs. Exceptions raised by on_error can't end the
+    test from this thread, so they are kept in callback_errors for the teardown to report.
+    """
+
+    def __init__(self, cluster, on_error=None, filename='system.log', start_marks=None, on_new_node=None):
+        """
+        @param cluster The ccm cluster whose node logs to follow
+        @param on_error Optional callback for newly logged errors
+        @param filename The log file to follow in each node's logs directory
+        @param start_marks Optional dict of node name to log offset to start following from, nodes
+                           that aren't in it are followed from the start of their log
+        @param on_new_node Optional callback called from the thread with each node the first time it is followed
+        """
+        super(LogFollower, self).__init__(name='LogFollower')
+        self.daemon = True
+        self.cluster = cluster
+        self.on_error = on_error
+        self.on_new_node = on_new_node
+        self.callback_errors = []
+        self.filename = filename
+        self._offsets = dict(start_marks or {})
+        self._remainders = {}
+        self._groupers = {}
+        self._waiters = []
+        self._followed = set()
+        self._lock = threading.RLock()
+        self._stop_requested = threading.Event()
+        self._wake_r, self._wake_w = os.pipe()
+        self._inotify = _Inotify.create()
+
+    def _log_path(self, node):
+        return os.path.join(node.get_path(), 'logs', self.filename)
+
+    def mark(self, node):
+        """
+        Same as ccm's node.mark_log(): the current size of the node's log.
+        """
+        path = self._log_path(node)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def watch_for(self, node, exprs, from_mark=None, timeout=600):
+        """
+        Drop-in replacement for ccm's node.watch_log_for(exprs, from_mark, timeout) that is woken up
+        by the follower thread instead of polling the log.
+        """
+        single_expr = isinstance(exprs, str)
+        waiter = _Waiter(node.name, [exprs] if single_expr else exprs, from_mark or 0)
+
+        with self._lock:
+            # catch up on the lines the thread already went past, it feeds the waiter everything after them
+            followed_up_to = self._offsets.get(node.name, 0) - len(self._remainders.get(node.name, b''))
+            self._read_range(node, waiter.from_mark, followed_up_to, waiter.feed)
+            if not waiter.done.is_set():
+                self._waiters.append(waiter)
+        try:
+            if not waiter.done.wait(timeout):
+                raise TimeoutError(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()) + " [" + node.name + "] Missing: " +
+                                   str([e.pattern for e in waiter.remaining]) + " not found in " + self.filename)
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+        return waiter.matchings[0] if single_expr else waiter.matchings
+
+    def _read_range(self, node, start, end, callback):
+        if start >= end:
+            return
+        with open(self._log_path(node), 'rb') as f:
+            f.seek(start)
+            offset = start
+            for raw_line in f.read(end - start).split(b'\n')[:-1]:
+                callback(offset, raw_line.decode('utf-8', errors='replace').rstrip('\r'))
+                offset += len(raw_line) + 1
+
+    def _follow(self, node):
+        """
+        Reads everything appended to the node's log since the last call.
+        @return The errors found in the new lines
+        """
+        path = self._log_path(node)
+        if self._inotify is not None:
+            self._inotify.watch(os.path.dirname(path))
+        if not os.path.exists(path):
+            return []
+
+        name = node.name
+        offset = self._offsets.get(name, 0)
+        if os.path.getsize(path) < offset:
+            offset = 0
+            self._remainders[name] = b''
+        remainder = self._remainders.get(name, b'')
+        line_offset = offset - len(remainder)
+        grouper = self._groupers.setdefault(name, ErrorLineGrouper())
+        waiters = [w for w in self._waiters if w.node_name == name]
+        errors = []
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                raw_lines = (remainder + chunk).split(b'\n')
+                remainder = raw_lines.pop()
+                lines = []
+                for raw_line in raw_lines:
+                    line = raw_line.decode('utf-8', errors='replace').rstrip('\r')
+                    for waiter in waiters:
+                        waiter.feed(line_offset, line)
+                    lines.append(line)
+                    line_offset += len(raw_line) + 1
+                grouper.feed(lines, errors)
+
+        self._offsets[name] = offset
+        self._remainders[name] = remainder
+        return errors
+
+    def _follow_all(self):
+        errordata = OrderedDict()
+        with self._lock:
+            for node in self.cluster.nodelist():
+                if node.name not in self._followed:
+                    self._followed.add(node.name)
+                    if self.on_new_node is not None:
+                        self.on_new_node(node)
+                try:
+                    errors = self._follow(node)
+                except IOError as e:
+                    logger.debug("Unable to read log of {}: {}".format(node.name, e))
+                    continue
+                if errors:
+                    errordata[node.name] = errors
+
+        if errordata and self.on_error is not None:
+            try:
+                self.on_error(errordata)
+            except BaseException as e:
+                # on_error may pytest.fail(), which can't end the test from this thread anyway
+                logger.debug("Log error callback raised {}".format(e))
+                self.callback_errors.append(e)
+
+    def run(self):
+        try:
+            follow = True
+            while not self._stop_requested.is_set():
+                if follow:
+                    self._follow_all()
+                if self._inotify is None:
+                    self._stop_requested.wait(POLL_INTERVAL)
+                    continue
+                readable, _, _ = select.select([self._wake_r, self._inotify.fd], [], [], HOUSEKEEPING_INTERVAL)
+                if self._inotify.fd in readable:
+                    # the logs directory also holds debug.log and gc.log, which change all the time
+                    follow = self.filename in self._inotify.drain()
+                else:
+                    # following on timeouts too is how nodes added to the cluster get noticed
+                    follow = True
+            # a final pass to get to the very end of the logs
+            self._follow_all()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def join(self, timeout=None):
+        """
+        Stops following the logs, after a final pass over them.
+        """
+        if not self._stop_requested.is_set():
+            self._stop_requested.set()
+            os.write(self._wake_w, b'x')
+        super(LogFollower, self).join(timeout)
+        if not self.is_alive() and self._wake_r is not None:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
@@ -0,0 +1,158 @@
+"""
+Incremental scanning of node logs for errors.
+
+ccm's node.grep_log_for_errors() reads the whole log every time it is called. LogErrorScanner
+remembers how far it got in each log file and only reads what was appended since, in large
+chunks, so checking the logs of a long running test for errors doesn't cost more than the
+amount of log it produced since the last check.
+"""
+import functools
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+# same rules as ccm's grep_log_for_errors: ERROR lines and WARN lines mentioning an exception start
+# an error, and lines without a log level that follow them (i.e. stack traces) belong to it
+_LOG_LEVEL_RE = re.compile(r'(\W|^)(INFO|DEBUG|WARN|ERROR)\W')
+_EXCEPTION_RE = re.compile(r'[Ee]xception|AssertionError')
+
+
+def _log_level(line):
+    match = _LOG_LEVEL_RE.search(line)
+    return match.group(2) if match else None
+
+
+class ErrorLineGrouper(object):
+    """
+    Turns a stream of log lines into error blocks (lists of lines). Keeps track of whether the
+    last line fed belonged to an error, so a stack trace split across two feeds still ends up
+    in a single error block.
+    """
+
+    def __init__(self):
+        self.in_error = False
+
+    def feed(self, lines, errors):
+        """
+        @param lines Iterable of log lines without their line terminators
+        @param errors List of the error blocks found so far, new error blocks are appended to it
+        """
+        for line in lines:
+            level = _log_level(line)
+            if level == 'ERROR' or (level == 'WARN' and _EXCEPTION_RE.search(line)):
+                errors.append([line])
+                self.in_error = True
+            elif level is None and self.in_error:
+                # errors is empty if the start of this error went to an earlier, discarded list
+                if errors:
+                    errors[-1].append(line)
+            else:
+                self.in_error = False
+
+
+class LogErrorScanner(object):
+    """
+    Finds errors in node logs, reading every byte of a log at most once. Errors found by earlier
+    scans are remembered, so errors() returns the same as grep_log_for_errors() would, including
+    leaving out the errors logged before the last node.mark_log_for_errors().
+    """
+
+    def __init__(self):
+        self._offsets = {}
+        self._groupers = {}
+        self._errors = {}
+        # path -> the node.error_mark the errors of the log were last trimmed to
+        self._error_marks = {}
+
+    @staticmethod
+    def _log_path(node, filename):
+        return os.path.join(node.get_path(), 'logs', filename)
+
+    def mark(self, node, filename='system.log'):
+        """
+        Skips everything logged so far, so the next scan only reports errors logged after this call.
+        """
+        path = self._log_path(node, filename)
+        self._offsets[path] = os.path.getsize(path) if os.path.exists(path) else 0
+        self._groupers[path] = ErrorLineGrouper()
+        self._errors[path] = []
+        self._error_marks[path] = getattr(node, 'error_mark', 0)
+
+    def scan(self, node, filename='system.log'):
+        """
+        @return The errors logged by node since the last scan (or mark), in the format of
+                ccm's grep_log_for_errors: a list of errors, each a list of lines
+        """
+        path = self._log_path(node, filename)
+        if not os.path.exists(path):
+            return []
+
+        offset = self._offsets.get(path, 0)
+        error_mark = getattr(node, 'error_mark', 0)
+        if error_mark != self._error_marks.get(path, 0):
+            # node.mark_log_for_errors() was called since the last scan: forget what came before the mark,
+            # which means going back over anything read past it already
+            offset = error_mark
+            self._groupers[path] = ErrorLineGrouper()
+            self._errors[path] = []
+            self._error_marks[path] = error_mark
+        if os.path.getsize(path) < offset:
+            logger.debug("{} shrank, assuming it was rotated and scanning from the start".format(path))
+            offset = 0
+            self._groupers[path] = ErrorLineGrouper()
+            self._errors[path] = []
+        grouper = self._groupers.setdefault(path, ErrorLineGrouper())
+        errors = self._errors.setdefault(path, [])
+        known_errors = len(errors)
+
+        remainder = b''
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                lines = (remainder + chunk).split(b'\n')
+                # the last element is an incomplete line (or empty); keep it for the next chunk
+                remainder = lines.pop()
+                offset += len(chunk)
+                grouper.feed((line.decode('utf-8', errors='replace').rstrip('\r') for line in lines), errors)
+
+        # a line still being written gets picked up by the next scan
+        self._offsets[path] = offset - len(remainder)
+        return errors[known_errors:]
+
+    def errors(self, node, filename='system.log'):
+        """
+        @return All errors logged by node since the scanner was created (or since the last mark),
+                in the format of ccm's grep_log_for_errors
+        """
+        self.scan(node, filename)
+        return list(self._errors.get(self._log_path(node, filename), []))
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_patterns(patterns):
+    if all(isinstance(pattern, str) for pattern in patterns):
+        try:
+            return [re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))]
+        except re.error:
+            # e.g. patterns with global inline flags can't be combined
+            pass
+    return [re.compile(pattern) for pattern in patterns]
+
+
+def matches_any_pattern(patterns, text):
+    """
+    @param patterns Sequence of regular expressions, e.g. DTestSetup.ignore_log_patterns
+    @param text The string to search
+    @return True if any pattern is found in text. All patterns are searched in a single pass
+            through one precompiled regex.
+    """
+    if not patterns:
+        return False
+    return any(regex.search(text) for regex in _compile_patterns(tuple(patterns)))
@@ -0,0 +1,107 @@
+"""
+Leases disjoint blocks of loopback addresses and JMX ports so several pytest processes
+(e.g. pytest-xdist workers) can run ccm clusters on the same host at the same time.
+
+Without a lease every cluster uses 127.0.0.1..N and the JMX ports 7100, 7200, ... With a lease
+for block b, nodes live on 127.0.b.1..N and their JMX (and debug/byteman) ports are shifted by b.
+Storage, native and thrift ports bind to the node's own address, so they don't need to move.
+Leases are held with an exclusive lock on a per-block file, which the OS drops if the process dies.
+"""
+import errno
+import logging
+import os
+import platform
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+LEASE_DIR = os.path.join(tempfile.gettempdir(), 'dtest-loopback-leases')
+# block 0 is what runs without a lease use, and port offsets have to stay below the 100 port
+# gap ccm leaves between the JMX ports of consecutive nodes
+MAX_BLOCK = 99
+
+
+class LoopbackLease(object):
+    """
+    A leased block of loopback addresses. Use LoopbackLease.acquire() to get one.
+    """
+
+    def __init__(self, block, lock_file=None):
+        self.block = block
+        self._lock_file = lock_file
+
+    @property
+    def ipprefix(self):
+        return '127.0.{block}.'.format(block=self.block)
+
+    @property
+    def port_offset(self):
+        return self.block
+
+    @classmethod
+    def acquire(cls):
+        """
+        @return A lease for the first free block, or the default block 0 if leasing isn't supported on this platform
+        """
+        if platform.system() != 'Linux':
+            # only Linux routes all of 127.0.0.0/8 to the loopback interface out of the box
+            logger.warning("Loopback address leasing is only supported on Linux, using the default addresses")
+            return cls(0)
+
+        import fcntl
+
+        os.makedirs(LEASE_DIR, exist_ok=True)
+        for block in range(1, MAX_BLOCK + 1):
+            lock_file = open(os.path.join(LEASE_DIR, 'block-{}.lock'.format(block)), 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                lock_file.close()
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    continue
+                raise
+            logger.debug("Leased loopback block 127.0.{}.0/24".format(block))
+            return cls(block, lock_file)
+
+        raise RuntimeError("All {} loopback blocks are leased by other dtest processes".format(MAX_BLOCK))
+
+    def release(self):
+        if self._lock_file is not None:
+            # closing the file drops the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    def apply(self, cluster):
+        """
+        Makes the nodes of a (not yet populated) ccm cluster use the leased addresses and ports.
+        @raise RuntimeError If the installed ccm can't move a cluster to other addresses
+        """
+        if self.block == 0:
+            return
+
+        if not hasattr(cluster, 'set_ipprefix'):
+            # e.g. the ccm 3.1.5 release on PyPI, which only takes an ipprefix as an argument to populate()
+            raise RuntimeError("Leasing loopback addresses needs a ccm with Cluster.set_ipprefix, "
+                               "which the installed ccm lacks. Install ccm from git or drop --lease-loopback-addresses")
+        cluster.set_ipprefix(self.ipprefix)
+        add = cluster.add
+        port_offset = self.port_offset
+
+        def add_with_leased_ports(node, is_seed, *args, **kwargs):
+            node.jmx_port = _shift_port(node.jmx_port, port_offset)
+            node.remote_debug_port = _shift_port(node.remote_debug_port, port_offset)
+            if hasattr(node, 'byteman_port'):
+                node.byteman_port = _shift_port(node.byteman_port, port_offset)
+            # the node wrote cassandra-env with the default JMX port when it was created
+            node.import_config_files()
+            return add(node, is_seed, *args, **kwargs)
+
+        # populate() and tools.misc.new_node() both create nodes with the default ports and then hand them to add()
+        cluster.add = add_with_leased_ports
+
+
+def _shift_port(port, offset):
+    # ccm stores these ports as strings, and '0' means the port is disabled
+    if port is None or str(port) == '0':
+        return port
+    return str(int(port) + offset)
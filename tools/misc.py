@@ -9,6 +9,8 @@ from collections import Mapping
 
 from ccmlib.node import Node
 
+from tools.readiness import backoff_delays, sleep_until_next_attempt
+
 
 logger = logging.getLogger(__name__)
 
@@ -16,15 +18,18 @@ logger = logging.getLogger(__name__)
 # work for cluster started by populate
 def new_node(cluster, bootstrap=True, token=None, remote_debug_port='0', data_center=None):
     i = len(cluster.nodes) + 1
+    # honour the loopback block leased for this process, see tools.loopback. ccm releases without
+    # get_ipprefix can't be leased other addresses, so their nodes are on the default ones
+    address = '{}{}'.format(getattr(cluster, 'get_ipprefix', lambda: '127.0.0.')(), i)
     node = Node('node%s' % i,
                 cluster,
                 bootstrap,
-                ('127.0.0.%s' % i, 9160),
-                ('127.0.0.%s' % i, 7000),
+                (address, 9160),
+                (address, 7000),
                 str(7000 + i * 100),
                 remote_debug_port,
                 token,
-                binary_interface=('127.0.0.%s' % i, 9042))
+                binary_interface=(address, 9042))
     cluster.add(node, not bootstrap, data_center=data_center)
     return node
 
@@ -34,6 +39,7 @@ def retry_till_success(fun, *args, **kwargs):
     bypassed_exception = kwargs.pop('bypassed_exception', Exception)
 
     deadline = time.time() + timeout
+    delays = backoff_delays()
     while True:
         try:
             return fun(*args, **kwargs)
@@ -41,8 +47,8 @@ def retry_till_success(fun, *args, **kwargs):
             if time.time() > deadline:
                 raise
             else:
-                # brief pause before next attempt
-                time.sleep(0.25)
+                # brief pause before next attempt, growing while the failures persist
+                sleep_until_next_attempt(delays, deadline)
 
 
 def generate_ssl_stores(base_dir, passphrase='cassandra'):
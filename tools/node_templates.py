@@ -0,0 +1,123 @@
+"""
+On-disk templates of freshly started nodes.
+
+The first boot of a node spends a lot of time creating the system keyspaces, auth tables and
+the initial schema. A template captures the data, commitlog, saved cache and hints directories
+of the nodes of a cluster right after its first start, keyed by everything that ends up baked
+into those files (Cassandra build and when it was built, topology, addresses, yaml options). Later clusters with the
+same key copy the template into their freshly populated node directories before the first start.
+
+Copies use reflinks when the filesystem supports them and are plain copies otherwise. Files are
+never hardlinked: a node writing to or deleting a file it shares with the template (or with
+another node) would corrupt it for everyone else.
+"""
+import hashlib
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+
+from tools.cluster_pool import saved_config_options
+from tools.versions import build_mtimes
+
+logger = logging.getLogger(__name__)
+
+# directories of a ccm node that hold state written by Cassandra, as opposed to conf, bin and logs
+NODE_STATE_DIRS = ('commitlogs', 'saved_caches', 'hints', 'cdc_raw')
+
+# (source device, destination device) -> whether cp --reflink=always works between them
+_reflink_support = {}
+
+
+def node_template_key(cluster, nodes, data_dir_count):
+    """
+    @param cluster The configured ccm cluster
+    @param nodes Node count as accepted by ccm's Cluster.populate
+    @param data_dir_count Number of data directories per node
+    @return A string identifying the template a cluster with this shape can start from
+    """
+    if isinstance(nodes, int):
+        nodes = [nodes]
+    config_options = sorted((k, repr(v)) for k, v in saved_config_options(cluster).items())
+    # ccm releases without get_ipprefix always use the default addresses
+    ipprefix = getattr(cluster, 'get_ipprefix', lambda: '127.0.0.')()
+    # a build rebuilt in place keeps its directory and version, but not the system tables it writes
+    key = repr((list(nodes), cluster.name, ipprefix, cluster.get_install_dir(), build_mtimes(cluster.get_install_dir()),
+                str(cluster.version()), data_dir_count, config_options))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _node_state_dirs(node_path):
+    for name in sorted(os.listdir(node_path)):
+        if (name.startswith('data') or name in NODE_STATE_DIRS) and os.path.isdir(os.path.join(node_path, name)):
+            yield name
+
+
+def copy_tree(src, dst):
+    """
+    Copies the directory src to dst (which must not exist yet) as cheaply as the filesystem allows.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    if platform.system() == 'Linux':
+        devices = (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dst))).st_dev)
+        if _reflink_support.get(devices, True):
+            if subprocess.call(['cp', '-a', '--reflink=always', src, dst],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
+                _reflink_support[devices] = True
+                return
+            logger.debug("Reflinks not supported between {} and {}, falling back to copies".format(src, dst))
+            _reflink_support[devices] = False
+            shutil.rmtree(dst, ignore_errors=True)
+
+    shutil.copytree(src, dst)
+
+
+class NodeTemplateCache(object):
+    """
+    A directory of node templates, one sub directory per template key.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+
+    def _template_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def has_template(self, key):
+        return os.path.isdir(self._template_dir(key))
+
+    def save(self, key, cluster):
+        """
+        Captures the state directories of every node of a stopped cluster as the template for key.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # build the template next to its final location and rename it into place, so that
+        # concurrent dtest processes never see a half written template
+        staging_dir = tempfile.mkdtemp(prefix='{}.'.format(key), dir=self.cache_dir)
+        try:
+            for node in cluster.nodelist():
+                node_path = node.get_path()
+                for name in _node_state_dirs(node_path):
+                    copy_tree(os.path.join(node_path, name), os.path.join(staging_dir, node.name, name))
+            os.rename(staging_dir, self._template_dir(key))
+            logger.debug("Saved node template {} to {}".format(key, self.cache_dir))
+        except OSError as e:
+            # most likely another process saved the same template first
+            logger.debug("Not saving node template {}: {}".format(key, e))
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def materialize(self, key, cluster):
+        """
+        Replaces the state directories of every node of a populated, never started cluster with
+        the ones from the template for key.
+        """
+        template_dir = self._template_dir(key)
+        for node in cluster.nodelist():
+            node_path = node.get_path()
+            for name in _node_state_dirs(os.path.join(template_dir, node.name)):
+                shutil.rmtree(os.path.join(node_path, name), ignore_errors=True)
+                copy_tree(os.path.join(template_dir, node.name, name), os.path.join(node_path, name))
+        logger.debug("Materialized node template {} into {}".format(key, cluster.get_path()))
@@ -0,0 +1,322 @@
+"""
+Parsers for the output of the nodetool commands tests read.
+
+Tests used to pick what they needed out of nodetool output with ad hoc regexes, each copy breaking
+in its own way when the format changed between versions. The parse_* functions here turn the
+output of status, tpstats, tablestats (cfstats), netstats, compactionstats, gcstats and
+describecluster into namedtuples, and accept the formats of every version from 2.1 to 4.0: human
+readable sizes in both KB and KiB, the optional id column of compactionstats, the Dropped column
+of netstats and the latencies of the 4.0 tpstats, and so on. Lines they don't recognize are skipped.
+
+The functions named after the commands run nodetool on a node and parse the result, which is
+cached per node and command for ttl seconds so that polling loops and helpers asking for the
+same thing in a row don't run a nodetool JVM each time. Pass ttl=0 to always get fresh output.
+"""
+import re
+import threading
+import time
+
+from collections import OrderedDict, namedtuple
+
+CACHE_TTL = 2.0
+
+NodeStatus = namedtuple('NodeStatus', ['datacenter', 'status', 'state', 'address', 'load_bytes', 'tokens',
+                                       'owns', 'host_id', 'rack'])
+ThreadPoolStats = namedtuple('ThreadPoolStats', ['active', 'pending', 'completed', 'blocked', 'all_time_blocked'])
+TpStats = namedtuple('TpStats', ['pools', 'dropped'])
+TableStats = namedtuple('TableStats', ['keyspace', 'table', 'sstable_count', 'space_used_live', 'space_used_total',
+                                       'attributes'])
+MessagingPoolStats = namedtuple('MessagingPoolStats', ['active', 'pending', 'completed', 'dropped'])
+NetStats = namedtuple('NetStats', ['mode', 'streaming', 'read_repair', 'pools'])
+ActiveCompaction = namedtuple('ActiveCompaction', ['id', 'compaction_type', 'keyspace', 'table', 'completed',
+                                                   'total', 'unit', 'progress'])
+CompactionStats = namedtuple('CompactionStats', ['pending_tasks', 'pending_by_table', 'active'])
+DescribeCluster = namedtuple('DescribeCluster', ['name', 'snitch', 'partitioner', 'schema_versions'])
+GcStats = namedtuple('GcStats', ['interval_ms', 'max_gc_elapsed_ms', 'total_gc_elapsed_ms', 'stdev_gc_elapsed_ms',
+                                 'gc_reclaimed_mb', 'collections', 'direct_memory_bytes'])
+
+# 2.1 prints KB, MB..., 4.0 KiB, MiB...; both mean powers of 1024
+_SIZE_UNITS = {'bytes': 1, 'b': 1, 'kb': 1024, 'kib': 1024, 'mb': 1024 ** 2, 'mib': 1024 ** 2,
+               'gb': 1024 ** 3, 'gib': 1024 ** 3, 'tb': 1024 ** 4, 'tib': 1024 ** 4}
+_SIZE = re.compile(r'^(-?[\d.]+)\s*([a-zA-Z]*)$')
+_POOL_HEADER = re.compile(r'^Pool Name\s')
+
+
+def parse_size(value):
+    """
+    @param value A size the way nodetool prints it, either plain bytes or human readable, e.g. '12.5 KiB'
+    @return The size in bytes, None if value isn't a size (e.g. '?')
+    """
+    match = _SIZE.match(value.strip())
+    if match is None:
+        return None
+    number, unit = match.groups()
+    multiplier = _SIZE_UNITS.get(unit.lower(), 1 if not unit else None)
+    if multiplier is None:
+        return None
+    return float(number) * multiplier
+
+
+def _number(value):
+    """
+    @return value as an int or float, None when nodetool printed n/a or anything else that isn't a number
+    """
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+
+def parse_status(output):
+    """
+    @param output The output of nodetool status
+    @return A list of NodeStatus, one per node, in the order nodetool printed them
+    """
+    nodes = []
+    datacenter = None
+    token_per_node = False
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('Datacenter:'):
+            datacenter = line.split(':', 1)[1].strip()
+        elif line.startswith('--'):
+            # without vnodes the token itself is printed after the host id instead of a count before owns
+            token_per_node = re.search(r'\sTokens\s', line) is None
+        elif re.match(r'^[UD][NLJM]\s', line):
+            fields = line.split()
+            status_state, address = fields[0], fields[1]
+            if fields[2] == '?':
+                load_bytes, rest = None, fields[3:]
+            else:
+                load_bytes, rest = parse_size(' '.join(fields[2:4])), fields[4:]
+            if token_per_node:
+                owns, host_id, tokens, rack = rest[0], rest[1], 1, rest[3:]
+            else:
+                tokens, owns, host_id, rack = _number(rest[0]), rest[1], rest[2], rest[3:]
+            nodes.append(NodeStatus(datacenter=datacenter, status=status_state[0], state=status_state[1],
+                                    address=address, load_bytes=load_bytes, tokens=tokens,
+                                    owns=_number(owns.rstrip('%')), host_id=host_id, rack=' '.join(rack)))
+    return nodes
+
+
+def parse_tpstats(output):
+    """
+    @param output The output of nodetool tpstats
+    @return A TpStats with the ThreadPoolStats of each pool and the dropped count of each message type, by name
+    """
+    pools = OrderedDict()
+    dropped = OrderedDict()
+    section = None
+    for line in output.splitlines():
+        if _POOL_HEADER.match(line):
+            section = pools
+            continue
+        if line.startswith('Message type'):
+            section = dropped
+            continue
+        fields = line.split()
+        if section is pools and len(fields) == 6:
+            pools[fields[0]] = ThreadPoolStats(*(_number(field) for field in fields[1:]))
+        elif section is dropped and len(fields) >= 2 and _number(fields[1]) is not None:
+            # 4.0 follows the count with latencies, under a second line of percentiles that fails the check above
+            dropped[fields[0]] = _number(fields[1])
+    return TpStats(pools=pools, dropped=dropped)
+
+
+def parse_tablestats(output):
+    """
+    @param output The output of nodetool tablestats or cfstats
+    @return A list of TableStats, one per table in the output
+    """
+    tables = []
+    keyspace = None
+    attributes = None
+    for line in output.splitlines():
+        if ':' not in line:
+            continue
+        key, value = (part.strip() for part in line.split(':', 1))
+        if key == 'Keyspace':
+            keyspace, attributes = value, None
+        elif key in ('Table', 'Table (index)', 'Column Family'):
+            attributes = OrderedDict()
+            tables.append((keyspace, value, attributes))
+        elif attributes is not None:
+            attributes[key] = value
+
+    def size(attributes, key):
+        return parse_size(attributes[key]) if key in attributes else None
+
+    return [TableStats(keyspace=keyspace, table=table,
+                       sstable_count=_number(attributes.get('SSTable count', '')),
+                       space_used_live=size(attributes, 'Space used (live)'),
+                       space_used_total=size(attributes, 'Space used (total)'),
+                       attributes=attributes)
+            for keyspace, table, attributes in tables]
+
+
+def parse_netstats(output):
+    """
+    @param output The output of nodetool netstats
+    @return A NetStats. streaming tells whether any stream was in progress and pools has the MessagingPoolStats
+            of each messaging pool by name, whose dropped is None before 3.0 as it wasn't printed.
+    """
+    mode = None
+    streaming = True
+    read_repair = OrderedDict()
+    pools = OrderedDict()
+    section = None
+    for line in output.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('Mode:'):
+            mode = stripped.split(':', 1)[1].strip()
+        elif stripped == 'Not sending any streams.':
+            streaming = False
+        elif stripped.startswith('Read Repair Statistics'):
+            section = read_repair
+        elif _POOL_HEADER.match(stripped):
+            section = pools
+            has_dropped = stripped.split()[-1] == 'Dropped'
+        elif section is read_repair and ':' in stripped:
+            key, value = (part.strip() for part in stripped.split(':', 1))
+            read_repair[key] = _number(value)
+        elif section is pools and stripped:
+            # pool names have spaces in them, e.g. "Large messages"
+            width = 4 if has_dropped else 3
+            fields = stripped.split()
+            values = [_number(field) for field in fields[-width:]]
+            if not has_dropped:
+                values.append(None)
+            pools[' '.join(fields[:-width])] = MessagingPoolStats(*values)
+    return NetStats(mode=mode, streaming=streaming, read_repair=read_repair, pools=pools)
+
+
+def parse_compactionstats(output):
+    """
+    @param output The output of nodetool compactionstats
+    @return A CompactionStats. pending_by_table maps keyspace.table to its pending tasks, and is only filled in
+            by versions that print it.
+    """
+    pending_tasks = None
+    pending_by_table = OrderedDict()
+    active = []
+    has_id = None
+    for line in output.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('pending tasks:'):
+            pending_tasks = _number(stripped.split(':', 1)[1].strip())
+        elif stripped.startswith('- ') and ':' in stripped:
+            table, count = stripped[2:].rsplit(':', 1)
+            pending_by_table[table.strip()] = _number(count.strip())
+        elif 'compaction type' in stripped:
+            has_id = stripped.startswith('id ')
+        elif has_id is not None and stripped.endswith('%'):
+            # the compaction type can have spaces in it, e.g. "Anticompaction after repair", so parse from the right
+            fields = stripped.split()
+            id, compaction_type = (fields[0], fields[1:-6]) if has_id else (None, fields[:-6])
+            keyspace, table, completed, total, unit, progress = fields[-6:]
+            active.append(ActiveCompaction(id=id, compaction_type=' '.join(compaction_type), keyspace=keyspace,
+                                           table=table, completed=_number(completed), total=_number(total),
+                                           unit=unit, progress=_number(progress.rstrip('%'))))
+    return CompactionStats(pending_tasks=pending_tasks, pending_by_table=pending_by_table, active=active)
+
+
+def parse_gcstats(output):
+    """
+    @param output The output of nodetool gcstats
+    @return A GcStats, with NaN for the standard deviation when there was no collection
+    """
+    lines = [line for line in output.splitlines() if line.strip()]
+    if len(lines) < 2 or 'Interval' not in lines[0]:
+        raise ValueError("Unexpected output from nodetool gcstats:\n{}".format(output))
+    # the header runs the column names together, but the values are separated; later versions add more columns
+    values = [float(field) for field in lines[1].split()]
+    return GcStats(*values[:len(GcStats._fields)])
+
+
+def parse_describecluster(output):
+    """
+    @param output The output of nodetool describecluster
+    @return A DescribeCluster, whose schema_versions maps each schema version to the addresses of the nodes that
+            have it. Nodes that couldn't be asked are listed under UNREACHABLE.
+    """
+    properties = {}
+    schema_versions = OrderedDict()
+    section = None
+    for line in output.splitlines():
+        stripped = line.strip()
+        if stripped == 'Schema versions:':
+            section = schema_versions
+        elif section is schema_versions and stripped.endswith(']') and ':' in stripped:
+            version, addresses = stripped.split(':', 1)
+            # 4.0 adds the storage port to each address
+            schema_versions[version.strip()] = [address.strip() for address in addresses.strip(' []').split(',')
+                                                if address.strip()]
+        elif ':' in stripped and not stripped.endswith(':'):
+            section = None
+            key, value = (part.strip() for part in stripped.split(':', 1))
+            properties.setdefault(key, value)
+        elif stripped:
+            # the header of another section, e.g. 4.0's "Database versions:"
+            section = None
+    return DescribeCluster(name=properties.get('Name'), snitch=properties.get('Snitch'),
+                           partitioner=properties.get('Partitioner'), schema_versions=schema_versions)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _run(node, command, parse, ttl):
+    key = (node.get_path(), command)
+    now = time.time()
+    if ttl > 0:
+        with _cache_lock:
+            cached = _cache.get(key)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+    stdout, _, _ = node.nodetool(command)
+    result = parse(stdout)
+    with _cache_lock:
+        _cache[key] = (now, result)
+    return result
+
+
+def status(node, keyspace=None, ttl=CACHE_TTL):
+    command = 'status' if keyspace is None else 'status {}'.format(keyspace)
+    return _run(node, command, parse_status, ttl)
+
+
+def tpstats(node, ttl=CACHE_TTL):
+    return _run(node, 'tpstats', parse_tpstats, ttl)
+
+
+def tablestats(node, keyspace, table, ttl=CACHE_TTL):
+    """
+    @return The TableStats of keyspace.table. cfstats is used, which 4.0 still accepts.
+    """
+    [stats] = _run(node, 'cfstats {}.{}'.format(keyspace, table), parse_tablestats, ttl)
+    return stats
+
+
+def netstats(node, ttl=CACHE_TTL):
+    return _run(node, 'netstats', parse_netstats, ttl)
+
+
+def compactionstats(node, ttl=CACHE_TTL):
+    return _run(node, 'compactionstats', parse_compactionstats, ttl)
+
+
+def gcstats(node, ttl=CACHE_TTL):
+    return _run(node, 'gcstats', parse_gcstats, ttl)
+
+
+def describecluster(node, ttl=CACHE_TTL):
+    return _run(node, 'describecluster', parse_describecluster, ttl)
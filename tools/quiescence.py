@@ -0,0 +1,135 @@
+"""
+Waiting for the nodes of a cluster to go idle.
+
+Tests used to sleep for a fixed time before asserting, hoping the cluster was done with whatever
+the last statements set off: too long on a fast machine, not long enough on a slow one.
+wait_for_quiescence polls the nodes instead and returns as soon as they are idle, meaning that
+- no thread pool has active or pending tasks, which covers flushes, compactions, hint delivery
+  and the like,
+- no compaction is running,
+- no node holds hints for a node that is up (hints for nodes that are down never drain),
+- the batchlogs are empty, when given a way to count them,
+- the nodes of each release agree on the schema. Nodes of different releases are left alone,
+  as their schema versions differ for as long as the cluster is being upgraded.
+The checks go from cheapest to most expensive, and a poll stops at the first one that fails.
+"""
+import logging
+import os
+import re
+import time
+
+from cassandra import DriverException
+from cassandra.cluster import NoHostAvailable
+from ccmlib.node import ToolError
+
+from tools.nodetool_parsers import parse_compactionstats, parse_describecluster, parse_status, parse_tpstats
+from tools.readiness import backoff_delays, sleep_until_next_attempt
+
+logger = logging.getLogger(__name__)
+
+HINTS_FILE = re.compile(r'^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})-\d+-\d+\.hints$')
+UNREACHABLE = 'UNREACHABLE'
+
+
+def _nodetool(node, cmd):
+    return node.nodetool(cmd)
+
+
+def hint_targets(node):
+    """
+    @return The host ids of the nodes node has hints for. Only 3.0 and later keep hints in files.
+    """
+    try:
+        files = os.listdir(os.path.join(node.get_path(), 'hints'))
+    except OSError:
+        return set()
+    return {match.group(1) for match in map(HINTS_FILE.match, files) if match is not None}
+
+
+def schema_disagreements(nodes, describecluster):
+    """
+    @param describecluster The DescribeCluster of one of nodes
+    @return The releases whose nodes don't all have the same schema version, mapped to the versions they have
+    """
+    schema_version_of = {}
+    for version, addresses in describecluster.schema_versions.items():
+        if version != UNREACHABLE:
+            for address in addresses:
+                # drop the storage port 4.0 adds
+                schema_version_of[address.rsplit(':', 1)[0] if address.count(':') == 1 else address] = version
+
+    schema_versions_by_release = {}
+    for node in nodes:
+        schema_version = schema_version_of.get(node.address())
+        if schema_version is not None:
+            schema_versions_by_release.setdefault(str(node.get_cassandra_version()), set()).add(schema_version)
+    return {release: versions for release, versions in schema_versions_by_release.items() if len(versions) > 1}
+
+
+def busy_reason(nodes, nodetool=_nodetool, count_batches=None):
+    """
+    @param nodes The running nodes to check
+    @param nodetool Function running a nodetool command on a node, returning stdout, stderr and the return code
+    @param count_batches Function returning how many batches are in the batchlog of a node, None to not check them
+    @return Why nodes aren't idle, None if they are
+    """
+    for node in nodes:
+        pools = parse_tpstats(nodetool(node, 'tpstats')[0]).pools
+        busy = [name for name, pool in pools.items() if pool.active or pool.pending]
+        if busy:
+            return "{} has active or pending tasks in {}".format(node.name, ', '.join(busy))
+
+    for node in nodes:
+        # the estimated pending tasks aren't waited for, they never drain when autocompaction is disabled
+        active = parse_compactionstats(nodetool(node, 'compactionstats')[0]).active
+        if active:
+            return "{} is running {} compactions".format(node.name, len(active))
+
+    targets = {node.name: hint_targets(node) for node in nodes}
+    if any(targets.values()):
+        live_host_ids = {status.host_id for status in parse_status(nodetool(nodes[0], 'status')[0])
+                         if status.status == 'U'}
+        for node in nodes:
+            if targets[node.name] & live_host_ids:
+                return "{} has hints for nodes that are up".format(node.name)
+
+    if count_batches is not None:
+        for node in nodes:
+            batches = count_batches(node)
+            if batches:
+                return "{} has {} batches in its batchlog".format(node.name, batches)
+
+    disagreements = schema_disagreements(nodes, parse_describecluster(nodetool(nodes[0], 'describecluster')[0]))
+    if disagreements:
+        return "nodes disagree on the schema: {}".format(disagreements)
+    return None
+
+
+def wait_for_quiescence(nodes, timeout=60, nodetool=_nodetool, count_batches=None):
+    """
+    Waits for the running nodes among nodes to be idle.
+    @param nodes The nodes to wait for
+    @param timeout Seconds to wait at most
+    @param nodetool Function running a nodetool command on a node, returning stdout, stderr and the return code
+    @param count_batches Function returning how many batches are in the batchlog of a node, None to not check them
+    @return True as soon as the nodes are idle, False if they still weren't after timeout
+    """
+    start = time.time()
+    deadline = start + timeout
+    delays = backoff_delays(initial=0.1)
+    while True:
+        running = [node for node in nodes if node.is_running()]
+        if not running:
+            return True
+        try:
+            reason = busy_reason(running, nodetool, count_batches)
+        except (ToolError, NoHostAvailable, DriverException) as e:
+            # e.g. a node going down meanwhile, or too busy to count its batches in time
+            reason = "checking the nodes failed: {!r}".format(e)
+        if reason is None:
+            logger.debug("Nodes idle after {:.1f}s".format(time.time() - start))
+            return True
+        if time.time() >= deadline:
+            logger.debug("Nodes still not idle after {}s: {}".format(timeout, reason))
+            return False
+        sleep_until_next_attempt(delays, deadline)
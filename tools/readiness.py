@@ -0,0 +1,76 @@
+"""
+Cheap checks for whether a node is ready to be talked to.
+
+Connecting a driver to a node that isn't listening for CQL clients yet costs a full driver
+cluster setup (and its control connection errors) per attempt. wait_for_native_transport only
+opens a plain TCP connection to the native transport port until it's accepted, backing off
+exponentially with jitter so that many waiters don't probe in lockstep.
+"""
+import logging
+import random
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+INITIAL_DELAY = 0.05
+MAX_DELAY = 1.0
+
+
+def backoff_delays(initial=INITIAL_DELAY, maximum=MAX_DELAY):
+    """
+    @return An endless iterator of sleep times that double from initial up to maximum, each
+            randomly shortened by up to half
+    """
+    delay = initial
+    while True:
+        yield delay * random.uniform(0.5, 1.0)
+        delay = min(delay * 2, maximum)
+
+
+def sleep_until_next_attempt(delays, deadline):
+    """
+    Sleeps for the next of delays, but not past deadline.
+    """
+    time.sleep(max(0, min(next(delays), deadline - time.time())))
+
+
+def native_transport_address(node, port=None):
+    address, binary_port = node.network_interfaces['binary']
+    return address, port or binary_port
+
+
+def native_transport_accepting(node, port=None, connect_timeout=1.0):
+    """
+    @return True if the native transport port of node accepts TCP connections
+    """
+    try:
+        socket.create_connection(native_transport_address(node, port), timeout=connect_timeout).close()
+        return True
+    except (OSError, socket.timeout):
+        return False
+
+
+def wait_for_native_transport(node, timeout=30, port=None):
+    """
+    Waits for the native transport port of node to accept TCP connections.
+
+    This doesn't prove that the node is ready for every query (e.g. authentication may still be
+    setting up), so callers still retry their first request, but it avoids building driver sessions
+    against a port nobody is listening on.
+
+    @return True if the port accepted a connection within timeout, False otherwise
+    """
+    if not node.network_interfaces.get('binary'):
+        # nothing to probe, leave it to the caller's retries
+        return True
+
+    deadline = time.time() + timeout
+    delays = backoff_delays()
+    while True:
+        if native_transport_accepting(node, port):
+            return True
+        if time.time() >= deadline:
+            logger.debug("Native transport of {} not accepting connections after {}s".format(node.name, timeout))
+            return False
+        sleep_until_next_attempt(delays, deadline)
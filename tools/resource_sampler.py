@@ -0,0 +1,186 @@
+"""
+Sampling of the resources the nodes of a test's cluster use.
+
+ResourceSampler reads the CPU time, resident memory, disk I/O, open file descriptors and threads
+of every running node on a background thread at a fixed interval. Samples are kept per node in
+arrays of doubles, one per field, so long tests don't pile up Python objects. When the test is
+over each node gets its time series as CSV and a JSON summary in its log directory, which are
+saved along with its logs.
+"""
+import csv
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_FILE = 'resource_samples.csv'
+SUMMARY_FILE = 'resource_summary.json'
+FIELDS = ('time', 'pid', 'cpu_seconds', 'rss_bytes', 'read_bytes', 'write_bytes', 'open_files', 'threads')
+# counters that start over when a node restarts
+CUMULATIVE_FIELDS = ('cpu_seconds', 'read_bytes', 'write_bytes')
+NAN = float('nan')
+
+
+def _io_counters(process):
+    try:
+        io = process.io_counters()
+        return io.read_bytes, io.write_bytes
+    except (AttributeError, psutil.AccessDenied):
+        # not available on macOS
+        return NAN, NAN
+
+
+def _open_files(process):
+    try:
+        return process.num_fds()
+    except AttributeError:
+        # Windows
+        return process.num_handles()
+
+
+def sample_process(process):
+    """
+    @return The values of every field but time and pid for process, NaN when the platform doesn't have them
+    """
+    with process.oneshot():
+        cpu_times = process.cpu_times()
+        read_bytes, write_bytes = _io_counters(process)
+        return (cpu_times.user + cpu_times.system, process.memory_info().rss, read_bytes, write_bytes,
+                _open_files(process), process.num_threads())
+
+
+class NodeSamples(object):
+    """
+    The samples of one node, one array per field of FIELDS
+    """
+
+    def __init__(self):
+        self.columns = OrderedDict((field, array('d')) for field in FIELDS)
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def append(self, values):
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+
+    def _total(self, field):
+        """
+        @return How much a cumulative counter grew over all samples, adding up the processes of a restarted node
+        """
+        total = 0.0
+        column = self.columns[field]
+        pids = self.columns['pid']
+        for i in range(1, len(column)):
+            if pids[i] != pids[i - 1]:
+                # the new process started after the previous sample
+                total += column[i]
+            else:
+                total += column[i] - column[i - 1]
+        return total
+
+    def summary(self):
+        """
+        @return A dict summarizing the samples
+        """
+        times = self.columns['time']
+        duration = times[-1] - times[0] if len(self) > 1 else 0.0
+        summary = OrderedDict([('samples', len(self)), ('duration_seconds', round(duration, 3))])
+        for field in CUMULATIVE_FIELDS:
+            summary[field] = self._total(field)
+        summary['cpu_percent'] = 100.0 * summary['cpu_seconds'] / duration if duration > 0 else 0.0
+        summary['max_rss_bytes'] = max(self.columns['rss_bytes'], default=0.0)
+        summary['mean_rss_bytes'] = sum(self.columns['rss_bytes']) / len(self) if len(self) > 0 else 0.0
+        for field in ('open_files', 'threads'):
+            summary['max_' + field] = max(self.columns[field], default=0.0)
+        # NaN isn't valid JSON
+        return OrderedDict((k, None if isinstance(v, float) and math.isnan(v) else v) for k, v in summary.items())
+
+    def write(self, samples_path, summary_path):
+        with open(samples_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for row in zip(*self.columns.values()):
+                writer.writerow([int(value) if value.is_integer() else value for value in row])
+        with open(summary_path, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+
+
+class ResourceSampler(object):
+    """
+    Samples the resources of the running nodes returned by get_nodes every interval seconds on a background thread.
+    """
+
+    def __init__(self, get_nodes, interval):
+        """
+        @param get_nodes Function returning the nodes to sample, called for every sample as nodes come and go
+        @param interval Seconds between samples
+        """
+        self.get_nodes = get_nodes
+        self.interval = interval
+        # node name -> NodeSamples
+        self.samples = OrderedDict()
+        self._processes = {}
+        self._stop_requested = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def _process(self, pid):
+        process = self._processes.get(pid)
+        if process is None:
+            process = self._processes[pid] = psutil.Process(pid)
+        return process
+
+    def sample(self):
+        """
+        Takes one sample of every running node.
+        """
+        now = time.time()
+        for node in list(self.get_nodes()):
+            pid = node.pid
+            if pid is None:
+                continue
+            try:
+                values = sample_process(self._process(pid))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                # the node is down, and its pid may belong to someone else by now
+                self._processes.pop(pid, None)
+                continue
+            self.samples.setdefault(node.name, NodeSamples()).append((now, pid) + values)
+
+    def _run(self):
+        while not self._stop_requested.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.debug("Unable to sample node resources: {}".format(e))
+
+    def stop(self):
+        self._stop_requested.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def write(self, nodes):
+        """
+        Writes the samples and summary of each of nodes to its log directory.
+        """
+        for node in nodes:
+            node_samples = self.samples.get(node.name)
+            if node_samples is None:
+                continue
+            log_dir = os.path.join(node.get_path(), 'logs')
+            if not os.path.isdir(log_dir):
+                continue
+            node_samples.write(os.path.join(log_dir, SAMPLES_FILE), os.path.join(log_dir, SUMMARY_FILE))
@@ -0,0 +1,114 @@
+"""
+Reuse of driver sessions within a test.
+
+Building a driver Cluster and connecting it to every node is one of the most expensive things
+tests do, and some helpers open a new connection inside polling loops. Helpers that are done with
+their session when they return can hand it back to a SessionCache, which gives it to the next one
+asking for a connection with identical parameters to the same node process, after resetting the
+session settings tests commonly change. Sessions that weren't handed back are never reused, as
+whoever holds them may still be using them.
+"""
+import logging
+
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+
+logger = logging.getLogger(__name__)
+
+# session and default execution profile settings that are put back to how they were when the
+# session was created before it is handed out again
+SESSION_SETTINGS = ('default_fetch_size',)
+PROFILE_SETTINGS = ('consistency_level', 'serial_consistency_level', 'request_timeout', 'row_factory')
+
+
+def session_cache_key(node, keyspace, user, password, compression, protocol_version, port, ssl_opts,
+                      exclusive, profile_kwargs):
+    """
+    @return The key of a session created with the given connection parameters. It includes the pid of
+            the node, so sessions connected to a node that was restarted since are never reused.
+    """
+    return (node.name, node.pid, keyspace, user, password, compression, protocol_version, port,
+            repr(ssl_opts), exclusive, repr(sorted(profile_kwargs.items(), key=lambda item: item[0])))
+
+
+class _CachedSession(object):
+
+    def __init__(self, node, session):
+        self.node = node
+        self.session = session
+        self.keyspace = session.keyspace
+        self.session_settings = {name: getattr(session, name) for name in SESSION_SETTINGS}
+        profile = session.get_execution_profile(EXEC_PROFILE_DEFAULT)
+        self.profile_settings = {name: getattr(profile, name) for name in PROFILE_SETTINGS}
+
+    def usable(self, pid):
+        if self.session.is_shutdown or self.session.cluster.is_shutdown:
+            return False
+        return self.node.is_running() and self.node.pid == pid
+
+    def reset(self):
+        if self.session.keyspace != self.keyspace:
+            if self.keyspace is None:
+                # there is no way back to a session without keyspace
+                return False
+            self.session.set_keyspace(self.keyspace)
+        for name, value in self.session_settings.items():
+            setattr(self.session, name, value)
+        profile = self.session.get_execution_profile(EXEC_PROFILE_DEFAULT)
+        for name, value in self.profile_settings.items():
+            setattr(profile, name, value)
+        return True
+
+
+class SessionCache(object):
+    """
+    Idle driver sessions by session_cache_key. The sessions remain owned by whoever created them:
+    dropping a session from the cache, or clearing the cache, doesn't shut it down.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        # key -> list of _CachedSession that were released
+        self._idle = {}
+        # id of a session handed out -> (key, _CachedSession)
+        self._lent = {}
+
+    def get(self, key):
+        """
+        @return A released session for key, ready to be used as if it was just created, or None. It is
+                the caller's until it is released again.
+        """
+        if not self.enabled:
+            return None
+        idle = self._idle.get(key, [])
+        while idle:
+            cached = idle.pop()
+            try:
+                if cached.usable(key[1]) and cached.reset():
+                    self._lent[id(cached.session)] = (key, cached)
+                    return cached.session
+            except Exception as e:
+                logger.debug("Not reusing driver session to {}: {}".format(key[0], e))
+        return None
+
+    def put(self, key, node, session):
+        """
+        Registers a session just created for key, to be reused once it is released.
+        """
+        if self.enabled:
+            self._lent[id(session)] = (key, _CachedSession(node, session))
+
+    def release(self, session):
+        """
+        Hands back a session got from get() or registered with put(), once its user is done with it.
+        @return True if the session is kept for reuse, False if the cache doesn't know about it
+        """
+        entry = self._lent.pop(id(session), None)
+        if entry is None:
+            return False
+        key, cached = entry
+        self._idle.setdefault(key, []).append(cached)
+        return True
+
+    def clear(self):
+        self._idle = {}
+        self._lent = {}
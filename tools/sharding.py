@@ -0,0 +1,130 @@
+"""
+Duration aware splitting of the selected tests into shards.
+
+DurationHistory keeps how long each test took (setup, call and teardown together) in earlier runs,
+and whether it is resource_intensive. plan_shards uses those durations to split tests into shards
+of similar total duration, assigning the longest tests first to whichever shard has the least work
+so far (longest processing time first), and orders each shard so its longest resource_intensive
+tests start first.
+
+Every shard has to plan from the same history, or shards would disagree on which tests are theirs.
+So a run never writes to the history it plans from: DurationRecorder writes the durations of the
+run to a file of its own, and those files are merged into the history once all shards are done:
+
+    python -m tools.sharding HISTORY_FILE RECORDED_FILE [RECORDED_FILE ...]
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# assumed duration of tests that never ran with a history, when there is no history at all
+DEFAULT_DURATION = 60.0
+
+
+class DurationHistory(object):
+    """
+    A JSON file mapping test node ids to {"duration": seconds, "resource_intensive": bool}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tests = _load(path)
+
+    def duration(self, nodeid):
+        """
+        @return The recorded duration of the test, or None if it never ran with this history
+        """
+        entry = self.tests.get(nodeid)
+        return entry['duration'] if entry is not None else None
+
+    def merge(self, tests):
+        """
+        Replaces the durations of tests, as read from a file DurationRecorder wrote, and saves the history.
+        """
+        self.tests.update(tests)
+        _dump(self.tests, self.path)
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        logger.debug("No usable test durations in {}: {}".format(path, e))
+        return {}
+
+
+def _dump(tests, path):
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(tests, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class DurationRecorder(object):
+    """
+    pytest plugin writing the duration of every test that ran to a file, in the format of a DurationHistory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tests = {}
+
+    def pytest_runtest_logreport(self, report):
+        entry = self.tests.setdefault(report.nodeid, {'duration': 0.0,
+                                                      'resource_intensive': 'resource_intensive' in report.keywords})
+        entry['duration'] += report.duration
+
+    def pytest_sessionfinish(self, session):
+        if self.tests:
+            _dump({nodeid: dict(entry, duration=round(entry['duration'], 3)) for nodeid, entry in self.tests.items()},
+                  self.path)
+
+
+def merge_durations(history_path, recorded_paths):
+    """
+    Merges the durations DurationRecorder wrote to recorded_paths into the history in history_path.
+    Files recorded later win for tests that ran in several of them.
+    """
+    history = DurationHistory(history_path)
+    for path in recorded_paths:
+        history.merge(_load(path))
+
+
+def plan_shards(tests, shard_count):
+    """
+    @param tests List of (test, duration or None if unknown, whether the test is resource_intensive)
+    @param shard_count Number of shards to split the tests into
+    @return A list of shard_count lists of tests, each in the order it should run in
+    """
+    known_durations = sorted(duration for _, duration, _ in tests if duration is not None)
+    # unknown tests are assumed to be typical ones
+    default_duration = known_durations[len(known_durations) // 2] if known_durations else DEFAULT_DURATION
+
+    # longest first; sorted() is stable, so tests of equal duration keep their collection order
+    by_duration = sorted(((test, default_duration if duration is None else duration, resource_intensive)
+                          for test, duration, resource_intensive in tests),
+                         key=lambda t: t[1], reverse=True)
+
+    shards = [[] for _ in range(shard_count)]
+    loads = [(0.0, index) for index in range(shard_count)]
+    for test, duration, resource_intensive in by_duration:
+        load, index = heapq.heappop(loads)
+        shards[index].append((test, resource_intensive))
+        heapq.heappush(loads, (load + duration, index))
+
+    # within a shard tests are still longest first, only moving resource_intensive ones to the front
+    return [[test for test, resource_intensive in sorted(shard, key=lambda t: not t[1])] for shard in shards]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge the test durations recorded with --test-durations-output "
+                                                 "into a --test-durations-file")
+    parser.add_argument('history_file')
+    parser.add_argument('recorded_files', nargs='+')
+    args = parser.parse_args()
+    merge_durations(args.history_file, args.recorded_files)
@@ -0,0 +1,132 @@
+"""
+Memoized resolution of Cassandra version specs.
+
+ccm's repository.setup() resolves a version spec (e.g. '3.11.4', 'binary:3.11.4' or
+'github:apache/cassandra-3.11') to a directory holding that version, fetching or updating it
+with git or from the network as needed, and get_version_from_build() then parses its build.xml.
+Upgrade tests need this for two versions per test, so resolutions are cached for the whole
+process and persisted next to ccm's repository cache. An entry is only used as long as the
+build.xml it was read from hasn't changed, e.g. because another process updated the checkout.
+Releases never change otherwise, so they are cached for good. Specs naming a git branch are
+resolved again once BRANCH_REF_TTL has passed, so commits pushed to the branch meanwhile are
+only picked up after up to an hour.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from distutils.version import LooseVersion
+
+import ccmlib.repository
+from ccmlib.common import get_default_path, get_version_from_build
+
+logger = logging.getLogger(__name__)
+
+BRANCH_REF_TTL = 60 * 60
+BRANCH_REF_PREFIXES = ('git:', 'github:', 'local:', 'alias:')
+
+_lock = threading.Lock()
+# version spec -> lock held while that spec is being resolved
+_spec_locks = {}
+# version spec -> {'install_dir': ..., 'version': ..., 'build_xml_mtime': ..., 'resolved_at': ...}
+_resolved = None
+# (install dir, build.xml mtime) -> LooseVersion
+_build_versions = {}
+
+
+def _cache_file():
+    return os.path.join(get_default_path(), 'dtest_version_cache.json')
+
+
+def _load():
+    try:
+        with open(_cache_file()) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _save(spec, entry):
+    # merge with what other processes saved since this one loaded the file
+    resolved = _load()
+    resolved[spec] = entry
+    tmp_path = '{}.{}.tmp'.format(_cache_file(), os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(resolved, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, _cache_file())
+    except (IOError, OSError) as e:
+        logger.debug("Unable to persist resolved version of {}: {}".format(spec, e))
+
+
+def _build_xml_mtime(install_dir):
+    build_xml = os.path.join(install_dir, 'build.xml')
+    return os.path.getmtime(build_xml) if os.path.exists(build_xml) else None
+
+
+def build_mtimes(install_dir):
+    """
+    @return The modification times of the build.xml and the Cassandra jars of install_dir, which change
+            whenever the build is rebuilt in place, unlike its directory and version
+    """
+    jars = [jar for jars_dir in ('build', 'lib')
+            for jar in glob.glob(os.path.join(install_dir, jars_dir, 'apache-cassandra-*.jar'))]
+    return [_build_xml_mtime(install_dir)] + sorted(os.path.getmtime(jar) for jar in jars)
+
+
+def _is_fresh(spec, entry):
+    if not os.path.isdir(entry['install_dir']):
+        return False
+    if entry.get('build_xml_mtime') != _build_xml_mtime(entry['install_dir']):
+        return False
+    if spec.startswith(BRANCH_REF_PREFIXES):
+        return time.time() - entry['resolved_at'] < BRANCH_REF_TTL
+    return True
+
+
+def version_from_build(install_dir):
+    """
+    Same as ccm's get_version_from_build(install_dir), memoized as long as build.xml doesn't change.
+    """
+    if install_dir is None:
+        return get_version_from_build(install_dir)
+    key = (install_dir, _build_xml_mtime(install_dir))
+    with _lock:
+        version = _build_versions.get(key)
+    if version is None:
+        version = get_version_from_build(install_dir)
+        with _lock:
+            _build_versions[key] = version
+    return version
+
+
+def resolve_version(version_spec):
+    """
+    @param version_spec A version as accepted by ccm, e.g. '3.11.4' or 'github:apache/cassandra-3.11'
+    @return A tuple of the directory holding that version (as returned by ccm's repository.setup)
+            and its version from build.xml, as a LooseVersion
+    """
+    global _resolved
+    with _lock:
+        if _resolved is None:
+            _resolved = _load()
+        spec_lock = _spec_locks.setdefault(version_spec, threading.Lock())
+
+    # concurrent callers wait for a single resolution of the same spec
+    with spec_lock:
+        with _lock:
+            entry = _resolved.get(version_spec)
+        if entry is not None and _is_fresh(version_spec, entry):
+            return entry['install_dir'], LooseVersion(entry['version'])
+
+        install_dir, _ = ccmlib.repository.setup(version_spec)
+        version = version_from_build(install_dir)
+        entry = {'install_dir': install_dir, 'version': version.vstring,
+                 'build_xml_mtime': _build_xml_mtime(install_dir), 'resolved_at': time.time()}
+        with _lock:
+            _resolved[version_spec] = entry
+        _save(version_spec, entry)
+        return install_dir, version
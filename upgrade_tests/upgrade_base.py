@@ -106,8 +106,8 @@ class UpgradeTester(Tester, metaclass=ABCMeta):
 
         cluster.populate(nodes)
         node1 = cluster.nodelist()[0]
-        self.fixture_dtest_setup.enable_for_jolokia = kwargs.pop('jolokia', False)
-        if self.fixture_dtest_setup.enable_for_jolokia:
+        if kwargs.pop('jolokia', False):
+            self.fixture_dtest_setup.enable_for_jolokia = True
             remove_perf_disable_shared_mem(node1)
 
         cluster.start(wait_for_binary_proto=True)
@@ -203,13 +203,18 @@ class UpgradeTester(Tester, metaclass=ABCMeta):
         else:
             sessions_and_meta.append((False, session))
 
-        # Let the nodes settle briefly before yielding connections in turn (on the upgraded and non-upgraded alike)
+        # Let the nodes settle before yielding connections in turn (on the upgraded and non-upgraded alike)
         # CASSANDRA-11396 was the impetus for this change, wherein some apparent perf noise was preventing
         # CL.ALL from being reached. The newly upgraded node needs to settle because it has just barely started, and each
         # non-upgraded node needs a chance to settle as well, because the entire cluster (or isolated nodes) may have been doing resource intensive activities
         # immediately before.
+        # Polling for quiescence only beats the fixed wait when it doesn't launch nodetool JVMs, and the batchlogs
+        # would take a session per node and poll, which costs more than the wait saves.
         for s in sessions_and_meta:
-            time.sleep(5)
+            if self.jolokia_agents_running():
+                self.wait_for_quiescence(timeout=30, check_batchlog=False)
+            else:
+                time.sleep(5)
             yield s
 
     def get_version(self):
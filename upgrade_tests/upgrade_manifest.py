@@ -4,11 +4,10 @@ from collections import namedtuple
 
 from dtest import RUN_STATIC_UPGRADE_MATRIX
 
-import ccmlib.repository
-from ccmlib.common import get_version_from_build
-
 from enum import Enum
 
+from tools.versions import resolve_version, version_from_build
+
 logger = logging.getLogger(__name__)
 
 # UpgradePath's contain data about upgrade paths we wish to test
@@ -66,10 +65,9 @@ def set_version_family():
     # Prefer CASSANDRA_VERSION if it's set in the environment. If not, use CASSANDRA_DIR
     if cassandra_version_slug:
         # fetch but don't build the specified C* version
-        ccm_repo_cache_dir, _ = ccmlib.repository.setup(cassandra_version_slug)
-        current_version = get_version_from_build(ccm_repo_cache_dir)
+        _, current_version = resolve_version(cassandra_version_slug)
     else:
-        current_version = get_version_from_build(cassandra_dir)
+        current_version = version_from_build(cassandra_dir)
 
     if current_version.vstring.startswith('2.0'):
         version_family = '2.0.x'